@@ -0,0 +1,194 @@
+# Portfolio allocation across the day's candidates
+#
+# Turns a per-name edge score and a covariance estimate into weights (fractions
+# of the funds, long only, each at most max_weight, summing to at most 1):
+#   risk_parity    risk budgets proportional to the scores, fully invested up
+#                  to the max_weight caps (the rest stays in cash);
+#                  Newton's method on min 1/2 y'Sy - sum(b * log y), w = y / sum(y)
+#   mean_variance  max mu'w - risk_aversion/2 w'Sw, i.e. S w = mu / risk_aversion
+#   kelly          fractional Kelly, S w = fraction * mu (mean-variance with
+#                  risk_aversion = 1 / fraction)
+# The last two solve the linear system on the free names and move names that
+# go negative (to 0) or over the cap (to max_weight) out of it until none do;
+# a book that would need leverage is scaled down to fully invested.
+#
+# Expected returns follow the "alpha = IC x volatility x score" rule: a score
+# in [0, 1] from the technical signal (signal_score()) times the name's daily
+# volatility and an information coefficient. The covariance comes from the
+# cached daily closes, shrunk towards its diagonal; names without enough
+# history get the median variance and no correlation. Everything is a few
+# numpy solves, a few milliseconds for hundreds of names.
+
+from live_config import ALLOCATION_METHODS as METHODS, current as current_config
+from trade_plan import Signal
+
+
+def signal_score(overall, confidence):
+    """Buy conviction in [0, 1]: the confidence of a buy, 1 - that of a sell, 0.5 when neutral"""
+    if overall in (Signal.STRONG_BUY, Signal.BUY):
+        return confidence
+    if overall in (Signal.STRONG_SELL, Signal.SELL):
+        return 1 - confidence
+    return 0.5
+
+
+def covariance(closes, lookback=60, shrinkage=0.2, min_sessions=10):
+    """
+    Daily return covariance of the columns of a sessions x names close array
+    (NaN where missing) over the last `lookback` returns, shrunk towards the
+    diagonal. Names with fewer than `min_sessions` returns, or no variance
+    at all (constant closes, e.g. a halted ticker), get the median variance
+    and zero covariance.
+    """
+    import numpy as np
+    closes = np.asarray(closes, dtype=float)[-(lookback + 1):]
+    n = closes.shape[1]
+    with np.errstate(divide='ignore', invalid='ignore'):
+        returns = closes[1:] / closes[:-1] - 1
+    valid = np.isfinite(returns)
+    counts = valid.sum(axis=0)
+    means = np.where(counts > 0, np.where(valid, returns, 0).sum(axis=0) / np.maximum(counts, 1), 0)
+    demeaned = np.where(valid, returns - means, 0)
+    pairs = valid.T.astype(float) @ valid.astype(float)
+    cov = (demeaned.T @ demeaned) / np.maximum(pairs - 1, 1)
+    variance = np.diag(cov).copy()
+    known = (counts >= min_sessions) & np.isfinite(variance) & (variance > 0)
+    fallback = np.median(variance[known]) if known.any() else 0.02 ** 2
+    variance[~known] = fallback
+    cov[~known, :] = 0
+    cov[:, ~known] = 0
+    cov = (1 - shrinkage) * cov
+    cov[np.diag_indices(n)] = variance
+    return cov
+
+
+def range_covariance(high, low, open_):
+    """Diagonal covariance from one session's high-low range (when there is no close history)"""
+    import numpy as np
+    spread = (np.asarray(high, dtype=float) - np.asarray(low, dtype=float)) / np.asarray(open_, dtype=float)
+    spread = np.where(np.isfinite(spread) & (spread > 0), spread, 0.02)
+    return np.diag(spread ** 2)
+
+
+def _ridge(cov, scale=1e-8):
+    """cov plus a tiny multiple of its mean variance on the diagonal, so solves never hit a singular matrix"""
+    import numpy as np
+    level = np.trace(cov) / len(cov)
+    return cov + np.eye(len(cov)) * scale * (level if level > 0 else 0.02 ** 2)
+
+
+def _cap(weights, max_weight, total=1.0):
+    """Clip to max_weight and hand the excess to the uncapped names pro rata, keeping the total"""
+    import numpy as np
+    weights = weights * (total / weights.sum())
+    capped = np.zeros(len(weights), dtype=bool)
+    while True:
+        over = ~capped & (weights > max_weight)
+        if not over.any():
+            return weights
+        capped |= over
+        free = ~capped
+        weights[capped] = max_weight
+        room = total - max_weight * capped.sum()
+        if not free.any() or room <= 0:
+            return np.minimum(weights, max_weight)
+        weights[free] *= room / weights[free].sum()
+
+
+def risk_parity(cov, budgets=None, max_weight=1.0, tol=1e-10, max_iter=50):
+    """
+    Long-only weights whose risk contributions are proportional to budgets,
+    fully invested unless n * max_weight < 1 (the remainder stays in cash)
+    """
+    import numpy as np
+    n = len(cov)
+    if n == 0:
+        return np.zeros(0)
+    b = np.full(n, 1.0 / n) if budgets is None else np.asarray(budgets, dtype=float)
+    b = np.maximum(b, 1e-12)
+    b = b / b.sum()
+    cov = _ridge(cov)
+    y = np.sqrt(b / np.diag(cov))
+    for _ in range(max_iter):
+        gradient = cov @ y - b / y
+        step = np.linalg.solve(cov + np.diag(b / y ** 2), gradient)
+        scale = 1.0
+        while np.any(y - scale * step <= 0):
+            scale /= 2
+        y = y - scale * step
+        if np.abs(gradient).max() < tol:
+            break
+    return _cap(y / y.sum(), max_weight, total=min(1.0, max_weight * n))
+
+
+def _capped_solve(mu, cov, scale, max_weight):
+    """Active-set solve of cov w = scale * mu with 0 <= w <= max_weight and sum(w) <= 1"""
+    import numpy as np
+    n = len(mu)
+    cov = _ridge(cov)
+    free = mu > 0
+    capped = np.zeros(n, dtype=bool)
+    weights = np.zeros(n)
+    while free.any():
+        weights = np.where(capped, max_weight, 0.0)
+        rhs = scale * mu[free] - cov[np.ix_(free, capped)] @ weights[capped]
+        weights[free] = np.linalg.solve(cov[np.ix_(free, free)], rhs)
+        below = free & (weights < 0)
+        over = free & (weights > max_weight)
+        if not (below.any() or over.any()):
+            break
+        free &= ~(below | over)
+        capped |= over
+    weights = np.clip(np.where(capped, max_weight, weights), 0, max_weight)
+    total = weights.sum()
+    return weights / total if total > 1 else weights
+
+
+def mean_variance(mu, cov, risk_aversion=5.0, max_weight=1.0):
+    import numpy as np
+    return _capped_solve(np.asarray(mu, dtype=float), cov, 1.0 / risk_aversion, max_weight)
+
+
+def fractional_kelly(mu, cov, fraction=0.5, max_weight=1.0):
+    import numpy as np
+    return _capped_solve(np.asarray(mu, dtype=float), cov, fraction, max_weight)
+
+
+def allocate(scores, cov, method=None, settings=None):
+    """
+    Weights for names with the given scores (signal_score()) and covariance,
+    using `method` (default settings['method']); settings default to the active
+    config's ALLOCATION section. Returns None for the 'fixed' method.
+    """
+    import numpy as np
+    settings = {**current_config().allocation, **(settings or {})}
+    method = method or settings['method']
+    if method not in METHODS:
+        raise ValueError(f"Unknown allocation method {method!r}; use one of {', '.join(METHODS)}")
+    if method == 'fixed':
+        return None
+    scores = np.clip(np.asarray(scores, dtype=float), 0, 1)
+    cov = np.asarray(cov, dtype=float)
+    if method == 'risk_parity':
+        return risk_parity(cov, scores, settings['max_weight'])
+    mu = settings['information_coefficient'] * np.sqrt(np.diag(cov)) * scores
+    if method == 'mean_variance':
+        return mean_variance(mu, cov, settings['risk_aversion'], settings['max_weight'])
+    return fractional_kelly(mu, cov, settings['kelly_fraction'], settings['max_weight'])
+
+
+def allocation_budgets(scores, funds, closes=None, bars=None, settings=None):
+    """
+    Dollar budget per candidate (plan_entry_exit(budget=...)), or None with the
+    'fixed' method. The covariance comes from `closes` (sessions x candidates,
+    e.g. the cached history) when given, else from the day ranges of `bars`
+    (one market_data dict per candidate).
+    """
+    settings = {**current_config().allocation, **(settings or {})}
+    if settings['method'] == 'fixed':
+        return None
+    if closes is not None and len(closes) > 2:
+        cov = covariance(closes, settings['lookback'], settings['shrinkage'])
+    else:
+        cov = range_covariance([b['high'] for b in bars], [b['low'] for b in bars], [b['open'] for b in bars])
+    return allocate(scores, cov, settings=settings) * funds
@@ -1,41 +1,43 @@
-import pandas as pd
-import numpy as np
 import sys
+from results_store import ResultsStore
 
 # Get year from command line argument, default to analyzing 1year results
 year = sys.argv[1] if len(sys.argv) > 1 else '1year'
 filename = f'backtest_results_{year}.csv'
 
-# Load and analyze backtest results
-df = pd.read_csv(filename)
+# Load backtest results into the results warehouse (skipped when already up to date)
+store = ResultsStore()
+run = store.ensure_csv(filename)
+totals = store.summary(run=run).iloc[0]
+n_trades = int(totals['trades'])
 
 print(f'=== ENHANCED BACKTEST ANALYSIS ({year.upper()}) ===')
-print(f'Total Trades Executed: {len(df):,}')
-print(f'Total Expected Profit: ${df["expected_profit"].sum():,.2f}')
+print(f'Total Trades Executed: {n_trades:,}')
+print(f'Total Expected Profit: ${totals["total_profit"]:,.2f}')
 print()
 
 # Exit type analysis
 print('=== EXIT TYPE BREAKDOWN ===')
-exit_counts = df['exit_type'].value_counts()
-for exit_type, count in exit_counts.items():
-    pct = (count / len(df)) * 100
+exit_counts = store.summary('exit_type', run=run).sort_values('trades', ascending=False, kind='stable')
+for exit_type, count in zip(exit_counts['exit_type'], exit_counts['trades']):
+    pct = (count / n_trades) * 100
     print(f'{exit_type}: {count:,} trades ({pct:.1f}%)')
 print()
 
 # Profitable vs non-profitable trades
-profitable = df[df['expected_profit'] > 0]
-non_profitable = df[df['expected_profit'] <= 0]
+profitable = store.summary(run=run, profit_above=0).iloc[0]
+n_profitable = int(profitable['trades'])
+n_non_profitable = int(store.summary(run=run, max_profit=0).iloc[0]['trades'])
 
 print('=== PROFITABILITY ANALYSIS ===')
-print(f'Profitable Trades: {len(profitable):,} ({len(profitable)/len(df)*100:.1f}%)')
-print(f'Non-Profitable Trades: {len(non_profitable):,} ({len(non_profitable)/len(df)*100:.1f}%)')
-if len(profitable) > 0:
-    print(f'Average Profitable Trade: ${profitable["expected_profit"].mean():.2f}')
+print(f'Profitable Trades: {n_profitable:,} ({n_profitable/n_trades*100:.1f}%)')
+print(f'Non-Profitable Trades: {n_non_profitable:,} ({n_non_profitable/n_trades*100:.1f}%)')
+if n_profitable > 0:
+    print(f'Average Profitable Trade: ${profitable["avg_profit"]:.2f}')
 print()
 
 # Daily performance
-df['date'] = pd.to_datetime(df['date'])
-daily_profits = df.groupby('date')['expected_profit'].sum()
+daily_profits = store.daily_pnl(run)
 
 print('=== DAILY PERFORMANCE ===')
 print(f'Trading Days: {len(daily_profits)}')
@@ -47,26 +49,26 @@ print(f'Days Above $150 Target: {(daily_profits >= 150).sum()} ({(daily_profits
 print()
 
 # Technical indicators impact (if available)
-if 'confidence' in df.columns:
+if store.count(run=run, column='confidence') > 0:
     print('=== TECHNICAL CONFIDENCE ANALYSIS ===')
-    high_conf = df[df['confidence'] >= 0.7]
-    med_conf = df[(df['confidence'] >= 0.5) & (df['confidence'] < 0.7)]
-    low_conf = df[df['confidence'] < 0.5]
+    high_conf = store.summary(run=run, min_confidence=0.7).iloc[0]
+    med_conf = store.summary(run=run, min_confidence=0.5, max_confidence=0.7).iloc[0]
+    low_conf = store.summary(run=run, max_confidence=0.5).iloc[0]
     
-    print(f'High Confidence Trades (≥0.7): {len(high_conf):,}')
-    print(f'Medium Confidence Trades (0.5-0.7): {len(med_conf):,}')
-    print(f'Low Confidence Trades (<0.5): {len(low_conf):,}')
+    print(f'High Confidence Trades (≥0.7): {int(high_conf["trades"]):,}')
+    print(f'Medium Confidence Trades (0.5-0.7): {int(med_conf["trades"]):,}')
+    print(f'Low Confidence Trades (<0.5): {int(low_conf["trades"]):,}')
     
-    if len(high_conf) > 0:
-        print(f'High Confidence Avg Profit: ${high_conf["expected_profit"].mean():.2f}')
-    if len(med_conf) > 0:
-        print(f'Medium Confidence Avg Profit: ${med_conf["expected_profit"].mean():.2f}')
-    if len(low_conf) > 0:
-        print(f'Low Confidence Avg Profit: ${low_conf["expected_profit"].mean():.2f}')
+    if high_conf['trades'] > 0:
+        print(f'High Confidence Avg Profit: ${high_conf["avg_profit"]:.2f}')
+    if med_conf['trades'] > 0:
+        print(f'Medium Confidence Avg Profit: ${med_conf["avg_profit"]:.2f}')
+    if low_conf['trades'] > 0:
+        print(f'Low Confidence Avg Profit: ${low_conf["avg_profit"]:.2f}')
 
 print()
 print('=== TARGET ACHIEVEMENT ===')
-total_profit = df["expected_profit"].sum()
+total_profit = totals["total_profit"]
 target = 37650  # $150/day × 251 trading days
 print(f'Target: $150/day × 251 trading days = ${target:,.2f}')
 print(f'Actual: ${total_profit:,.2f}')
@@ -74,9 +76,9 @@ print(f'Performance: {(total_profit / target) * 100:.1f}% of target')
 print(f'Excess Return: ${total_profit - target:,.2f}')
 
 # Monthly breakdown
-df['month'] = df['date'].dt.to_period('M')
-monthly_profits = df.groupby('month')['expected_profit'].sum()
+monthly_profits = store.monthly_pnl(run)
 print()
 print('=== MONTHLY PERFORMANCE ===')
 for month, profit in monthly_profits.items():
     print(f'{month}: ${profit:,.2f}')
+store.close()
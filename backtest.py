@@ -1,9 +1,13 @@
-import pandas as pd
-import yfinance as yf
-from strategy import select_custom_tickers, decide_entry_exit_adaptive, detect_market_regime
+# pandas and yfinance are imported where they are used so that importing
+# this module (e.g. from test_system.py) stays cheap.
+import sys
+from strategy import select_custom_tickers, plan_entry_exit, detect_market_regime
+from trade_plan import TradePlan
+from cost_model import DEFAULT_COST_MODEL
 from config import CUSTOM_TICKERS, FUNDS
 
 def download_data(tickers, start, end):
+    import yfinance as yf
     data = {}
     for ticker in tickers:
         df = yf.download(ticker, start=start, end=end, progress=False, auto_adjust=True)
@@ -11,101 +15,286 @@ def download_data(tickers, start, end):
             data[ticker] = df
     return data
 
-def run_backtest(tickers, start, end, initial_funds=25000):
-    data = download_data(tickers, start, end)
-    all_trades = []
-    funds = initial_funds
-    total_profit = 0
-    dates = pd.date_range(start, end, freq='B')
-    
-    for i, date in enumerate(dates):
-        day_data = {}
-        for ticker, df in data.items():
-            if date.strftime('%Y-%m-%d') in df.index:
-                row = df.loc[date.strftime('%Y-%m-%d')]
-                # If multiple rows, take the first
-                if hasattr(row, 'shape') and len(row.shape) > 1 and row.shape[0] > 1:
-                    row = row.iloc[0]
-                day_data[ticker] = {
-                    'open': float(row['Open'].iloc[0]) if hasattr(row['Open'], 'iloc') else float(row['Open']),
-                    'high': float(row['High'].iloc[0]) if hasattr(row['High'], 'iloc') else float(row['High']),
-                    'low': float(row['Low'].iloc[0]) if hasattr(row['Low'], 'iloc') else float(row['Low']),
-                    'close': float(row['Close'].iloc[0]) if hasattr(row['Close'], 'iloc') else float(row['Close']),
-                    'volume': float(row['Volume'].iloc[0]) if hasattr(row['Volume'], 'iloc') else float(row['Volume']),
-                    'sector': 'Unknown',  # Optional: add sector info if available
-                }
-        if not day_data:
+ENGINE_VERSION = 4
+BAR_FIELDS = ('open', 'high', 'low', 'close', 'volume')
+
+def align_bars(data, index):
+    """
+    Pre-align every ticker's DataFrame to a session index in one pass.
+    Returns (tickers, bars) where bars[i, j] is [open, high, low, close, volume]
+    of tickers[j] on session i (NaN where it has no row), so the previous
+    session is simply i - 1. Handles yfinance's (Price, Ticker) column
+    MultiIndex and keeps the first row when a date repeats.
+    """
+    import numpy as np
+    import pandas as pd
+    tickers = list(data)
+    session_days = index.values.astype('datetime64[D]')
+    bars = np.full((len(index), len(tickers), len(BAR_FIELDS)), np.nan)
+    for j, ticker in enumerate(tickers):
+        df = data[ticker]
+        if not len(df) or not len(session_days):
             continue
+        columns = list(df.columns.get_level_values(0) if df.columns.nlevels > 1 else df.columns)
+        values = df.to_numpy(dtype=float)[:, [columns.index(c) for c in ('Open', 'High', 'Low', 'Close', 'Volume')]]
+        dates = pd.DatetimeIndex(df.index)
+        if dates.tz is not None:
+            dates = dates.tz_localize(None)
+        days = dates.values.astype('datetime64[D]')
+        # Session position of every row; rows off the calendar are dropped and
+        # np.unique's first index keeps the first row of a repeated date
+        pos = np.searchsorted(session_days, days)
+        on_calendar = session_days[np.minimum(pos, len(session_days) - 1)] == days
+        rows, first = np.unique(pos[on_calendar], return_index=True)
+        bars[rows, j] = values[on_calendar][first]
+    return tickers, bars
+
+def build_day_data(tickers, sectors, session_bars):
+    """market_data dict for one session from its align_bars() slice"""
+    day_data = {}
+    for ticker, row in zip(tickers, session_bars.tolist()):
+        if row[0] == row[0]:  # NaN: no bar for this ticker on this session
+            day_data[ticker] = dict(zip(BAR_FIELDS, row), sector=sectors[ticker])
+    return day_data
+
+def simulate_day(date_str, day_data, prev_day_data, funds, total_profit, cost_model=DEFAULT_COST_MODEL):
+    """
+    Plan and settle one trading day. Selection uses the previous day's data,
+    execution the current day's. The day's trades are costed in one batch with
+    `cost_model` (None: frictionless) and their net profit is accumulated.
+    Returns (trades, total_profit) with trades as TradePlan records.
+    """
+    # Detect market regime for adaptive strategy
+    market_regime = detect_market_regime(prev_day_data)
+    
+    # Use custom tickers from configuration
+    available_custom_tickers = [t for t in CUSTOM_TICKERS if t in prev_day_data]
+    tickers_today = available_custom_tickers[:12]  # Limit to max positions
+    min_tickers = max(5, len(tickers_today))
+    
+    # DAY TRADING FIX: Use current total funds for each day (funds reset daily)
+    daily_funds = funds + total_profit  # Available funds = starting funds + accumulated profit
+    
+    trades = []
+    for ticker in tickers_today:
+        if ticker in day_data:  # Ensure ticker is available today
+            # Use current day's opening price for entry
+            current_data = day_data[ticker].copy()
+            current_data['symbol'] = ticker  # Add ticker symbol for position sizing
+            
+            # Simulate realistic exit: can achieve high/low/close during the day
+            trade_plan = plan_entry_exit(current_data, daily_funds, min_tickers, market_regime)
+            trade_plan.date = date_str
+            trade_plan.ticker = ticker
+            trades.append(trade_plan)
+    
+    # For day trading, we close the position at the end of the day
+    if cost_model is not None and trades:
+        profits = cost_model.apply(trades, [day_data[t.ticker]['volume'] for t in trades])
+    else:
+        profits = [t.expected_profit for t in trades]
+    for profit in profits:
+        if profit and profit != 0:
+            total_profit += profit
+    return trades, total_profit
+
+def run_settings(tickers, initial_funds, cost_model=DEFAULT_COST_MODEL):
+    """Everything outside the data that can change a run's results"""
+    import live_config
+    import strategy
+    from result_cache import run_key, source_digest
+    # The strategy reads its parameters from the active config (config.py plus any override)
+    active = live_config.current().as_dict()
+    settings = {
+        'tickers': list(tickers),
+        'initial_funds': initial_funds,
+        'CUSTOM_TICKERS': active['CUSTOM_TICKERS'],
+        'POSITION_SIZING': active['POSITION_SIZING'],
+        'CUSTOM_POSITION_SIZES': active['CUSTOM_POSITION_SIZES'],
+        'STRATEGY_CONFIG': active['STRATEGY_CONFIG'],
+        'costs': cost_model.params() if cost_model is not None else None,
+    }
+    # Source of every module whose code shapes the stored trades
+    sources = source_digest(strategy, sys.modules[__name__], sys.modules['cost_model'],
+                            sys.modules['trade_plan'], live_config)
+    return run_key(ENGINE_VERSION, sources, settings)
+
+CHUNK_SIZE = 10000
+
+def replay(sessions, tickers, sectors, bars, initial_funds, state, cache=None, chunk_size=CHUNK_SIZE,
+           cost_model=DEFAULT_COST_MODEL):
+    """
+    Core day loop over trading sessions (with bars from align_bars()), as a
+    generator of trade chunks (lists of at most about chunk_size trades). Each
+    session trades on the previous session's data; `state` ({'total_profit',
+    'prev_day_data', 'key'}) is carried across sessions and left holding the
+    end-of-run values. When prev_day_data is None the first session only
+    primes it.
+    """
+    from result_cache import day_key
+    chunk = []
+    for i, date_str in enumerate(sessions.strftime('%Y-%m-%d')):
+        day_data = build_day_data(tickers, sectors, bars[i])
+        prev_day_data = state['prev_day_data']
         
         # REALISTIC DAY TRADING: Use previous day's data for selection, current day for execution
-        if i > 0:  # Need at least one previous day
-            prev_date = dates[i-1]
-            prev_day_data = {}
-            for ticker, df in data.items():
-                if prev_date.strftime('%Y-%m-%d') in df.index:
-                    prev_row = df.loc[prev_date.strftime('%Y-%m-%d')]
-                    if hasattr(prev_row, 'shape') and len(prev_row.shape) > 1 and prev_row.shape[0] > 1:
-                        prev_row = prev_row.iloc[0]
-                    prev_day_data[ticker] = {
-                        'open': float(prev_row['Open'].iloc[0]) if hasattr(prev_row['Open'], 'iloc') else float(prev_row['Open']),
-                        'high': float(prev_row['High'].iloc[0]) if hasattr(prev_row['High'], 'iloc') else float(prev_row['High']),
-                        'low': float(prev_row['Low'].iloc[0]) if hasattr(prev_row['Low'], 'iloc') else float(prev_row['Low']),
-                        'close': float(prev_row['Close'].iloc[0]) if hasattr(prev_row['Close'], 'iloc') else float(prev_row['Close']),
-                        'volume': float(prev_row['Volume'].iloc[0]) if hasattr(prev_row['Volume'], 'iloc') else float(prev_row['Volume']),
-                        'sector': 'Unknown',
-                    }
-            
-            # Detect market regime for adaptive strategy
-            market_regime = detect_market_regime(prev_day_data)
-            
-            # Use custom tickers from configuration
-            available_custom_tickers = [t for t in CUSTOM_TICKERS if t in prev_day_data]
-            tickers_today = available_custom_tickers[:12]  # Limit to max positions
-            min_tickers = max(5, len(tickers_today))
-            
-            # DAY TRADING FIX: Use current total funds for each day (funds reset daily)
-            daily_funds = funds + total_profit  # Available funds = starting funds + accumulated profit
-            
-            for ticker in tickers_today:
-                if ticker in day_data:  # Ensure ticker is available today
-                    # Use current day's opening price for entry
-                    current_data = day_data[ticker].copy()
-                    current_data['open'] = day_data[ticker]['open']  # Buy at today's open
-                    current_data['symbol'] = ticker  # Add ticker symbol for position sizing
-                    
-                    # Simulate realistic exit: can achieve high/low/close during the day
-                    trade_plan = decide_entry_exit_adaptive(current_data, daily_funds, min_tickers, market_regime)
-                    
-                    # For day trading, we close the position at the end of the day
-                    if trade_plan.get('expected_profit') and trade_plan['expected_profit'] != 0:
-                        total_profit += trade_plan['expected_profit']
-                    
-                    trade_plan['date'] = date.strftime('%Y-%m-%d')
-                    trade_plan['ticker'] = ticker
-                    all_trades.append(trade_plan)
+        if day_data and prev_day_data is not None:
+            cached = None
+            if cache is not None:
+                state['key'] = day_key(state['key'], date_str, prev_day_data, day_data)
+                cached = cache.get_day(state['key'])
+            if cached is not None:
+                trades, state['total_profit'] = cached
+                trades = [TradePlan.from_dict(t) for t in trades]
+            else:
+                trades, state['total_profit'] = simulate_day(date_str, day_data, prev_day_data, initial_funds,
+                                                             state['total_profit'], cost_model)
+                if cache is not None:
+                    cache.put_day(state['key'], [t.to_dict() for t in trades], state['total_profit'])
+            chunk.extend(trades)
+            if len(chunk) >= chunk_size:
+                yield chunk
+                chunk = []
+        state['prev_day_data'] = day_data
+    if chunk:
+        yield chunk
+
+def run_backtest(tickers, start, end, initial_funds=25000, data=None, symbol_index=None, cache=None,
+                 checkpoint_file=None, sink=None, chunk_size=CHUNK_SIZE, cost_model=DEFAULT_COST_MODEL):
+    """
+    Replay the adaptive strategy over the NYSE sessions from start to end
+    (trading_calendar; holidays are skipped). `data` (ticker -> OHLCV DataFrame,
+    e.g. synthetic_data.to_frames()) skips the yfinance download; sectors come
+    from `symbol_index` (symbols.csv by default). With a result_cache.ResultCache,
+    days whose inputs are unchanged are read back instead of recomputed. With
+    checkpoint_file, the end-of-run engine state is saved for append_backtest().
+    Trades are costed with `cost_model` (cost_model.CostModel; defaults to
+    config.TRANSACTION_COSTS, None for frictionless fills) and the ledger
+    compounds their net profit.
     
-    return pd.DataFrame(all_trades)
+    Trades are streamed in chunks to `sink` (see trade_sinks) and the sink's
+    close() result is returned; the default collects them into a DataFrame.
+    """
+    from symbol_index import load_symbol_index
+    from trade_sinks import DataFrameSink
+    from trading_calendar import sessions
+    if data is None:
+        fetch = lambda: download_data(tickers, start, end)
+        data = cache.load_data(tickers, start, end, fetch) if cache is not None else fetch()
+    if symbol_index is None:
+        symbol_index = load_symbol_index()
+    sectors = {ticker: symbol_index.sector_of(ticker) for ticker in data}
+    index = sessions(start, end)
+    tickers_in_data, bars = align_bars(data, index)
+    state = {'total_profit': 0, 'prev_day_data': None,
+             'key': run_settings(tickers, initial_funds, cost_model) if cache is not None else None}
+    
+    sink = sink if sink is not None else DataFrameSink()
+    for chunk in replay(index, tickers_in_data, sectors, bars, initial_funds, state, cache, chunk_size, cost_model):
+        sink.write(chunk)
+    if checkpoint_file and len(index):
+        save_checkpoint(checkpoint_file, tickers, initial_funds, index[-1], state['prev_day_data'],
+                        state['total_profit'], cost_model)
+    return sink.close()
+
+def save_checkpoint(path, tickers, initial_funds, last_date, last_day_data, total_profit,
+                    cost_model=DEFAULT_COST_MODEL):
+    """
+    Persist the engine state needed to continue a run: accumulated profit, the
+    last session replayed and its bars (the next day's selection input), and the
+    regime those bars imply. Written atomically.
+    """
+    import json
+    import os
+    state = {
+        'engine_version': ENGINE_VERSION,
+        'run_key': run_settings(tickers, initial_funds, cost_model),
+        'tickers': list(tickers),
+        'initial_funds': initial_funds,
+        'last_date': last_date.strftime('%Y-%m-%d'),
+        'last_day_data': last_day_data,
+        'total_profit': total_profit,
+        'next_regime': detect_market_regime(last_day_data),
+    }
+    tmp = f"{path}.tmp"
+    with open(tmp, 'w') as f:
+        json.dump(state, f)
+    os.replace(tmp, path)
+
+def append_backtest(results_file, checkpoint_file, end, data=None, symbol_index=None,
+                    cost_model=DEFAULT_COST_MODEL):
+    """
+    Extend an existing run with the trading sessions after its checkpoint up to
+    `end`: only the new days are downloaded and replayed, their trades are
+    appended to results_file and the checkpoint is advanced. Returns the number
+    of trades appended. Refuses to resume if the strategy, engine or config
+    changed since the checkpoint (including the cost model).
+    """
+    import json
+    from symbol_index import load_symbol_index
+    from trade_sinks import CsvSink
+    from trading_calendar import next_session, sessions
+    with open(checkpoint_file) as f:
+        state = json.load(f)
+    tickers, initial_funds = state['tickers'], state['initial_funds']
+    if state['run_key'] != run_settings(tickers, initial_funds, cost_model):
+        raise ValueError(f"{checkpoint_file} was written by a different strategy/config; rerun the full backtest")
+    
+    index = sessions(next_session(state['last_date']), end)
+    if not len(index):
+        return 0
+    if data is None:
+        data = download_data(tickers, index[0].strftime('%Y-%m-%d'), end)
+    if symbol_index is None:
+        symbol_index = load_symbol_index()
+    sectors = {ticker: symbol_index.sector_of(ticker) for ticker in data}
+    tickers_in_data, bars = align_bars(data, index)
+    
+    replay_state = {'total_profit': state['total_profit'], 'prev_day_data': state['last_day_data'], 'key': None}
+    sink = CsvSink(results_file, append=True)
+    for chunk in replay(index, tickers_in_data, sectors, bars, initial_funds, replay_state, cost_model=cost_model):
+        sink.write(chunk)
+    written = sink.close()
+    save_checkpoint(checkpoint_file, tickers, initial_funds, index[-1], replay_state['prev_day_data'],
+                    replay_state['total_profit'], cost_model)
+    return written
 
 if __name__ == "__main__":
-    import sys
+    from datetime import date
+    from result_cache import ResultCache
+    from trade_sinks import CsvSink, SummarySink, TeeSink
     
     # Use custom tickers from configuration
     tickers = CUSTOM_TICKERS
     
-    # Get year from command line argument, default to 2024
-    year = int(sys.argv[1]) if len(sys.argv) > 1 else 2024
+    # Get year from command line argument, default to 2024 (--no-cache forces a full recompute,
+    # --append extends the year's results with the days since its last checkpoint)
+    args = [a for a in sys.argv[1:] if not a.startswith('--')]
+    year = int(args[0]) if args else 2024
+    cache = None if '--no-cache' in sys.argv else ResultCache()
     start = f'{year}-01-01'
     end = f'{year}-12-31'
+    filename = f'backtest_results_{year}.csv'
+    checkpoint_file = f'backtest_results_{year}.checkpoint.json'
+    
+    if '--append' in sys.argv:
+        end = min(end, date.today().isoformat())
+        appended = append_backtest(filename, checkpoint_file, end)
+        print(f"Appended {appended} trades through {end} to {filename}")
+        sys.exit(0)
     
     print(f"Running ENHANCED backtest for 1 year of data: {start} to {end}")
     print(f"Testing {len(tickers)} custom stocks: {', '.join(tickers)}")
     print("Using CUSTOM CONFIGURATION: Custom tickers, adaptive position sizing, configurable strategy")
-    df = run_backtest(tickers, start, end, FUNDS)
-    print(df.head())
-    print(f"Total trades: {len(df)}")
-    print(f"Total expected profit: {df['expected_profit'].sum():.2f}")
-    
-    # Save results to CSV with year in filename
-    filename = f'backtest_results_{year}.csv'
-    df.to_csv(filename, index=False)
+    # Stream trades straight to the CSV (with year in filename) while keeping running totals
+    _, summary = run_backtest(tickers, start, end, FUNDS, cache=cache, checkpoint_file=checkpoint_file,
+                              sink=TeeSink(CsvSink(filename), SummarySink()))
+    if cache is not None:
+        print(f"Result cache: {cache.hits} days reused, {cache.misses} days computed")
+    for exit_type, (count, profit) in summary['by_exit_type'].items():
+        print(f"  {exit_type}: {count} trades, {profit:.2f} expected profit")
+    print(f"Total trades: {summary['trades']}")
+    print(f"Total expected profit: {summary['total_profit']:.2f}")
+    print(f"Transaction costs: {summary['total_costs']:.2f}")
+    print(f"Total net profit: {summary['net_profit']:.2f}")
     print(f"Results saved to {filename}")
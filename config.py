@@ -47,6 +47,53 @@ STRATEGY_CONFIG = {
     'volatility_threshold': 0.02, # Minimum volatility for entry
 }
 
+# Capital allocation across the day's candidates in the live paths (allocation.py).
+# 'fixed' keeps the strategy's own per-trade sizing (as the backtests do); the
+# other methods are opt-in and replace it with budgets over the covariance.
+ALLOCATION = {
+    'method': 'fixed',        # Options: 'fixed' (strategy sizing), 'risk_parity', 'mean_variance', 'kelly'
+    'max_weight': 0.25,       # Largest share of funds in one name
+    'lookback': 60,           # Sessions of closes for the covariance estimate
+    'shrinkage': 0.2,         # Pull of the covariance towards its diagonal (0-1)
+    'information_coefficient': 0.05,  # Expected return per unit of volatility at score 1
+    'risk_aversion': 5.0,     # mean_variance
+    'kelly_fraction': 0.5,    # kelly: half Kelly
+}
+
+# Transaction costs charged by the backtest (cost_model.CostModel). Spread and
+# slippage are fractions of the day's high-low range; impact follows the
+# square-root of the order's share of daily volume. Set everything to 0 for
+# frictionless fills.
+TRANSACTION_COSTS = {
+    'commission_per_trade': 0.0,      # $ per order (most US brokers are commission-free)
+    'commission_per_share': 0.0,      # $ per share per order
+    'min_commission': 0.0,            # $ minimum per order
+    'spread_fraction': 0.01,          # quoted spread as a fraction of the day's range
+    'impact_coefficient': 0.1,        # market impact: coefficient * range * sqrt(shares / volume)
+    'stop_slippage_fraction': 0.05,   # extra slippage (fraction of range) on stop-loss / trailing-stop exits
+    'sec_fee_rate': 0.0000278,        # SEC Section 31 fee on sell notional
+    'taf_per_share': 0.000166,        # FINRA trading activity fee per share sold
+    'taf_max': 8.30,                  # FINRA TAF cap per trade
+}
+
+# Client-side limit for broker API calls (rate_limiter.PriorityRateLimiter):
+# `rate` requests per second sustained, bursts of `burst`, of which `reserve`
+# are kept for cancels and stop orders only. Set to match your broker's limits.
+BROKER_RATE_LIMIT = {
+    'rate': 20.0,
+    'burst': 40,
+    'reserve': 5,
+}
+
+# Session pipeline (scheduler.py): when each stage runs, in minutes relative to
+# the session's open / close in MARKET_TIMEZONE (early closes included).
+MARKET_TIMEZONE = 'America/New_York'
+SESSION_SCHEDULE = {
+    'warm_before_open': 45,      # load prior sessions' bars, warm the data cache, broker token and connection
+    'prepare_before_open': 15,   # regime, indicators, candidate ranking and order templates
+    'flatten_before_close': 10,  # cancel working orders and sell every open position
+}
+
 # Fidelity API credentials (replace with your actual credentials, or load from env vars)
 FIDELITY_CLIENT_ID = ''
 FIDELITY_CLIENT_SECRET = ''
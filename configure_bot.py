@@ -121,6 +121,23 @@ def example_custom_configs():
     print("    'max_positions': 8,")
     print("}")
 
+def validate_config_file(path):
+    """Validate a JSON config file for live_config (hot-reloaded by scheduler.py --config)"""
+    from live_config import ConfigError, load
+    try:
+        cfg = load(path)
+    except OSError as e:
+        print(f"❌ Cannot read {path}: {e}")
+        return False
+    except ConfigError as e:
+        print(f"❌ {path} is invalid:")
+        for problem in e.problems:
+            print(f"  - {problem}")
+        return False
+    print(f"✅ {path} is valid: {len(cfg.tickers)} tickers, method '{cfg.position_sizing['method']}', "
+          f"max {cfg.position_sizing['max_positions']} positions")
+    return True
+
 def main():
     """Main configuration tool"""
     print("🤖 TradeBot Configuration Tool")
@@ -132,9 +149,10 @@ def main():
         print("2. View Suggested Configurations")
         print("3. Quick Setup Guide")
         print("4. Copy-Paste Examples")
-        print("5. Exit")
+        print("5. Validate a Config File (JSON)")
+        print("6. Exit")
         
-        choice = input("\nSelect option (1-5): ").strip()
+        choice = input("\nSelect option (1-6): ").strip()
         
         if choice == '1':
             display_current_config()
@@ -145,10 +163,15 @@ def main():
         elif choice == '4':
             example_custom_configs()
         elif choice == '5':
+            validate_config_file(input("Config file path: ").strip())
+        elif choice == '6':
             print("\n👋 Happy Trading!")
             break
         else:
-            print("Invalid choice. Please select 1-5.")
+            print("Invalid choice. Please select 1-6.")
 
 if __name__ == "__main__":
+    import sys
+    if len(sys.argv) == 3 and sys.argv[1] == '--check':
+        sys.exit(0 if validate_config_file(sys.argv[2]) else 1)
     main()
@@ -0,0 +1,80 @@
+# Transaction cost and slippage model for the backtest
+#
+# The strategy assumes fills exactly at the open / stop / trailing level / close
+# with no fees. CostModel charges, per round trip and per share:
+#   fees      fixed + per-share commission (with a minimum), SEC fee on the sell
+#             notional and FINRA TAF on the sold shares (capped)
+#   spread    half of spread_fraction * (high - low) on each side
+#   impact    impact_coefficient * (high - low) * sqrt(shares / volume) on each
+#             side (square-root participation model)
+#   stop      stop_slippage_fraction * (high - low) extra on stop-loss and
+#             trailing-stop exits, which fill as market orders
+# All terms are numpy array operations over a batch of trades, so costing a
+# whole session (or run) adds next to nothing to the backtest.
+
+from config import TRANSACTION_COSTS
+
+STOP_EXITS = ('stop_loss', 'trailing_stop')
+
+
+class CostModel:
+    """Vectorized per-trade costs; see module comment for the terms"""
+
+    def __init__(self, commission_per_trade=0.0, commission_per_share=0.0, min_commission=0.0,
+                 spread_fraction=0.0, impact_coefficient=0.0, stop_slippage_fraction=0.0,
+                 sec_fee_rate=0.0, taf_per_share=0.0, taf_max=0.0):
+        self.commission_per_trade = commission_per_trade
+        self.commission_per_share = commission_per_share
+        self.min_commission = min_commission
+        self.spread_fraction = spread_fraction
+        self.impact_coefficient = impact_coefficient
+        self.stop_slippage_fraction = stop_slippage_fraction
+        self.sec_fee_rate = sec_fee_rate
+        self.taf_per_share = taf_per_share
+        self.taf_max = taf_max
+
+    def params(self):
+        return dict(vars(self))
+
+    def costs(self, exit, shares, high, low, volume, stop_exit):
+        """
+        Dollar cost per trade for arrays of exit prices, shares, the
+        day's high/low/volume and a 0/1 stop_exit flag. Participation is
+        capped at the whole day's volume (also when volume is missing).
+        """
+        import numpy as np
+        shares = np.asarray(shares, dtype=float)
+        day_range = np.asarray(high, dtype=float) - np.asarray(low, dtype=float)
+        participation = shares / np.fmax(np.asarray(volume, dtype=float), shares)
+        per_share = day_range * (self.spread_fraction  # half spread in, half out
+                                 + 2 * self.impact_coefficient * np.sqrt(participation)
+                                 + self.stop_slippage_fraction * np.asarray(stop_exit, dtype=float))
+        commission = np.maximum(self.commission_per_trade + self.commission_per_share * shares, self.min_commission)
+        regulatory = (self.sec_fee_rate * np.asarray(exit, dtype=float) * shares
+                      + np.minimum(self.taf_per_share * shares, self.taf_max))
+        return np.round(per_share * shares + 2 * commission + regulatory, 2)
+
+    def apply(self, plans, volumes):
+        """
+        Cost a batch of TradePlans (volumes: the day's volume per plan). Sets
+        plan.costs on every plan that is not skipped (0 without shares) and
+        returns net profits in order.
+        """
+        import numpy as np
+        traded = []
+        rows = []
+        for plan, volume in zip(plans, volumes):
+            if plan.skipped:
+                continue
+            plan.costs = 0.0
+            if plan.shares:
+                traded.append(plan)
+                rows.append((plan.exit, plan.shares, plan.high, plan.low, volume, plan.exit_type in STOP_EXITS))
+        if traded:
+            exit, shares, high, low, volume, stop_exit = np.array(rows, dtype=float).T
+            for plan, cost in zip(traded, self.costs(exit, shares, high, low, volume, stop_exit).tolist()):
+                plan.costs = cost
+        return [p.net_profit for p in plans]
+
+
+DEFAULT_COST_MODEL = CostModel(**TRANSACTION_COSTS)
@@ -1,5 +1,4 @@
 # Data retrieval (mock or public API for prototyping)
-import pandas as pd
 
 def get_mock_market_data():
     # Enhanced mock data with leveraged ETFs and additional tickers
@@ -1,15 +1,215 @@
 # Placeholder for Fidelity API integration
 # Implement authentication, order placement, and data retrieval here
+#
+# `requests` is imported lazily on the first HTTP call so that importing this
+# module (and main.py) does not pay for it. All calls share one keep-alive
+# session. base_url/oauth_url can point at a local mock_broker for testing.
+# Tokens live in a token_manager.TokenManager: persisted between runs when a
+# token_file is given, refreshed in the background before they expire, and a
+# request that still gets a 401 is retried once after a refresh.
+# Every call also passes a rate_limiter.PriorityRateLimiter (config
+# BROKER_RATE_LIMIT) in its priority lane: cancels and stops first, then new
+# orders, quotes and account/order queries.
+# stream_quotes() is the push alternative to polling get_market_data().
+# get_market_data() goes through a QuoteCache: quotes younger than their TTL
+# are served from memory and concurrent requests for one symbol share a single
+# HTTP call.
+
+import threading
+import time
+
+from config import BROKER_RATE_LIMIT
+from rate_limiter import ACCOUNT, CRITICAL, ORDERS, QUOTES, PriorityRateLimiter
+from token_manager import TokenManager
+
+
+class QuoteCache:
+    """
+    Per-symbol TTL cache with in-flight request coalescing. `ttl` is the
+    default freshness in seconds; `ttls` overrides it per symbol. Every
+    caller gets the same quote dict, so treat it as read-only. Failed fetches
+    (None) are handed to everyone waiting on them but not cached.
+    Thread safe; stats() reports hits, misses, coalesced waits and latencies.
+    """
+
+    def __init__(self, ttl=1.0, ttls=None, clock=time.monotonic):
+        self.ttl = ttl
+        self.ttls = dict(ttls or {})
+        self.clock = clock
+        self._quotes = {}    # symbol -> (fetched_at, quote)
+        self._inflight = {}  # symbol -> [Event, quote]
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self.errors = 0
+        self.fetch_seconds = 0.0
+        self.max_fetch_seconds = 0.0
+        self.wait_seconds = 0.0
+
+    def get(self, symbol, fetch, max_age=None):
+        """
+        Cached quote for symbol, or fetch(symbol) on a miss. max_age (seconds)
+        tightens the TTL for this call; 0 always goes to the network (still
+        coalescing with a fetch already in flight).
+        """
+        now = self.clock()
+        with self._lock:
+            entry = self._quotes.get(symbol)
+            ttl = self.ttls.get(symbol, self.ttl)
+            if max_age is not None:
+                ttl = min(ttl, max_age)
+            if entry is not None and now - entry[0] < ttl:
+                self.hits += 1
+                return entry[1]
+            waiting = self._inflight.get(symbol)
+            if waiting is None:
+                waiting = self._inflight[symbol] = [threading.Event(), None]
+                leader = True
+                self.misses += 1
+            else:
+                leader = False
+                self.coalesced += 1
+        if not leader:
+            waiting[0].wait()
+            with self._lock:
+                self.wait_seconds += self.clock() - now
+            return waiting[1]
+
+        quote = None
+        try:
+            quote = fetch(symbol)
+        finally:
+            elapsed = self.clock() - now
+            with self._lock:
+                if quote is not None:
+                    self._quotes[symbol] = (self.clock(), quote)
+                else:
+                    self.errors += 1
+                self.fetch_seconds += elapsed
+                self.max_fetch_seconds = max(self.max_fetch_seconds, elapsed)
+                del self._inflight[symbol]
+            waiting[1] = quote
+            waiting[0].set()
+        return quote
+
+    def invalidate(self, symbol=None):
+        with self._lock:
+            if symbol is None:
+                self._quotes.clear()
+            else:
+                self._quotes.pop(symbol, None)
+
+    def stats(self):
+        with self._lock:
+            requests = self.hits + self.misses + self.coalesced
+            return {
+                'requests': requests,
+                'hits': self.hits,
+                'misses': self.misses,
+                'coalesced': self.coalesced,
+                'errors': self.errors,
+                'hit_rate': (self.hits + self.coalesced) / requests if requests else 0.0,
+                'avg_fetch_ms': 1000 * self.fetch_seconds / self.misses if self.misses else 0.0,
+                'max_fetch_ms': 1000 * self.max_fetch_seconds,
+                'avg_wait_ms': 1000 * self.wait_seconds / self.coalesced if self.coalesced else 0.0,
+            }
 
-import requests
 
 class FidelityAPI:
     BASE_URL = "https://api.fidelity.com/v1"  # Example endpoint, replace with actual
+    OAUTH_URL = "https://oauth.fidelity.com"
+    STREAM_URL = "wss://streaming.fidelity.com/v1/marketdata/stream"
 
-    def __init__(self, api_key=None, api_secret=None):
+    def __init__(self, api_key=None, api_secret=None, base_url=None, oauth_url=None, stream_url=None,
+                 quote_ttl=1.0, quote_ttls=None, token_file=None, rate_limit=BROKER_RATE_LIMIT):
         self.api_key = api_key
         self.api_secret = api_secret
-        self.access_token = None
+        self.base_url = (base_url or self.BASE_URL).rstrip('/')
+        self.oauth_url = (oauth_url or self.OAUTH_URL).rstrip('/')
+        self.stream_url = stream_url or self.STREAM_URL
+        self.quotes = QuoteCache(quote_ttl, quote_ttls)
+        # rate_limit: PriorityRateLimiter kwargs, a limiter to share between clients, or None for no limit
+        self.limiter = PriorityRateLimiter(**rate_limit) if isinstance(rate_limit, dict) else rate_limit
+        self.tokens = TokenManager(f"{self.oauth_url}/token", lambda url, data: self._http().post(url, data=data),
+                                   path=token_file)
+        self._session = None
+
+    @property
+    def access_token(self):
+        return self.tokens.access_token
+
+    @access_token.setter
+    def access_token(self, token):
+        self.tokens.set_access_token(token)
+
+    def _http(self):
+        """
+        Shared requests.Session (created on first use). Environment settings
+        (proxies and NO_PROXY, CA bundle, .netrc) still apply, but are looked
+        up once per scheme and host instead of on every request, which
+        otherwise dominates local round-trip time.
+        """
+        if self._session is None:
+            import requests
+            from urllib.parse import urlsplit
+            session = requests.Session()
+            merge = session.merge_environment_settings
+            merged = {}
+
+            def merge_environment_settings(url, proxies, stream, verify, cert):
+                parts = urlsplit(url)
+                key = (parts.scheme, parts.netloc, tuple(sorted((proxies or {}).items())), stream, verify, cert)
+                if key not in merged:
+                    merged[key] = merge(url, proxies, stream, verify, cert)
+                return dict(merged[key])
+
+            session.merge_environment_settings = merge_environment_settings
+            self._session = session
+        return self._session
+
+    def _request(self, method, url, lane=ACCOUNT, headers=None, **kwargs):
+        """
+        Authenticated, rate-limited request in a priority lane. On a 401 the
+        access token is refreshed (once, shared with any concurrent callers)
+        and the request retried; on a 429 the limiter backs off for the
+        Retry-After period and the request is retried once.
+        """
+        refreshed = throttled = False
+        while True:
+            if self.limiter is not None:
+                self.limiter.acquire(lane)
+            token = self.tokens.token()
+            auth = {"Authorization": f"Bearer {token}"}
+            response = self._http().request(method, url, headers={**(headers or {}), **auth}, **kwargs)
+            if response.status_code == 401 and not refreshed and self.tokens.refresh(token):
+                refreshed = True
+            elif response.status_code == 429 and not throttled and self.limiter is not None:
+                throttled = True
+                try:
+                    retry_after = float(response.headers.get('Retry-After', 1))
+                except ValueError:
+                    retry_after = 1.0
+                self.limiter.throttled(retry_after)
+            else:
+                return response
+
+    def restore_session(self, client_id, client_secret):
+        """
+        Load tokens persisted by an earlier run and keep them refreshed in the
+        background. Returns True when no new authorization code is needed: the
+        saved access token is still valid, or one refresh with the saved
+        refresh token succeeded.
+        """
+        tokens = self.tokens
+        tokens.client_id, tokens.client_secret = client_id, client_secret
+        if not tokens.load():
+            return False
+        if (not tokens.access_token or tokens.expired(tokens.margin)) and not tokens.refresh():
+            print(f"[FidelityAPI] Saved session could not be refreshed: {tokens.last_error}")
+            return False
+        tokens.start()
+        return True
 
     def authenticate(self, client_id, client_secret, redirect_uri, auth_code=None):
         """
@@ -19,28 +219,20 @@ class FidelityAPI:
         """
         # Step 1: User visits this URL and logs in to get auth_code
         auth_url = (
-            f"https://oauth.fidelity.com/authorize?response_type=code"
+            f"{self.oauth_url}/authorize?response_type=code"
             f"&client_id={client_id}&redirect_uri={redirect_uri}&scope=openid+accounts+trading"
         )
         if not auth_code:
             print(f"[FidelityAPI] Please visit this URL to authorize: {auth_url}")
             print("[FidelityAPI] After authorizing, paste the 'code' parameter from the redirect URL here.")
             return None
-        # Step 2: Exchange auth_code for access_token
-        token_url = "https://oauth.fidelity.com/token"
-        data = {
-            "grant_type": "authorization_code",
-            "code": auth_code,
-            "redirect_uri": redirect_uri,
-            "client_id": client_id,
-            "client_secret": client_secret,
-        }
-        response = requests.post(token_url, data=data)
-        if response.status_code == 200:
-            self.access_token = response.json().get('access_token')
+        # Step 2: Exchange auth_code for access and refresh tokens (kept refreshed from here on)
+        self.tokens.client_id, self.tokens.client_secret = client_id, client_secret
+        if self.tokens.exchange_code(auth_code, redirect_uri):
+            self.tokens.start()
             print("[FidelityAPI] Authentication successful.")
             return self.access_token
-        print(f"[FidelityAPI] Authentication failed: {response.text}")
+        print(f"[FidelityAPI] Authentication failed: {self.tokens.last_error}")
         return None
 
     def get_account_info(self):
@@ -50,26 +242,27 @@ class FidelityAPI:
         if not self.access_token:
             print("[FidelityAPI] Not authenticated.")
             return None
-        headers = {"Authorization": f"Bearer {self.access_token}"}
-        url = f"{self.BASE_URL}/accounts"
-        response = requests.get(url, headers=headers)
+        url = f"{self.base_url}/accounts"
+        response = self._request('GET', url)
         if response.status_code == 200:
             return response.json()
         print(f"[FidelityAPI] Failed to get account info: {response.text}")
         return None
 
-    def place_order(self, symbol, qty, side, order_type, price=None):
+    def place_order(self, symbol, qty, side, order_type, price=None, stop_price=None, client_order_id=None):
         """
         Place an order (buy/sell) for a symbol.
         side: 'buy' or 'sell'
-        order_type: 'market' or 'limit'
+        order_type: 'market', 'limit' or 'stop'
         price: required for limit orders
+        stop_price: required for stop orders
+        client_order_id: optional caller-assigned id echoed back by the broker
         """
         if not self.access_token:
             print("[FidelityAPI] Not authenticated.")
             return None
-        headers = {"Authorization": f"Bearer {self.access_token}", "Content-Type": "application/json"}
-        url = f"{self.BASE_URL}/orders"
+        headers = {"Content-Type": "application/json"}
+        url = f"{self.base_url}/orders"
         order = {
             "symbol": symbol,
             "quantity": qty,
@@ -78,23 +271,76 @@ class FidelityAPI:
         }
         if order_type == 'limit' and price is not None:
             order["price"] = price
-        response = requests.post(url, headers=headers, json=order)
+        if order_type == 'stop' and stop_price is not None:
+            order["stopPrice"] = stop_price
+        if client_order_id is not None:
+            order["clientOrderId"] = client_order_id
+        # Protective stops share the cancel lane: they must not wait behind new entries
+        lane = CRITICAL if order_type == 'stop' else ORDERS
+        response = self._request('POST', url, lane, headers=headers, json=order)
         if response.status_code in (200, 201):
             return response.json()
         print(f"[FidelityAPI] Failed to place order: {response.text}")
         return None
 
-    def get_market_data(self, symbol):
+    def get_orders(self, status=None):
+        """
+        Retrieve orders for the account, optionally filtered by status
+        (e.g. 'working', 'filled').
+        """
+        if not self.access_token:
+            print("[FidelityAPI] Not authenticated.")
+            return None
+        url = f"{self.base_url}/orders"
+        params = {"status": status} if status else None
+        response = self._request('GET', url, params=params)
+        if response.status_code == 200:
+            return response.json()
+        print(f"[FidelityAPI] Failed to get orders: {response.text}")
+        return None
+
+    def cancel_order(self, order_id):
+        """
+        Cancel a working order by its broker order id.
+        """
+        if not self.access_token:
+            print("[FidelityAPI] Not authenticated.")
+            return None
+        url = f"{self.base_url}/orders/{order_id}"
+        response = self._request('DELETE', url, CRITICAL)
+        if response.status_code in (200, 202, 204):
+            return response.json() if response.content else {"orderId": order_id, "status": "cancelled"}
+        print(f"[FidelityAPI] Failed to cancel order: {response.text}")
+        return None
+
+    def get_market_data(self, symbol, max_age=None):
         """
-        Retrieve real-time or delayed market data for a symbol.
+        Retrieve real-time or delayed market data for a symbol. Served from
+        the quote cache while younger than its TTL (or max_age seconds);
+        concurrent callers for the same symbol share one request.
         """
         if not self.access_token:
             print("[FidelityAPI] Not authenticated.")
             return None
-        headers = {"Authorization": f"Bearer {self.access_token}"}
-        url = f"{self.BASE_URL}/marketdata/{symbol}/quotes"
-        response = requests.get(url, headers=headers)
+        return self.quotes.get(symbol, self._fetch_quote, max_age)
+
+    def _fetch_quote(self, symbol):
+        url = f"{self.base_url}/marketdata/{symbol}/quotes"
+        response = self._request('GET', url, QUOTES)
         if response.status_code == 200:
             return response.json()
         print(f"[FidelityAPI] Failed to get market data: {response.text}")
         return None
+
+    def stream_quotes(self, symbols, on_quotes=None, capacity=None):
+        """
+        Subscribe to pushed quotes for many symbols over one WebSocket
+        connection. Returns a started quote_stream.QuoteStream whose book
+        always holds the latest quote per symbol (stream.quote(symbol)).
+        """
+        if not self.access_token:
+            print("[FidelityAPI] Not authenticated.")
+            return None
+        from quote_stream import QuoteStream
+        return QuoteStream(self.stream_url, symbols, token=self.tokens.token, capacity=capacity,
+                           on_quotes=on_quotes).start()
@@ -0,0 +1,240 @@
+# Buffered, asynchronous trade journal
+#
+# Records are appended to an in-memory buffer by the trading loop and written
+# to disk by a background thread, so logging never blocks order placement.
+# Files rotate daily (logs/trades_YYYYMMDD.jsonl or .jrnl) and can be replayed
+# with read_journal(). A batch that fails to write (disk full, I/O error) is cut
+# back out of the file and queued again, so replays see each record once.
+
+import json
+import os
+import struct
+import threading
+import zlib
+from collections import deque
+from datetime import datetime
+
+JOURNAL_FORMATS = ('jsonl', 'framed')
+FSYNC_POLICIES = ('none', 'batch', 'close')
+
+# Framed record header: payload length, crc32 of payload
+_FRAME_HEADER = struct.Struct('<II')
+_EXTENSIONS = {'jsonl': '.jsonl', 'framed': '.jrnl'}
+
+
+def _json_default(value):
+    """Serialize numpy scalars and other odd values found in trade plans"""
+    if hasattr(value, 'item'):
+        return value.item()
+    if isinstance(value, datetime):
+        return value.isoformat()
+    return str(value)
+
+
+def encode_record(record, fmt='jsonl'):
+    """
+    Encode one journal record to bytes in the given format
+    """
+    payload = json.dumps(record, default=_json_default, separators=(',', ':')).encode('utf-8')
+    if fmt == 'jsonl':
+        return payload + b'\n'
+    return _FRAME_HEADER.pack(len(payload), zlib.crc32(payload)) + payload
+
+
+def read_journal(path):
+    """
+    Replay a journal file, yielding records in the order they were written.
+    The format is taken from the file extension. A torn final record (e.g. after
+    a crash mid-write) is ignored.
+    """
+    if path.endswith(_EXTENSIONS['framed']):
+        with open(path, 'rb') as f:
+            while True:
+                header = f.read(_FRAME_HEADER.size)
+                if len(header) < _FRAME_HEADER.size:
+                    return
+                length, crc = _FRAME_HEADER.unpack(header)
+                payload = f.read(length)
+                if len(payload) < length or zlib.crc32(payload) != crc:
+                    return
+                yield json.loads(payload)
+    else:
+        with open(path, 'rb') as f:
+            for line in f:
+                if not line.endswith(b'\n'):
+                    return
+                yield json.loads(line)
+
+
+class TradeJournal:
+    """
+    Batches trade records in memory and flushes them from a background thread
+    once max_batch records are pending or flush_interval seconds have passed.
+
+    fmt: 'jsonl' (newline-delimited JSON) or 'framed' (length + crc32 prefixed JSON)
+    fsync: 'none' (leave it to the OS), 'batch' (after every flush) or
+           'close' (on rotation and close only)
+    """
+
+    def __init__(self, log_dir="logs", fmt='jsonl', fsync='batch', max_batch=256,
+                 flush_interval=1.0, max_pending=100000, prefix='trades', clock=datetime.now):
+        if fmt not in JOURNAL_FORMATS:
+            raise ValueError(f"Unknown journal format '{fmt}', expected one of {JOURNAL_FORMATS}")
+        if fsync not in FSYNC_POLICIES:
+            raise ValueError(f"Unknown fsync policy '{fsync}', expected one of {FSYNC_POLICIES}")
+        self.log_dir = log_dir
+        self.fmt = fmt
+        self.fsync = fsync
+        self.max_batch = max_batch
+        self.flush_interval = flush_interval
+        self.max_pending = max_pending
+        self.prefix = prefix
+        self.clock = clock
+
+        self.written = 0
+        self.dropped = 0
+        self.flushes = 0
+        self.write_errors = 0  # failed flushes; their records are kept and retried
+
+        self._pending = deque()
+        self._lock = threading.Lock()        # guards _pending
+        self._write_lock = threading.Lock()  # serializes file writes
+        self._wakeup = threading.Event()
+        self._closed = False
+        self._day = None
+        self._file = None
+
+        os.makedirs(log_dir, exist_ok=True)
+        self._thread = threading.Thread(target=self._run, name='TradeJournal', daemon=True)
+        self._thread.start()
+
+    def path_for(self, day):
+        """File path for a given YYYYMMDD day string"""
+        return os.path.join(self.log_dir, f"{self.prefix}_{day}{_EXTENSIONS[self.fmt]}")
+
+    def record(self, ticker, trade_plan, **extra):
+        """
+        Queue a trade for writing. Never does I/O and never blocks on the writer;
+        returns False (and counts it in `dropped`) if the buffer is full.
+        """
+        entry = {'ts': self.clock().isoformat(), 'ticker': ticker}
+        entry.update(trade_plan)
+        entry.update(extra)
+        with self._lock:
+            if self._closed or len(self._pending) >= self.max_pending:
+                self.dropped += 1
+                return False
+            self._pending.append(entry)
+            pending = len(self._pending)
+        if pending >= self.max_batch:
+            self._wakeup.set()
+        return True
+
+    def flush(self):
+        """
+        Synchronously write everything queued so far. If the write fails the
+        batch goes back to the head of the queue for the next flush.
+        """
+        # Drain under the write lock so concurrent flushes keep record order
+        with self._write_lock:
+            with self._lock:
+                batch = self._pending
+                self._pending = deque()
+            if not batch:
+                return
+            try:
+                self._write_batch(batch)
+            except Exception:
+                with self._lock:
+                    batch.extend(self._pending)
+                    self._pending = batch
+                    self.write_errors += 1
+                raise
+
+    def close(self):
+        """Flush remaining records, stop the writer thread and close the file"""
+        with self._lock:
+            if self._closed:
+                return
+            self._closed = True
+        self._wakeup.set()
+        self._thread.join()
+        try:
+            self.flush()
+        finally:
+            with self._write_lock:
+                self._close_file()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    def _run(self):
+        while not self._closed:
+            self._wakeup.wait(self.flush_interval)
+            self._wakeup.clear()
+            try:
+                self.flush()
+            except Exception as e:
+                print(f"[TradeJournal] Flush failed: {e}")
+
+    def _write_batch(self, batch):
+        written = 0
+        started = []  # (path, size before this batch) of every file it touches
+        try:
+            for entry in batch:
+                try:
+                    data = encode_record(entry, self.fmt)
+                except (TypeError, ValueError) as e:
+                    # Could never be written; retrying it would stall the journal
+                    print(f"[TradeJournal] Dropped an unencodable record: {e}")
+                    with self._lock:
+                        self.dropped += 1
+                    continue
+                day = entry['ts'][:10].replace('-', '')
+                if day != self._day:
+                    self._rotate(day)
+                if not started or started[-1][0] != self._file.name:
+                    started.append((self._file.name, self._file.tell()))
+                self._file.write(data)
+                written += 1
+            if self._file is not None:
+                self._file.flush()
+                if self.fsync == 'batch':
+                    os.fsync(self._file.fileno())
+        except BaseException:
+            self._discard(started)
+            raise
+        self.written += written
+        self.flushes += 1
+
+    def _discard(self, started):
+        """Drop the open file and cut the files back to where the failed batch began"""
+        file, self._file, self._day = self._file, None, None
+        if file is not None:
+            try:
+                file.close()
+            except OSError:
+                pass
+        for path, size in started:
+            try:
+                os.truncate(path, size)
+            except OSError:
+                pass
+
+    def _rotate(self, day):
+        self._close_file()
+        self._day = day
+        self._file = open(self.path_for(day), 'ab')
+
+    def _close_file(self):
+        if self._file is None:
+            return
+        self._file.flush()
+        if self.fsync in ('batch', 'close'):
+            os.fsync(self._file.fileno())
+        self._file.close()
+        self._file = None
+        self._day = None
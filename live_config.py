@@ -0,0 +1,280 @@
+# Validated, hot-reloadable trading configuration
+#
+# config.py's CUSTOM_TICKERS / POSITION_SIZING / CUSTOM_POSITION_SIZES /
+# STRATEGY_CONFIG / ALLOCATION are the defaults. A JSON file with any of those keys (partial
+# dicts are merged over the defaults) is validated against SCHEMA and turned
+# into an immutable TradingConfig whose lookup tables (ticker set and index,
+# custom sizes aligned with the ticker list) are built once.
+#
+# ConfigManager watches the file from a background thread; a changed file is
+# loaded and validated there and parked as pending, and swap() - called by the
+# trading loop between decision cycles - makes it the config current() returns.
+# A decision cycle therefore sees one config throughout, a reload costs a file
+# parse plus validation (well under a millisecond for typical files) and an
+# invalid file is reported and ignored, leaving the running config in place.
+#
+# Nothing activates a file in a backtest, so it keeps config.py's values
+# (which its result-cache keys hash).
+
+import json
+import os
+import threading
+
+import config
+
+SIZING_METHODS = ('adaptive', 'equal', 'custom')
+ALLOCATION_METHODS = ('fixed', 'risk_parity', 'mean_variance', 'kelly')
+CONFIG_KEYS = ('CUSTOM_TICKERS', 'POSITION_SIZING', 'CUSTOM_POSITION_SIZES', 'STRATEGY_CONFIG', 'ALLOCATION')
+
+
+class ConfigError(ValueError):
+    """A configuration failed validation; .problems lists every issue found"""
+
+    def __init__(self, problems):
+        super().__init__("; ".join(problems))
+        self.problems = problems
+
+
+def _number(lo=None, hi=None, integer=False, lo_open=False):
+    def check(value):
+        if isinstance(value, bool) or not isinstance(value, int if integer else (int, float)):
+            return "must be an integer" if integer else "must be a number"
+        if lo is not None and (value <= lo if lo_open else value < lo):
+            return f"must be {'>' if lo_open else '>='} {lo}"
+        if hi is not None and value > hi:
+            return f"must be <= {hi}"
+        return None
+    return check
+
+
+def _choice(options):
+    def check(value):
+        return None if value in options else f"must be one of {', '.join(options)}"
+    return check
+
+
+def _ticker(value):
+    if not isinstance(value, str) or not value or value != value.strip().upper() or len(value) > 12:
+        return "must be an upper-case symbol of at most 12 characters"
+    return None
+
+
+# Field checks per section; each returns an error message or None
+SCHEMA = {
+    'POSITION_SIZING': {
+        'method': _choice(SIZING_METHODS),
+        'min_position_value': _number(0),
+        'max_position_value': _number(0, lo_open=True),
+        'max_positions': _number(1, integer=True),
+        'risk_per_trade': _number(0, 1, lo_open=True),
+    },
+    'STRATEGY_CONFIG': {
+        'profit_threshold': _number(0, 1),
+        'stop_loss_pct': _number(0, 1),
+        'trailing_stop_pct': _number(0, 1),
+        'volume_threshold': _number(0),
+        'volatility_threshold': _number(0, 1),
+    },
+    'ALLOCATION': {
+        'method': _choice(ALLOCATION_METHODS),
+        'max_weight': _number(0, 1, lo_open=True),
+        'lookback': _number(2, integer=True),
+        'shrinkage': _number(0, 1),
+        'information_coefficient': _number(0, 1, lo_open=True),
+        'risk_aversion': _number(0, lo_open=True),
+        'kelly_fraction': _number(0, 1, lo_open=True),
+    },
+}
+
+
+class TradingConfig:
+    """An immutable, validated configuration with its derived lookup tables"""
+
+    __slots__ = ('tickers', 'ticker_set', 'ticker_index', 'position_sizing', 'custom_sizes', 'size_array',
+                 'strategy', 'allocation', 'source', 'version')
+
+    def __init__(self, tickers, position_sizing, custom_sizes, strategy, allocation=None, source=None, version=0):
+        import numpy as np
+        self.tickers = tuple(tickers)
+        self.ticker_set = frozenset(self.tickers)
+        self.ticker_index = {t: i for i, t in enumerate(self.tickers)}
+        self.position_sizing = dict(position_sizing)
+        self.custom_sizes = dict(custom_sizes)
+        # Custom dollar size per ticker, aligned with tickers (NaN: no custom size)
+        self.size_array = np.array([custom_sizes.get(t, np.nan) for t in self.tickers], dtype=float)
+        self.size_array.flags.writeable = False
+        self.strategy = dict(strategy)
+        self.allocation = dict(config.ALLOCATION if allocation is None else allocation)
+        self.source = source
+        self.version = version
+
+    def as_dict(self):
+        return {'CUSTOM_TICKERS': list(self.tickers), 'POSITION_SIZING': dict(self.position_sizing),
+                'CUSTOM_POSITION_SIZES': dict(self.custom_sizes), 'STRATEGY_CONFIG': dict(self.strategy),
+                'ALLOCATION': dict(self.allocation)}
+
+    def __repr__(self):
+        return (f"TradingConfig({len(self.tickers)} tickers, method={self.position_sizing['method']!r}, "
+                f"source={self.source!r}, version={self.version})")
+
+
+def defaults():
+    """config.py's values, as a raw dict"""
+    return {'CUSTOM_TICKERS': list(config.CUSTOM_TICKERS), 'POSITION_SIZING': dict(config.POSITION_SIZING),
+            'CUSTOM_POSITION_SIZES': dict(config.CUSTOM_POSITION_SIZES),
+            'STRATEGY_CONFIG': dict(config.STRATEGY_CONFIG), 'ALLOCATION': dict(config.ALLOCATION)}
+
+
+def validate(raw, source=None, version=0):
+    """
+    Merge raw (a dict with any of CONFIG_KEYS) over the config.py defaults and
+    check it. Returns a TradingConfig or raises ConfigError.
+    """
+    if not isinstance(raw, dict):
+        raise ConfigError(["configuration must be a JSON object"])
+    problems = [f"unknown key {key!r}" for key in raw if key not in CONFIG_KEYS]
+    merged = defaults()
+    for key in ('POSITION_SIZING', 'STRATEGY_CONFIG', 'ALLOCATION', 'CUSTOM_POSITION_SIZES'):
+        section = raw.get(key, {})
+        if not isinstance(section, dict):
+            problems.append(f"{key} must be an object")
+            continue
+        if key == 'CUSTOM_POSITION_SIZES' and key in raw:
+            merged[key] = {}  # a custom size table replaces the default one
+        merged[key].update(section)
+        for field in section:
+            if key in SCHEMA and field not in SCHEMA[key]:
+                problems.append(f"{key}.{field}: unknown setting")
+
+    tickers = raw.get('CUSTOM_TICKERS', merged['CUSTOM_TICKERS'])
+    if not isinstance(tickers, list) or not tickers:
+        problems.append("CUSTOM_TICKERS must be a non-empty list")
+        tickers = []
+    for ticker in tickers:
+        error = _ticker(ticker)
+        if error:
+            problems.append(f"CUSTOM_TICKERS: {ticker!r} {error}")
+    if len(set(map(str, tickers))) != len(tickers):
+        problems.append("CUSTOM_TICKERS has duplicates")
+
+    for key, checks in SCHEMA.items():
+        for field, check in checks.items():
+            if field not in merged[key]:
+                problems.append(f"{key}.{field}: missing")
+                continue
+            error = check(merged[key][field])
+            if error:
+                problems.append(f"{key}.{field} {error}")
+    for ticker, size in merged['CUSTOM_POSITION_SIZES'].items():
+        error = _ticker(ticker) or _number(0, lo_open=True)(size)
+        if error:
+            problems.append(f"CUSTOM_POSITION_SIZES.{ticker} {error}")
+
+    sizing = merged['POSITION_SIZING']
+    if not problems and sizing['min_position_value'] > sizing['max_position_value']:
+        problems.append("POSITION_SIZING.min_position_value must not exceed max_position_value")
+    if problems:
+        raise ConfigError(problems)
+    return TradingConfig(tickers, sizing, merged['CUSTOM_POSITION_SIZES'], merged['STRATEGY_CONFIG'],
+                         merged['ALLOCATION'], source, version)
+
+
+def load(path, version=0):
+    """Validated TradingConfig from a JSON file (raises ConfigError / OSError)"""
+    with open(path) as f:
+        try:
+            raw = json.load(f)
+        except ValueError as e:
+            raise ConfigError([f"{path}: invalid JSON ({e})"])
+    return validate(raw, source=path, version=version)
+
+
+_current = None
+_current_lock = threading.Lock()
+
+
+def current():
+    """The active TradingConfig (config.py's values until a ConfigManager swaps one in)"""
+    global _current
+    if _current is None:
+        with _current_lock:
+            if _current is None:
+                _current = validate({}, source='config.py')
+    return _current
+
+
+def activate(trading_config):
+    """Make trading_config the one current() returns"""
+    global _current
+    _current = trading_config
+
+
+class ConfigManager:
+    """
+    Watches a JSON config file. check() (run by the watcher thread every
+    `interval` seconds) loads and validates a changed file into `pending`;
+    swap() activates it. Validation errors are kept in last_error.
+    """
+
+    def __init__(self, path, interval=1.0):
+        self.path = path
+        self.interval = interval
+        self.pending = None
+        self.last_error = None
+        self.reloads = 0
+        self._stamp = None
+        self._version = 0
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def check(self):
+        """Stage the file if it changed since the last check; returns whether a new config is pending"""
+        try:
+            stat = os.stat(self.path)
+        except OSError as e:
+            self.last_error = str(e)
+            return False
+        stamp = (stat.st_mtime_ns, stat.st_size)
+        if stamp == self._stamp:
+            return False
+        self._stamp = stamp
+        try:
+            loaded = load(self.path, self._version + 1)
+        except (ConfigError, OSError) as e:
+            self.last_error = str(e)
+            print(f"[ConfigManager] Ignoring {self.path}: {e}")
+            return False
+        with self._lock:
+            self._version = loaded.version
+            self.pending = loaded
+            self.last_error = None
+        return True
+
+    def swap(self):
+        """Activate the pending config, if any (call between decision cycles); returns it or None"""
+        with self._lock:
+            loaded, self.pending = self.pending, None
+        if loaded is not None:
+            activate(loaded)
+            self.reloads += 1
+        return loaded
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self.check()
+
+    def start(self):
+        """Load the file now (activating it if valid) and keep watching it"""
+        self.check()
+        self.swap()
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name='ConfigWatcher', daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
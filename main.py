@@ -4,32 +4,70 @@
 # Live Mode: Set DEMO_MODE=false to enable real Fidelity API authentication
 
 import os
-from datetime import datetime
-from config import FUNDS, DAILY_TARGET, BROKER, FIDELITY_CLIENT_ID, FIDELITY_CLIENT_SECRET, FIDELITY_REDIRECT_URI, CUSTOM_TICKERS, POSITION_SIZING
+from config import FUNDS, DAILY_TARGET, BROKER, FIDELITY_CLIENT_ID, FIDELITY_CLIENT_SECRET, FIDELITY_REDIRECT_URI
 from fidelity_api import FidelityAPI
-from strategy import select_custom_tickers, decide_entry_exit, detect_market_regime
+from strategy import select_custom_tickers, decide_entry_exit, detect_market_regime, technical_signals
 from data import get_mock_market_data
 
 
+def connect_api():
+    """
+    FidelityAPI for live mode: reuses saved tokens (FIDELITY_TOKEN_FILE) and
+    only runs the OAuth2 code flow when there are none.
+    """
+    from token_manager import DEFAULT_TOKEN_FILE
+    # FIDELITY_BASE_URL / FIDELITY_OAUTH_URL point the client at a local mock_broker
+    api = FidelityAPI(base_url=os.environ.get('FIDELITY_BASE_URL'),
+                      oauth_url=os.environ.get('FIDELITY_OAUTH_URL'),
+                      token_file=os.environ.get('FIDELITY_TOKEN_FILE', DEFAULT_TOKEN_FILE))
+    # --- Fidelity OAuth2 Authentication ---
+    # 1. Set your credentials in config.py or as environment variables
+    # 2. First run: get auth_code by visiting the printed URL and pasting the code
+    # 3. Later runs reuse the saved tokens (FIDELITY_TOKEN_FILE), refreshed in the background
+    if not api.restore_session(FIDELITY_CLIENT_ID, FIDELITY_CLIENT_SECRET):
+        auth_code = os.environ.get('FIDELITY_AUTH_CODE', None)  # Or prompt user for input
+        if not auth_code:
+            api.authenticate(FIDELITY_CLIENT_ID, FIDELITY_CLIENT_SECRET, FIDELITY_REDIRECT_URI)
+            auth_code = input("Paste the 'code' from the Fidelity redirect URL: ").strip()
+        api.authenticate(FIDELITY_CLIENT_ID, FIDELITY_CLIENT_SECRET, FIDELITY_REDIRECT_URI, auth_code)
+    # --- End Fidelity OAuth2 Authentication ---
+    return api
+
 
-def log_trade(ticker, trade_plan):
-    log_dir = "logs"
-    os.makedirs(log_dir, exist_ok=True)
-    log_file = os.path.join(log_dir, f"trades_{datetime.now().strftime('%Y%m%d')}.log")
-    with open(log_file, "a") as f:
-        f.write(f"{datetime.now().isoformat()} | {ticker} | Entry: {trade_plan['entry']} | Exit: {trade_plan['exit']} | ExitType: {trade_plan.get('exit_type', 'n/a')}\n")
+def cached_closes(tickers, lookback):
+    """
+    Daily closes (sessions x tickers, NaN where missing) of about `lookback`
+    sessions before today, through the data cache; None if they cannot be loaded
+    """
+    import numpy as np
+    from datetime import date, timedelta
+    from backtest import align_bars, download_data
+    from result_cache import ResultCache
+    from trading_calendar import previous_session, sessions
+    last = previous_session(date.today())
+    start = (last - timedelta(days=lookback * 3 // 2 + 10)).isoformat()
+    end = date.today().isoformat()  # exclusive for the download
+    try:
+        data = ResultCache().load_data(tickers, start, end, lambda: download_data(tickers, start, end))
+    except Exception as e:
+        print(f"Close history unavailable ({e}); allocating from today's ranges")
+        return None
+    loaded, bars = align_bars(data, sessions(start, last))
+    columns = {t: j for j, t in enumerate(loaded)}
+    closes = np.full((len(bars), len(tickers)), np.nan)
+    for j, ticker in enumerate(tickers):
+        if ticker in columns:
+            closes[:, j] = bars[:, columns[ticker], 3]
+    return closes
 
-def risk_report(trades):
-    total_invested = sum(t.get('invested', 0) for t in trades)
-    max_loss = sum((t['entry'] - t['stop_loss']) * t['shares'] for t in trades if t.get('stop_loss') and t.get('shares'))
-    expected_profit = sum(t.get('expected_profit', 0) for t in trades)
-    print("\n--- Risk Report ---")
-    print(f"Total Invested: ${total_invested:.2f}")
-    print(f"Maximum Possible Loss (if all stop-losses hit): ${max_loss:.2f}")
-    print(f"Expected Profit (if all targets hit): ${expected_profit:.2f}")
-    print(f"Number of trades: {len(trades)}")
 
 def main():
+    # Imported here so `import main` stays cheap (cold-start budget in test_system.py)
+    from allocation import allocation_budgets, signal_score
+    from journal import TradeJournal
+    from live_config import current as current_config
+    from order_manager import OrderManager
+    from risk_engine import RiskEngine
     print(f"Starting TradeBot with ${FUNDS} aiming for ${DAILY_TARGET} daily using {BROKER}")
     
     # Check if we're in demo mode (no real API authentication)
@@ -39,23 +77,26 @@ def main():
         print("Running in DEMO MODE - No actual API authentication required")
         api = None  # Skip API initialization in demo mode
     else:
-        api = FidelityAPI()
-        # --- Fidelity OAuth2 Authentication ---
-        # 1. Set your credentials in config.py or as environment variables
-        # 2. First run: get auth_code by visiting the printed URL and pasting the code
-        auth_code = os.environ.get('FIDELITY_AUTH_CODE', None)  # Or prompt user for input
-        if not auth_code:
-            api.authenticate(FIDELITY_CLIENT_ID, FIDELITY_CLIENT_SECRET, FIDELITY_REDIRECT_URI)
-            auth_code = input("Paste the 'code' from the Fidelity redirect URL: ").strip()
-        api.authenticate(FIDELITY_CLIENT_ID, FIDELITY_CLIENT_SECRET, FIDELITY_REDIRECT_URI, auth_code)
-        # --- End Fidelity OAuth2 Authentication ---
+        api = connect_api()
+
+    # TRADEBOT_CONFIG: JSON file overriding the ticker list / sizing (validated, see live_config.py)
+    config_path = os.environ.get('TRADEBOT_CONFIG')
+    if config_path:
+        from live_config import ConfigManager
+        manager = ConfigManager(config_path)
+        manager.check()
+        manager.swap()
+        if manager.last_error:
+            print(f"Config file not used: {manager.last_error}")
 
     market_data = get_mock_market_data()  # Replace with api.get_market_data(symbol) for live
     
     # Use custom ticker configuration
-    print(f"Using custom ticker list: {CUSTOM_TICKERS}")
-    print(f"Position sizing method: {POSITION_SIZING['method']}")
-    print(f"Max positions: {POSITION_SIZING['max_positions']}")
+    cfg = current_config()
+    print(f"Using custom ticker list: {list(cfg.tickers)}")
+    print(f"Position sizing method: {cfg.position_sizing['method']}")
+    print(f"Max positions: {cfg.position_sizing['max_positions']}")
+    print(f"Allocation method: {cfg.allocation['method']}")
     
     # Get custom tickers and detect market regime
     tickers = select_custom_tickers(market_data)
@@ -63,27 +104,54 @@ def main():
     print(f"Market regime detected: {market_regime}")
     print(f"Selected tickers: {tickers}")
     
+    # Split the funds across the selected tickers when ALLOCATION opts in (otherwise
+    # budgets is None and the strategy sizes each trade); the covariance comes from
+    # the cached closes, falling back to today's ranges
+    tickers = [t for t in tickers if market_data.get(t)]
+    budgets = None
+    if tickers and cfg.allocation['method'] != 'fixed':
+        technicals = [technical_signals(market_data[t]) for t in tickers]
+        budgets = allocation_budgets([signal_score(t.overall, t.confidence) for t in technicals], FUNDS,
+                                     closes=cached_closes(tickers, cfg.allocation['lookback']),
+                                     bars=[market_data[t] for t in tickers])
+    
     available_funds = FUNDS
     trades = []
+    risk = RiskEngine(FUNDS)
+    journal = TradeJournal(log_dir="logs")
+    # Orders are only sent in live mode with PLACE_ORDERS=true
+    place_orders = os.environ.get('PLACE_ORDERS', 'false').lower() == 'true'
+    orders = OrderManager(api) if api is not None and place_orders else None
     
-    for ticker in tickers:
+    for i, ticker in enumerate(tickers):
         ticker_data = market_data.get(ticker, {})
         if ticker_data:
             # Add ticker symbol to the data for position sizing
             ticker_data['symbol'] = ticker
-            trade_plan = decide_entry_exit(ticker_data, available_funds, len(tickers))
+            trade_plan = decide_entry_exit(ticker_data, available_funds, len(tickers),
+                                           budget=None if budgets is None else float(budgets[i]))
+            # Pre-trade risk check: resizes or rejects against POSITION_SIZING limits
+            trade_plan = risk.pre_trade(ticker, trade_plan, ticker_data.get('sector'))
             
-            # Deduct invested amount from available funds for next trade
-            if trade_plan.get('invested'):
-                available_funds -= trade_plan['invested']
+            # Remaining buying power is what the next trade can use
+            available_funds = risk.buying_power
             
-            # Example: Place a real order (uncomment for live trading)
-            # api.place_order(ticker, trade_plan['shares'], 'buy', 'market')
+            if orders:
+                orders.place_trade_plan(ticker, trade_plan)
             print(f"Planned trade for {ticker}: {trade_plan}")
-            log_trade(ticker, trade_plan)
+            journal.record(ticker, trade_plan)
             trades.append(trade_plan)
-        trades.append(trade_plan)
-    risk_report(trades)
+    if orders:
+        submitted = orders.submit_pending()
+        print(f"Submitted {len(submitted)} orders: {orders.counts()}")
+        # Protective stops are sent as entries fill; wait for them before exiting
+        unfilled = orders.await_entries(timeout=float(os.environ.get('ENTRY_FILL_TIMEOUT', '30')))
+        if unfilled:
+            print(f"Entries still open without a protective stop: {[o.symbol for o in unfilled]}")
+        print(f"Orders after fills: {orders.counts()}")
+        orders.close()
+    journal.close()
+    risk.print_report()
 
 if __name__ == "__main__":
     main()
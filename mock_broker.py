@@ -0,0 +1,485 @@
+#!/usr/bin/env python3
+"""
+Local mock broker/exchange for offline integration and load testing.
+
+Implements the endpoints FidelityAPI talks to:
+  POST   /token                      OAuth token (authorization_code / refresh_token)
+  GET    /v1/accounts                balances and positions
+  POST   /v1/orders                  market / limit / stop orders
+  GET    /v1/orders[?status=...]     order list
+  DELETE /v1/orders/{id}             cancel
+  GET    /v1/marketdata/{sym}/quotes latest quote
+
+Quotes are a vectorized random walk over any number of symbols. Market orders
+fill at the simulated bid/ask, resting limit/stop orders fill when the walk
+crosses them. Per-request and per-fill latency can be simulated, and so can a
+broker rate limit (429 with Retry-After once exceeded).
+
+Usage:
+  python mock_broker.py --symbols 5000 --port 8765
+  python mock_broker.py --symbols 2000 --bench 20000    # load test FidelityAPI against it
+"""
+
+import argparse
+import itertools
+import json
+import secrets
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+import numpy as np
+
+from config import CUSTOM_TICKERS, FUNDS
+from data import get_mock_market_data
+
+SECONDS_PER_SESSION = 6.5 * 3600
+
+
+def make_universe(n_symbols):
+    """CUSTOM_TICKERS first, then synthetic SYM00001... names up to n_symbols"""
+    symbols = list(CUSTOM_TICKERS[:n_symbols])
+    symbols += [f"SYM{i:05d}" for i in range(1, n_symbols - len(symbols) + 1)]
+    return symbols
+
+
+class MockExchange:
+    """
+    In-memory exchange state: random-walk quotes, orders, cash and positions.
+    All public methods are thread safe.
+    """
+
+    def __init__(self, symbols=None, n_symbols=None, seed=0, daily_volatility=0.02, spread_bps=2.0,
+                 tick_interval=0.05, time_scale=1.0, fill_latency_ms=0, start_cash=FUNDS,
+                 token_ttl=1800, clock=time.monotonic):
+        if symbols is None:
+            symbols = make_universe(n_symbols or len(CUSTOM_TICKERS))
+        self.symbols = list(symbols)
+        self.index = {s: i for i, s in enumerate(self.symbols)}
+        self.rng = np.random.default_rng(seed)
+        self.spread = spread_bps / 10000.0
+        self.tick_interval = tick_interval
+        self.time_scale = time_scale  # simulated seconds per wall second
+        self.fill_latency = fill_latency_ms / 1000.0
+        self.token_ttl = token_ttl
+        self.clock = clock
+        self._lock = threading.Lock()
+
+        n = len(self.symbols)
+        seeded = get_mock_market_data()
+        prices = np.exp(self.rng.uniform(np.log(10), np.log(500), n))
+        for symbol, bar in seeded.items():
+            if symbol in self.index:
+                prices[self.index[symbol]] = bar['open']
+        self.last = prices.round(2)
+        self.open = self.last.copy()
+        self.high = self.last.copy()
+        self.low = self.last.copy()
+        self.volume = np.zeros(n, dtype=np.int64)
+        # Per-symbol volatility per simulated second
+        self.sigma = daily_volatility * self.rng.uniform(0.5, 2.0, n) / np.sqrt(SECONDS_PER_SESSION)
+        self._last_tick = clock()
+
+        self.cash = float(start_cash)
+        self.positions = {}
+        self.orders = {}
+        self.working = {}  # orderId -> order for resting/pending orders
+        self._order_ids = itertools.count(1)
+        self.tokens = {}   # access_token -> expiry (clock time)
+        self.refresh_tokens = set()
+        self.requests = 0
+        self.throttled = 0
+
+    # --- Market simulation ---
+
+    def _advance(self):
+        now = self.clock()
+        elapsed = now - self._last_tick
+        if elapsed < self.tick_interval:
+            return
+        self._last_tick = now
+        dt = elapsed * self.time_scale
+        shocks = self.rng.standard_normal(len(self.last)) * self.sigma * np.sqrt(dt)
+        self.last = np.maximum(0.01, self.last * np.exp(shocks)).round(2)
+        np.maximum(self.high, self.last, out=self.high)
+        np.minimum(self.low, self.last, out=self.low)
+        self.volume += self.rng.poisson(100 * max(dt, 1.0), len(self.last))
+        self._match_working(now)
+
+    def _bid_ask(self, i):
+        last = float(self.last[i])
+        half = max(0.01, round(last * self.spread / 2, 2))
+        return round(last - half, 2), round(last + half, 2)
+
+    def _match_working(self, now):
+        for order_id in list(self.working):
+            order = self.working[order_id]
+            if order['_fill_at'] > now:
+                continue
+            i = self.index[order['symbol']]
+            bid, ask = self._bid_ask(i)
+            last = float(self.last[i])
+            price = None
+            if order['type'] == 'market':
+                price = ask if order['side'] == 'buy' else bid
+            elif order['type'] == 'limit':
+                if order['side'] == 'buy' and ask <= order['price']:
+                    price = ask
+                elif order['side'] == 'sell' and bid >= order['price']:
+                    price = bid
+            elif order['type'] == 'stop':
+                if order['side'] == 'sell' and last <= order['stopPrice']:
+                    price = bid
+                elif order['side'] == 'buy' and last >= order['stopPrice']:
+                    price = ask
+            if price is not None:
+                self._fill(order, price)
+
+    def _fill(self, order, price):
+        qty = order['quantity'] - order['filledQuantity']
+        sign = 1 if order['side'] == 'buy' else -1
+        self.cash -= sign * qty * price
+        self.positions[order['symbol']] = self.positions.get(order['symbol'], 0) + sign * qty
+        order['filledQuantity'] = order['quantity']
+        order['avgFillPrice'] = price
+        order['status'] = 'filled'
+        self.volume[self.index[order['symbol']]] += qty
+        self.working.pop(order['orderId'], None)
+
+    # --- Auth ---
+
+    def issue_token(self, form):
+        grant = form.get('grant_type')
+        if grant == 'authorization_code' and not form.get('code'):
+            return None
+        if grant not in ('authorization_code', 'refresh_token'):
+            return None
+        access, refresh = secrets.token_hex(16), secrets.token_hex(16)
+        with self._lock:
+            # Check and redeem in one step: a refresh token is good for exactly one refresh
+            if grant == 'refresh_token':
+                if form.get('refresh_token') not in self.refresh_tokens:
+                    return None
+                self.refresh_tokens.discard(form['refresh_token'])
+            self.tokens[access] = self.clock() + self.token_ttl
+            self.refresh_tokens.add(refresh)
+        return {'access_token': access, 'refresh_token': refresh, 'token_type': 'Bearer',
+                'expires_in': self.token_ttl}
+
+    def check_token(self, token):
+        with self._lock:
+            expiry = self.tokens.get(token)
+        return expiry is not None and expiry > self.clock()
+
+    def count_request(self):
+        with self._lock:
+            self.requests += 1
+
+    def count_throttled(self):
+        with self._lock:
+            self.throttled += 1
+
+    # --- Endpoints ---
+
+    def quote(self, symbol):
+        with self._lock:
+            self._advance()
+            i = self.index.get(symbol)
+            if i is None:
+                return None
+            bid, ask = self._bid_ask(i)
+            return {
+                'symbol': symbol, 'bid': bid, 'ask': ask, 'last': float(self.last[i]),
+                'open': float(self.open[i]), 'high': float(self.high[i]), 'low': float(self.low[i]),
+                'close': float(self.last[i]), 'volume': int(self.volume[i]), 'timestamp': time.time(),
+            }
+
+    def place_order(self, body):
+        symbol = body.get('symbol')
+        qty = body.get('quantity')
+        side = body.get('side')
+        order_type = body.get('type')
+        if (symbol not in self.index or not isinstance(qty, int) or qty <= 0
+                or side not in ('buy', 'sell') or order_type not in ('market', 'limit', 'stop')
+                or (order_type == 'limit' and body.get('price') is None)
+                or (order_type == 'stop' and body.get('stopPrice') is None)):
+            return None
+        with self._lock:
+            self._advance()
+            order = {
+                'orderId': f"MB{next(self._order_ids):08d}", 'clientOrderId': body.get('clientOrderId'),
+                'symbol': symbol, 'quantity': qty, 'side': side, 'type': order_type,
+                'price': body.get('price'), 'stopPrice': body.get('stopPrice'),
+                'status': 'working', 'filledQuantity': 0, 'avgFillPrice': None,
+                '_fill_at': self.clock() + self.fill_latency,
+            }
+            self.orders[order['orderId']] = order
+            self.working[order['orderId']] = order
+            self._match_working(self.clock())
+            return self._public(order)
+
+    def cancel_order(self, order_id):
+        with self._lock:
+            self._advance()
+            order = self.working.pop(order_id, None)
+            if order is None:
+                return None
+            order['status'] = 'cancelled'
+            return self._public(order)
+
+    def list_orders(self, status=None):
+        with self._lock:
+            self._advance()
+            return [self._public(o) for o in self.orders.values() if status is None or o['status'] == status]
+
+    def account(self):
+        with self._lock:
+            self._advance()
+            positions = []
+            for symbol, qty in self.positions.items():
+                if qty:
+                    positions.append({'symbol': symbol, 'quantity': qty,
+                                      'marketValue': round(qty * float(self.last[self.index[symbol]]), 2)})
+            equity = self.cash + sum(p['marketValue'] for p in positions)
+            return {'accountId': 'MOCK-0001', 'cash': round(self.cash, 2), 'buyingPower': round(self.cash, 2),
+                    'equity': round(equity, 2), 'positions': positions}
+
+    @staticmethod
+    def _public(order):
+        return {k: v for k, v in order.items() if not k.startswith('_')}
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'  # keep-alive, needed for high request rates
+    server_version = 'MockBroker/1.0'
+    disable_nagle_algorithm = True  # headers and body go out as separate writes
+
+    def log_message(self, format, *args):
+        pass
+
+    def _reply(self, status, body=None, headers=None):
+        payload = json.dumps(body).encode('utf-8') if body is not None else b''
+        self.send_response(status)
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def _read_body(self):
+        length = int(self.headers.get('Content-Length') or 0)
+        return self.rfile.read(length) if length else b''
+
+    def _authorized(self):
+        auth = self.headers.get('Authorization', '')
+        token = auth[7:] if auth.startswith('Bearer ') else None
+        if token and self.server.exchange.check_token(token):
+            return True
+        self._reply(401, {'error': 'invalid_token'})
+        return False
+
+    def _dispatch(self, method):
+        exchange = self.server.exchange
+        exchange.count_request()
+        if self.server.latency:
+            time.sleep(self.server.latency)
+        url = urlparse(self.path)
+        parts = [p for p in url.path.split('/') if p]
+        body = self._read_body()
+
+        if method == 'POST' and parts == ['token']:
+            form = {k: v[0] for k, v in parse_qs(body.decode('utf-8')).items()}
+            token = exchange.issue_token(form)
+            return self._reply(200, token) if token else self._reply(400, {'error': 'invalid_grant'})
+        if not parts or parts[0] != 'v1':
+            return self._reply(404, {'error': 'not_found'})
+        retry_after = self.server.admit()
+        if retry_after:
+            exchange.count_throttled()
+            return self._reply(429, {'error': 'rate_limited'}, {'Retry-After': f"{retry_after:.3f}"})
+        if not self._authorized():
+            return
+        parts = parts[1:]
+
+        if method == 'GET' and parts == ['accounts']:
+            return self._reply(200, exchange.account())
+        if parts == ['orders'] and method == 'POST':
+            try:
+                order = exchange.place_order(json.loads(body or b'{}'))
+            except ValueError:
+                order = None
+            return self._reply(201, order) if order else self._reply(400, {'error': 'invalid_order'})
+        if parts == ['orders'] and method == 'GET':
+            status = parse_qs(url.query).get('status', [None])[0]
+            return self._reply(200, exchange.list_orders(status))
+        if len(parts) == 2 and parts[0] == 'orders' and method == 'DELETE':
+            order = exchange.cancel_order(parts[1])
+            return self._reply(200, order) if order else self._reply(409, {'error': 'not_cancellable'})
+        if len(parts) == 3 and parts[0] == 'marketdata' and parts[2] == 'quotes' and method == 'GET':
+            quote = exchange.quote(parts[1])
+            return self._reply(200, quote) if quote else self._reply(404, {'error': 'unknown_symbol'})
+        return self._reply(404, {'error': 'not_found'})
+
+    def do_GET(self):
+        self._dispatch('GET')
+
+    def do_POST(self):
+        self._dispatch('POST')
+
+    def do_DELETE(self):
+        self._dispatch('DELETE')
+
+
+class MockBrokerServer:
+    """
+    Runs a MockExchange behind a threaded HTTP server on localhost.
+    Use as a context manager or call start()/stop().
+    """
+
+    def __init__(self, exchange=None, host='127.0.0.1', port=0, latency_ms=0, rate_limit=None, **exchange_kwargs):
+        self.exchange = exchange or MockExchange(**exchange_kwargs)
+        self.httpd = ThreadingHTTPServer((host, port), _Handler)
+        self.httpd.daemon_threads = True
+        self.httpd.exchange = self.exchange
+        self.httpd.latency = latency_ms / 1000.0
+        self.httpd.admit = self._admit
+        self.rate_limit = rate_limit  # /v1 requests per second (bursts of the same size), None for unlimited
+        self._allowance = rate_limit or 0.0
+        self._allowance_at = time.monotonic()
+        self._admit_lock = threading.Lock()
+        self._thread = None
+
+    def _admit(self):
+        """0 if a request may proceed under rate_limit, else seconds until one may"""
+        if not self.rate_limit:
+            return 0
+        with self._admit_lock:
+            now = time.monotonic()
+            self._allowance = min(self.rate_limit, self._allowance + (now - self._allowance_at) * self.rate_limit)
+            self._allowance_at = now
+            if self._allowance >= 1:
+                self._allowance -= 1
+                return 0
+            return (1 - self._allowance) / self.rate_limit
+
+    @property
+    def url(self):
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    @property
+    def base_url(self):
+        return f"{self.url}/v1"
+
+    def api(self, authenticate=True, **kwargs):
+        """
+        A FidelityAPI client pointed at this server (kwargs go to FidelityAPI;
+        no client-side rate limit unless rate_limit is given)
+        """
+        from fidelity_api import FidelityAPI
+        kwargs.setdefault('rate_limit', None)
+        api = FidelityAPI(base_url=self.base_url, oauth_url=self.url, **kwargs)
+        if authenticate:
+            api.authenticate('mock-client', 'mock-secret', 'http://localhost/callback', 'mock-code')
+        return api
+
+    def start(self):
+        self._thread = threading.Thread(target=self.httpd.serve_forever, name='MockBroker', daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+        if self._thread is not None:
+            self._thread.join()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc, tb):
+        self.stop()
+
+
+def _load_worker(url, symbols, n_requests, order_every, seed, results):
+    from fidelity_api import FidelityAPI
+    api = FidelityAPI(base_url=f"{url}/v1", oauth_url=url, quote_ttl=0, rate_limit=None)  # every quote hits the server
+    api.authenticate('mock-client', 'mock-secret', 'http://localhost/callback', 'mock-code')
+    rng = np.random.default_rng(seed)
+    latencies = np.empty(n_requests)
+    started = time.time()
+    for k in range(n_requests):
+        symbol = symbols[int(rng.integers(len(symbols)))]
+        t0 = time.perf_counter()
+        if k % order_every == 0:
+            api.place_order(symbol, 1, 'buy', 'market')
+        else:
+            api.get_market_data(symbol)
+        latencies[k] = time.perf_counter() - t0
+    results.put((started, time.time(), latencies))
+
+
+def run_load_test(server, n_requests=10000, concurrency=8, order_every=10):
+    """
+    Hammer the server through FidelityAPI clients running in `concurrency`
+    separate processes (so the client side does not share the server's GIL):
+    mostly quotes, with a market order every `order_every` requests.
+    Returns (requests_per_second, p50_ms, p99_ms).
+    """
+    import multiprocessing as mp
+    ctx = mp.get_context('spawn')
+    results = ctx.Queue()
+    per_worker = n_requests // concurrency
+    workers = [ctx.Process(target=_load_worker,
+                           args=(server.url, server.exchange.symbols, per_worker, order_every, seed, results))
+               for seed in range(concurrency)]
+    for w in workers:
+        w.start()
+    # Throughput is measured over the window where workers were sending, not process startup
+    runs = [results.get() for _ in workers]
+    for w in workers:
+        w.join()
+    elapsed = max(r[1] for r in runs) - min(r[0] for r in runs)
+    latencies = np.concatenate([r[2] for r in runs]) * 1000
+    return len(latencies) / elapsed, float(np.percentile(latencies, 50)), float(np.percentile(latencies, 99))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Local mock broker for TradeBot")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--symbols', type=int, default=len(CUSTOM_TICKERS), help="universe size")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--volatility', type=float, default=0.02, help="daily volatility of the random walk")
+    parser.add_argument('--time-scale', type=float, default=1.0, help="simulated seconds per wall second")
+    parser.add_argument('--latency-ms', type=float, default=0, help="added latency per request")
+    parser.add_argument('--fill-latency-ms', type=float, default=0, help="delay before orders can fill")
+    parser.add_argument('--bench', type=int, default=0, help="run a load test with N requests and exit")
+    parser.add_argument('--concurrency', type=int, default=8)
+    args = parser.parse_args()
+
+    server = MockBrokerServer(host=args.host, port=0 if args.bench else args.port, latency_ms=args.latency_ms,
+                              n_symbols=args.symbols, seed=args.seed, daily_volatility=args.volatility,
+                              time_scale=args.time_scale, fill_latency_ms=args.fill_latency_ms)
+    if args.bench:
+        with server:
+            rps, p50, p99 = run_load_test(server, args.bench, args.concurrency)
+        print(f"{args.bench} requests over {args.concurrency} connections: {rps:,.0f} req/s, "
+              f"p50 {p50:.2f}ms, p99 {p99:.2f}ms")
+        return
+    print(f"Mock broker serving {len(server.exchange.symbols)} symbols on {server.url}")
+    print(f"  export DEMO_MODE=false FIDELITY_BASE_URL={server.base_url} FIDELITY_OAUTH_URL={server.url}"
+          f" FIDELITY_AUTH_CODE=mock")
+    try:
+        server.httpd.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.httpd.server_close()
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,231 @@
+#!/usr/bin/env python3
+"""
+Evaluate many strategy variants in one pass over the data.
+
+Each session's features are built once and shared by every variant: the bar
+dicts, the regime detected on the previous session, technical signals per
+ticker (bar-only or with a close-price history), ticker selections and the
+close history itself. Features are computed lazily and cached for the session,
+so a feature only costs something if at least one variant uses it. Each variant
+then only pays for its own decisions and keeps its own ledger (accumulated
+profit feeding its daily funds) and trade sink.
+
+The 'adaptive' variant reproduces run_backtest() exactly.
+
+Usage:
+  python multi_backtest.py 2024
+"""
+
+import sys
+
+from backtest import align_bars, download_data
+from config import CUSTOM_TICKERS, FUNDS
+from cost_model import DEFAULT_COST_MODEL
+from strategy import (detect_market_regime, plan_entry_exit, select_custom_tickers, select_tickers_adaptive,
+                      technical_signals)
+from trade_plan import TechnicalAnalysis
+
+SELECTIONS = ('custom', 'select_custom', 'adaptive')
+TECHNICAL_MODES = ('none', 'bar', 'history')
+HISTORY_SESSIONS = 40  # enough closes for MACD's 26-period slow EMA
+
+
+class Variant:
+    """
+    One strategy configuration.
+
+    selection: 'custom' (CUSTOM_TICKERS seen the previous session, first
+               max_tickers - the run_backtest path), 'select_custom'
+               (select_custom_tickers) or 'adaptive' (select_tickers_adaptive)
+    regime:    'detect' to use the detected regime, or a fixed regime name
+               ('normal' reproduces the legacy decide_entry_exit wrapper)
+    technical: 'bar' (signals from the day's bar, as run_backtest), 'none'
+               (neutral signals, no technical adjustments) or 'history' (full
+               indicator set over the last HISTORY_SESSIONS closes, also used
+               for the adaptive selection's technical bonus)
+    """
+
+    def __init__(self, name, selection='custom', regime='detect', technical='bar', max_tickers=12):
+        if selection not in SELECTIONS:
+            raise ValueError(f"Unknown selection '{selection}' (expected one of {', '.join(SELECTIONS)})")
+        if technical not in TECHNICAL_MODES:
+            raise ValueError(f"Unknown technical mode '{technical}' (expected one of {', '.join(TECHNICAL_MODES)})")
+        self.name = name
+        self.selection = selection
+        self.regime = regime
+        self.technical = technical
+        self.max_tickers = max_tickers
+
+    def __repr__(self):
+        return (f"Variant({self.name!r}, selection={self.selection!r}, regime={self.regime!r}, "
+                f"technical={self.technical!r})")
+
+
+DEFAULT_VARIANTS = [
+    Variant('adaptive'),
+    Variant('select_custom', selection='select_custom'),
+    Variant('legacy_normal', regime='normal'),
+    Variant('no_technical', technical='none'),
+    Variant('history_technical', technical='history'),
+    Variant('adaptive_selection', selection='adaptive'),
+    Variant('adaptive_selection_history', selection='adaptive', technical='history'),
+]
+
+NEUTRAL = TechnicalAnalysis()
+
+
+class SessionFeatures:
+    """Lazily computed, shared features of one session"""
+
+    def __init__(self, i, day_data, prev_day_data, tickers, closes, symbol_index=None):
+        self.i = i
+        self.day_data = day_data
+        self.prev_day_data = prev_day_data
+        self.regime = detect_market_regime(prev_day_data)
+        self._column = {t: j for j, t in enumerate(tickers)}
+        self._closes = closes
+        self._symbol_index = symbol_index
+        self._history = {}
+        self._technical = {}
+        self._selection = {}
+
+    def history(self, ticker):
+        """Closes of up to HISTORY_SESSIONS sessions before this one"""
+        prices = self._history.get(ticker)
+        if prices is None:
+            window = self._closes[max(0, self.i - HISTORY_SESSIONS):self.i, self._column[ticker]]
+            prices = self._history[ticker] = [p for p in window.tolist() if p == p]
+        return prices
+
+    def technical(self, ticker, mode):
+        if mode == 'none':
+            return NEUTRAL
+        key = (ticker, mode)
+        signals = self._technical.get(key)
+        if signals is None:
+            history = self.history(ticker) if mode == 'history' else None
+            signals = self._technical[key] = technical_signals(self.day_data[ticker], history)
+        return signals
+
+    def selection(self, variant, regime):
+        key = (variant.selection, regime, variant.technical == 'history', variant.max_tickers)
+        selected = self._selection.get(key)
+        if selected is None:
+            prev = self.prev_day_data
+            if variant.selection == 'custom':
+                selected = [t for t in CUSTOM_TICKERS if t in prev][:variant.max_tickers]
+            elif variant.selection == 'select_custom':
+                selected = select_custom_tickers(prev)
+            else:
+                history = {t: self.history(t) for t in prev} if variant.technical == 'history' else None
+                selected = select_tickers_adaptive(prev, market_regime=regime, historical_data=history,
+                                                   symbol_index=self._symbol_index)
+            self._selection[key] = selected
+        return selected
+
+
+class Ledger:
+    """Per-variant running state"""
+
+    def __init__(self, variant, funds, sink, cost_model=None):
+        self.variant = variant
+        self.funds = funds
+        self.total_profit = 0
+        self.sink = sink
+        self.cost_model = cost_model
+
+
+def simulate_variant_day(date_str, features, ledger):
+    """One session for one variant (same rules as backtest.simulate_day). Returns its trades."""
+    variant = ledger.variant
+    regime = features.regime if variant.regime == 'detect' else variant.regime
+    selected = features.selection(variant, regime)
+    min_tickers = max(5, len(selected))
+    daily_funds = ledger.funds + ledger.total_profit
+    day_data = features.day_data
+
+    trades = []
+    for ticker in selected:
+        if ticker in day_data:
+            history = features.history(ticker) if variant.technical == 'history' else None
+            plan = plan_entry_exit(day_data[ticker], daily_funds, min_tickers, regime, history,
+                                   technical=features.technical(ticker, variant.technical))
+            plan.date = date_str
+            plan.ticker = ticker
+            trades.append(plan)
+    if ledger.cost_model is not None and trades:
+        profits = ledger.cost_model.apply(trades, [day_data[t.ticker]['volume'] for t in trades])
+    else:
+        profits = [t.expected_profit for t in trades]
+    for profit in profits:
+        if profit and profit != 0:
+            ledger.total_profit += profit
+    return trades
+
+
+def run_variants(variants, tickers, start, end, initial_funds=25000, data=None, symbol_index=None, sinks=None,
+                 cost_model=DEFAULT_COST_MODEL):
+    """
+    Backtest every variant over the same sessions in a single pass. `sinks`
+    maps variant name -> trade sink (default: a DataFrameSink each); every
+    variant is costed with `cost_model` as in run_backtest(). Returns
+    {variant name: sink.close() result}.
+    """
+    from symbol_index import load_symbol_index
+    from trade_sinks import DataFrameSink
+    from trading_calendar import sessions
+    from backtest import build_day_data
+
+    names = [v.name for v in variants]
+    if len(set(names)) != len(names):
+        raise ValueError("Variant names must be unique")
+    if data is None:
+        data = download_data(tickers, start, end)
+    if symbol_index is None:
+        symbol_index = load_symbol_index()
+    sinks = sinks or {}
+    ledgers = [Ledger(v, initial_funds, sinks.get(v.name) or DataFrameSink(), cost_model) for v in variants]
+
+    sectors = {ticker: symbol_index.sector_of(ticker) for ticker in data}
+    index = sessions(start, end)
+    tickers_in_data, bars = align_bars(data, index)
+    closes = bars[:, :, 3]
+
+    prev_day_data = None
+    for i, date_str in enumerate(index.strftime('%Y-%m-%d')):
+        day_data = build_day_data(tickers_in_data, sectors, bars[i])
+        if day_data and prev_day_data is not None:
+            features = SessionFeatures(i, day_data, prev_day_data, tickers_in_data, closes, symbol_index)
+            for ledger in ledgers:
+                trades = simulate_variant_day(date_str, features, ledger)
+                if trades:
+                    ledger.sink.write(trades)
+        prev_day_data = day_data
+    return {ledger.variant.name: ledger.sink.close() for ledger in ledgers}
+
+
+def compare(results):
+    """Summary table (DataFrame) of run_variants() DataFrame results"""
+    import pandas as pd
+    rows = []
+    for name, df in results.items():
+        traded = df[df['shares'] > 0] if len(df) else df
+        daily = df.groupby('date')['expected_profit'].sum() if len(df) else pd.Series(dtype=float)
+        rows.append({
+            'variant': name,
+            'trades': len(traded),
+            'total_profit': round(df['expected_profit'].sum(), 2) if len(df) else 0.0,
+            'net_profit': round(df['net_profit'].sum(), 2) if 'net_profit' in df else
+                          round(df['expected_profit'].sum(), 2) if len(df) else 0.0,
+            'win_rate': round((traded['expected_profit'] > 0).mean() * 100, 1) if len(traded) else 0.0,
+            'avg_daily_profit': round(daily.mean(), 2) if len(daily) else 0.0,
+            'positive_days': int((daily > 0).sum()),
+        })
+    return pd.DataFrame(rows).set_index('variant')
+
+
+if __name__ == "__main__":
+    year = int(sys.argv[1]) if len(sys.argv) > 1 else 2024
+    print(f"Running {len(DEFAULT_VARIANTS)} strategy variants over {year} in one pass")
+    results = run_variants(DEFAULT_VARIANTS, CUSTOM_TICKERS, f'{year}-01-01', f'{year}-12-31', FUNDS)
+    print(compare(results).to_string())
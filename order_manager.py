@@ -0,0 +1,377 @@
+# Order management for live trading
+#
+# Keeps an indexed table of every order the bot sends (by client id, broker id,
+# symbol and state), submits queued orders in concurrent batches, reconciles
+# fills by polling or by pushed updates, and cancel-and-replaces protective
+# stops when the trailing stop moves.
+#
+# The broker client only needs place_order / cancel_order / get_orders with the
+# FidelityAPI signatures. Order payloads are expected to look like:
+#   {"orderId": ..., "clientOrderId": ..., "status": "working" | "partially_filled" |
+#    "filled" | "cancelled" | "rejected", "filledQuantity": n, "avgFillPrice": p}
+
+import itertools
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+PENDING_NEW = 'pending_new'
+WORKING = 'working'
+PARTIALLY_FILLED = 'partially_filled'
+FILLED = 'filled'
+PENDING_CANCEL = 'pending_cancel'
+CANCELLED = 'cancelled'
+REJECTED = 'rejected'
+
+ORDER_STATES = (PENDING_NEW, WORKING, PARTIALLY_FILLED, FILLED, PENDING_CANCEL, CANCELLED, REJECTED)
+OPEN_STATES = (PENDING_NEW, WORKING, PARTIALLY_FILLED, PENDING_CANCEL)
+
+
+class Order:
+    """A single order as tracked by the OrderManager"""
+
+    def __init__(self, client_id, symbol, qty, side, order_type='market', price=None, stop_price=None, tag=None):
+        self.client_id = client_id
+        self.symbol = symbol
+        self.qty = qty
+        self.side = side
+        self.order_type = order_type
+        self.price = price
+        self.stop_price = stop_price
+        self.tag = tag  # 'entry', 'stop', ...
+        self.state = PENDING_NEW
+        self.broker_id = None
+        self.filled_qty = 0
+        self.avg_fill_price = None
+        self.replaces = None      # client id of the order this one replaced
+        self.replaced_by = None   # client id of the order that replaced this one
+        self.created_at = time.time()
+        self.updated_at = self.created_at
+
+    @property
+    def is_open(self):
+        return self.state in OPEN_STATES
+
+    @property
+    def remaining_qty(self):
+        return self.qty - self.filled_qty
+
+    def to_dict(self):
+        return {
+            'client_id': self.client_id,
+            'broker_id': self.broker_id,
+            'symbol': self.symbol,
+            'qty': self.qty,
+            'side': self.side,
+            'type': self.order_type,
+            'price': self.price,
+            'stop_price': self.stop_price,
+            'tag': self.tag,
+            'state': self.state,
+            'filled_qty': self.filled_qty,
+            'avg_fill_price': self.avg_fill_price,
+            'replaces': self.replaces,
+            'replaced_by': self.replaced_by,
+        }
+
+    def __repr__(self):
+        return (f"Order({self.client_id} {self.side} {self.qty} {self.symbol} {self.order_type}"
+                f" state={self.state} filled={self.filled_qty})")
+
+
+class OrderManager:
+    """
+    In-flight order tracking and batched submission.
+
+    All lookups (by client id, broker id, symbol, state) are dict based and O(1);
+    per-symbol and per-state indexes are insertion-ordered dicts used as sets.
+    """
+
+    def __init__(self, api, batch_size=20, max_workers=8, id_prefix='tb', clock=time.monotonic, sleep=time.sleep):
+        self.api = api
+        self.batch_size = batch_size
+        self.max_workers = max_workers
+        self.id_prefix = id_prefix
+        self.clock = clock
+        self.sleep = sleep
+        self._ids = itertools.count(1)
+        self._lock = threading.RLock()
+        self._executor = None
+
+        self._orders = {}        # client_id -> Order
+        self._by_broker_id = {}  # broker_id -> Order
+        self._by_symbol = {}     # symbol -> {client_id: Order}
+        self._by_state = {state: {} for state in ORDER_STATES}
+        self._queue = {}         # client_id -> Order awaiting submission
+        self._stops = {}         # symbol -> client_id of the current protective stop
+        self._armed_stops = {}   # entry client_id -> stop price to place once the entry fills
+
+    # --- Lookups ---
+
+    def get(self, client_id):
+        return self._orders.get(client_id)
+
+    def get_by_broker_id(self, broker_id):
+        return self._by_broker_id.get(broker_id)
+
+    def orders_for(self, symbol, open_only=False):
+        orders = list(self._by_symbol.get(symbol, {}).values())
+        return [o for o in orders if o.is_open] if open_only else orders
+
+    def orders_in(self, state):
+        return list(self._by_state[state].values())
+
+    def open_orders(self):
+        return [o for state in OPEN_STATES for o in self._by_state[state].values()]
+
+    def working_stop(self, symbol):
+        client_id = self._stops.get(symbol)
+        order = self._orders.get(client_id)
+        return order if order is not None and order.is_open else None
+
+    def position(self, symbol):
+        """Net filled shares for a symbol"""
+        net = 0
+        for order in self._by_symbol.get(symbol, {}).values():
+            net += order.filled_qty if order.side == 'buy' else -order.filled_qty
+        return net
+
+    def counts(self):
+        return {state: len(orders) for state, orders in self._by_state.items()}
+
+    # --- Order entry ---
+
+    def new_order(self, symbol, qty, side, order_type='market', price=None, stop_price=None, tag=None):
+        """Queue an order for the next submit_pending() call"""
+        with self._lock:
+            client_id = f"{self.id_prefix}-{next(self._ids)}"
+            order = Order(client_id, symbol, qty, side, order_type, price, stop_price, tag)
+            self._orders[client_id] = order
+            self._by_symbol.setdefault(symbol, {})[client_id] = order
+            self._by_state[PENDING_NEW][client_id] = order
+            self._queue[client_id] = order
+            if tag == 'stop':
+                self._stops[symbol] = client_id
+            return order
+
+    def place_trade_plan(self, symbol, trade_plan):
+        """
+        Queue a market entry for a decide_entry_exit_adaptive() plan. The
+        protective stop at plan['stop_loss'] is armed and sent once the entry fills.
+        """
+        shares = trade_plan.get('shares') or 0
+        if shares <= 0 or trade_plan.get('exit') is None:
+            return None
+        entry = self.new_order(symbol, shares, 'buy', 'market', tag='entry')
+        if trade_plan.get('stop_loss'):
+            self._armed_stops[entry.client_id] = trade_plan['stop_loss']
+        return entry
+
+    def submit_pending(self):
+        """
+        Submit queued orders in batches of batch_size. Pacing is left to the
+        broker client (FidelityAPI's shared PriorityRateLimiter, in which
+        protective stops and cancels go ahead of new orders).
+        """
+        with self._lock:
+            # Restored orders that reconcile() found at the broker are no longer pending_new
+            queued = [o for o in self._queue.values() if o.state == PENDING_NEW]
+            self._queue.clear()
+        submitted = []
+        for start in range(0, len(queued), self.batch_size):
+            batch = queued[start:start + self.batch_size]
+            submitted.extend(self._submit_batch(batch))
+        # Stops armed by fills that arrived during submission go out right away
+        if self._queue:
+            submitted.extend(self.submit_pending())
+        return submitted
+
+    def _submit_batch(self, batch):
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix='OrderManager')
+        futures = []
+        for order in batch:
+            futures.append((order, self._executor.submit(self._send, order)))
+        for order, future in futures:
+            try:
+                response = future.result()
+            except Exception as e:
+                print(f"[OrderManager] Failed to submit {order.client_id}: {e}")
+                response = None
+            with self._lock:
+                if response is None:
+                    self._set_state(order, REJECTED)
+                else:
+                    self._apply_update(order, response, default_state=WORKING)
+        return batch
+
+    def _send(self, order):
+        return self.api.place_order(order.symbol, order.qty, order.side, order.order_type,
+                                    price=order.price, stop_price=order.stop_price,
+                                    client_order_id=order.client_id)
+
+    # --- Cancel / replace ---
+
+    def cancel(self, client_id):
+        """Cancel an order. Returns True if it is no longer working."""
+        with self._lock:
+            order = self._orders.get(client_id)
+            if order is None or not order.is_open:
+                return False
+            if order.state == PENDING_NEW:
+                self._queue.pop(client_id, None)
+                self._set_state(order, CANCELLED)
+                return True
+            self._set_state(order, PENDING_CANCEL)
+        response = self.api.cancel_order(order.broker_id)
+        with self._lock:
+            if response is None:
+                # Broker refused (usually already filled); let reconcile() settle it
+                self._set_state(order, WORKING if order.filled_qty == 0 else PARTIALLY_FILLED)
+                return False
+            self._apply_update(order, response, default_state=CANCELLED)
+            return order.state == CANCELLED
+
+    def update_stop(self, symbol, new_stop):
+        """
+        Move the protective stop for a symbol up to `new_stop` (e.g. the trailing
+        level from decide_entry_exit_adaptive) by cancel-and-replace. Stops only
+        ever ratchet up; returns the replacement Order or None if nothing changed.
+        """
+        new_stop = round(new_stop, 2)
+        with self._lock:
+            old = self.working_stop(symbol)
+            if old is None or new_stop <= old.stop_price:
+                return None
+            if old.state == PENDING_NEW:
+                old.stop_price = new_stop
+                return old
+        if not self.cancel(old.client_id):
+            return None
+        with self._lock:
+            if old.remaining_qty <= 0:
+                return None
+            replacement = self.new_order(symbol, old.remaining_qty, old.side, 'stop',
+                                         stop_price=new_stop, tag='stop')
+            replacement.replaces = old.client_id
+            old.replaced_by = replacement.client_id
+            self._queue.pop(replacement.client_id)
+        self._submit_batch([replacement])
+        return replacement
+
+    # --- Fill reconciliation ---
+
+    def on_order_update(self, update):
+        """Apply a pushed broker order update (callback path)"""
+        with self._lock:
+            order = (self._by_broker_id.get(update.get('orderId'))
+                     or self._orders.get(update.get('clientOrderId')))
+            if order is None:
+                return None
+            self._apply_update(order, update)
+            return order
+
+    def reconcile(self):
+        """Poll the broker for open orders' status and apply any changes"""
+        if not self.open_orders():
+            return 0
+        response = self.api.get_orders()
+        if response is None:
+            return 0
+        updates = response.get('orders', []) if isinstance(response, dict) else response
+        applied = 0
+        for update in updates:
+            if self.on_order_update(update) is not None:
+                applied += 1
+        return applied
+
+    def await_entries(self, timeout=30.0, interval=0.5):
+        """
+        Reconcile every `interval` seconds until no entry is open (or `timeout`
+        passes), sending each protective stop as its entry fills. Returns the
+        entries still open, which have no stop at the broker yet.
+        """
+        deadline = self.clock() + timeout
+        while True:
+            self.reconcile()
+            self.submit_pending()
+            waiting = [o for o in self.open_orders() if o.tag == 'entry']
+            if not waiting or self.clock() >= deadline:
+                return waiting
+            self.sleep(interval)
+
+    # --- Snapshot / restore ---
+
+    def snapshot(self):
+        """Every order and armed stop, as plain data for restore()"""
+        with self._lock:
+            orders = [dict(o.to_dict(), created_at=o.created_at, updated_at=o.updated_at)
+                      for o in self._orders.values()]
+            return {'orders': orders, 'armed_stops': dict(self._armed_stops)}
+
+    def restore(self, state):
+        """
+        Load a snapshot() into this (empty) manager. Orders that were still
+        pending_new are queued again: call reconcile() first so any that did
+        reach the broker are matched by client id instead of sent twice.
+        """
+        with self._lock:
+            last_id = 0
+            for d in state['orders']:
+                order = Order(d['client_id'], d['symbol'], d['qty'], d['side'], d['type'], d['price'],
+                              d['stop_price'], d['tag'])
+                order.state = d['state']
+                order.broker_id = d['broker_id']
+                order.filled_qty = d['filled_qty']
+                order.avg_fill_price = d['avg_fill_price']
+                order.replaces = d['replaces']
+                order.replaced_by = d['replaced_by']
+                order.created_at = d['created_at']
+                order.updated_at = d['updated_at']
+                self._orders[order.client_id] = order
+                if order.broker_id is not None:
+                    self._by_broker_id[order.broker_id] = order
+                self._by_symbol.setdefault(order.symbol, {})[order.client_id] = order
+                self._by_state[order.state][order.client_id] = order
+                if order.state == PENDING_NEW:
+                    self._queue[order.client_id] = order
+                if order.tag == 'stop':
+                    self._stops[order.symbol] = order.client_id
+                prefix, _, number = order.client_id.rpartition('-')
+                if prefix == self.id_prefix and number.isdigit():
+                    last_id = max(last_id, int(number))
+            self._armed_stops.update(state['armed_stops'])
+            self._ids = itertools.count(last_id + 1)
+
+    def _apply_update(self, order, update, default_state=None):
+        if update.get('orderId') is not None and order.broker_id is None:
+            order.broker_id = update['orderId']
+            self._by_broker_id[order.broker_id] = order
+        filled = update.get('filledQuantity')
+        if filled is not None and filled >= order.filled_qty:
+            order.filled_qty = filled
+            if update.get('avgFillPrice') is not None:
+                order.avg_fill_price = update['avgFillPrice']
+        state = update.get('status', default_state)
+        if order.state == PENDING_CANCEL and state in (WORKING, PARTIALLY_FILLED):
+            state = None  # stale status from before our cancel went out
+        if state in ORDER_STATES and order.state not in (FILLED, CANCELLED, REJECTED):
+            self._set_state(order, state)
+        # A filled entry (or the filled part of a cancelled one) gets its protective stop
+        if (order.state in (FILLED, CANCELLED) and order.filled_qty > 0
+                and order.client_id in self._armed_stops):
+            stop_price = self._armed_stops.pop(order.client_id)
+            self.new_order(order.symbol, order.filled_qty, 'sell', 'stop', stop_price=stop_price, tag='stop')
+
+    def _set_state(self, order, state):
+        if order.state == state:
+            return
+        del self._by_state[order.state][order.client_id]
+        self._by_state[state][order.client_id] = order
+        order.state = state
+        order.updated_at = time.time()
+
+    def close(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=True)
+            self._executor = None
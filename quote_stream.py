@@ -0,0 +1,562 @@
+#!/usr/bin/env python3
+"""
+Streaming quotes over one persistent WebSocket connection.
+
+Instead of one REST poll per symbol (FidelityAPI.get_market_data), QuoteStream
+subscribes to any number of symbols on a single connection and a background
+thread decodes pushed updates straight into a QuoteBook: preallocated
+per-symbol arrays holding the latest bid/ask/last/volume, so reading a price
+is an array lookup and a quote is usable as soon as it arrives. The client
+pings every `ping_interval` seconds and treats a connection on which no frame
+(quote or pong) arrived for `read_timeout` seconds as dead, so a half-open
+connection is noticed too. Dropped connections are retried with exponential
+backoff and every subscribed symbol is resubscribed. A message that fails to
+decode or whose on_quotes callback raises is logged and skipped.
+
+Protocol (JSON text frames):
+  client -> {"action": "subscribe" | "unsubscribe", "symbols": [...]}
+  server -> {"type": "quotes", "quotes": [[symbol, bid, ask, last, volume, time], ...]}
+
+The WebSocket framing (RFC 6455, text/ping/pong/close, ws:// and wss://) is
+implemented on the standard library so the live path has no new dependency.
+QuoteReplayServer is a local stand-in feed that replays a tape of quotes.
+
+Usage:
+  python quote_stream.py --symbols 500 --port 8766    # serve a random-walk tape
+"""
+
+import base64
+import hashlib
+import json
+import os
+import socket
+import socketserver
+import struct
+import sys
+import threading
+import time
+import traceback
+from urllib.parse import urlparse
+
+WS_GUID = '258EAFA5-E914-47DA-95CA-C5AB0DC85B11'
+OP_CONT, OP_TEXT, OP_BINARY, OP_CLOSE, OP_PING, OP_PONG = 0x0, 0x1, 0x2, 0x8, 0x9, 0xA
+
+
+# --- WebSocket framing ---
+
+def _accept_key(key):
+    return base64.b64encode(hashlib.sha1((key + WS_GUID).encode('ascii')).digest()).decode('ascii')
+
+
+def _send_frame(sock, opcode, payload, mask):
+    """One unfragmented frame; clients must mask, servers must not"""
+    header = bytearray([0x80 | opcode])
+    length = len(payload)
+    mask_bit = 0x80 if mask else 0
+    if length < 126:
+        header.append(mask_bit | length)
+    elif length < 1 << 16:
+        header.append(mask_bit | 126)
+        header += struct.pack('!H', length)
+    else:
+        header.append(mask_bit | 127)
+        header += struct.pack('!Q', length)
+    if mask:
+        key = os.urandom(4)
+        header += key
+        # XOR with the repeated key as one big-int operation instead of per byte
+        repeated = (key * (length // 4 + 1))[:length]
+        payload = (int.from_bytes(payload, 'big') ^ int.from_bytes(repeated, 'big')).to_bytes(length, 'big')
+    sock.sendall(bytes(header) + payload)
+
+
+def _read_exact(stream, n):
+    data = stream.read(n)
+    if data is None or len(data) < n:
+        raise ConnectionError("connection closed")
+    return data
+
+
+def _recv_frame(stream):
+    """(opcode, payload, fin) of the next frame from a buffered binary stream"""
+    b0, b1 = _read_exact(stream, 2)
+    length = b1 & 0x7F
+    if length == 126:
+        length = struct.unpack('!H', _read_exact(stream, 2))[0]
+    elif length == 127:
+        length = struct.unpack('!Q', _read_exact(stream, 8))[0]
+    key = _read_exact(stream, 4) if b1 & 0x80 else None
+    payload = _read_exact(stream, length) if length else b''
+    if key:
+        repeated = (key * (length // 4 + 1))[:length]
+        payload = (int.from_bytes(payload, 'big') ^ int.from_bytes(repeated, 'big')).to_bytes(length, 'big')
+    return b0 & 0x0F, payload, bool(b0 & 0x80)
+
+
+def _recv_message(stream, sock, mask, send_lock=None):
+    """
+    Next data message (opcode, payload), answering pings and joining
+    fragments on the way. Returns (OP_CLOSE, payload) on a close frame.
+    `send_lock` guards the socket against other threads sending frames.
+    """
+    parts = []
+    message_op = None
+    while True:
+        opcode, payload, fin = _recv_frame(stream)
+        if opcode == OP_PING:
+            if send_lock is None:
+                _send_frame(sock, OP_PONG, payload, mask)
+            else:
+                with send_lock:
+                    _send_frame(sock, OP_PONG, payload, mask)
+            continue
+        if opcode == OP_PONG:
+            continue
+        if opcode == OP_CLOSE:
+            return OP_CLOSE, payload
+        if opcode != OP_CONT:
+            message_op = opcode
+        parts.append(payload)
+        if fin:
+            return message_op, b''.join(parts)
+
+
+# --- Latest-quote book ---
+
+class QuoteBook:
+    """
+    Latest quote per symbol in preallocated arrays (one slot per symbol;
+    `capacity` reserves room for later subscriptions, past which the arrays
+    are reallocated at double the size). `updates[i]` counts the quotes
+    received for slot i, so a reader can tell whether a price moved since it
+    last looked.
+    """
+
+    def __init__(self, symbols=(), capacity=None):
+        import numpy as np
+        symbols = list(dict.fromkeys(symbols))
+        self.capacity = max(capacity or 0, len(symbols))
+        self.symbols = []
+        self.index = {}
+        self._lock = threading.Lock()  # add() may reallocate while the reader thread updates
+        self.bid = np.full(self.capacity, np.nan)
+        self.ask = np.full(self.capacity, np.nan)
+        self.last = np.full(self.capacity, np.nan)
+        self.volume = np.zeros(self.capacity, dtype=np.int64)
+        self.time = np.zeros(self.capacity)       # feed timestamp of the quote
+        self.received = np.zeros(self.capacity)   # local time.time() when it was decoded
+        self.updates = np.zeros(self.capacity, dtype=np.int64)
+        self.add(symbols)
+
+    def add(self, symbols):
+        """Allocate slots for new symbols; returns the ones that were new"""
+        with self._lock:
+            new = [s for s in dict.fromkeys(symbols) if s not in self.index]
+            if len(self.symbols) + len(new) > self.capacity:
+                self._grow(max(len(self.symbols) + len(new), 2 * self.capacity))
+            for symbol in new:
+                self.index[symbol] = len(self.symbols)
+                self.symbols.append(symbol)
+            return new
+
+    def _grow(self, capacity):
+        import numpy as np
+        for name in ('bid', 'ask', 'last', 'volume', 'time', 'received', 'updates'):
+            old = getattr(self, name)
+            grown = np.full(capacity, np.nan) if name in ('bid', 'ask', 'last') else np.zeros(capacity, old.dtype)
+            grown[:len(old)] = old
+            setattr(self, name, grown)
+        self.capacity = capacity
+
+    def update(self, rows, received):
+        """Apply [symbol, bid, ask, last, volume, time] rows; unknown symbols are ignored"""
+        with self._lock:
+            index = self.index
+            bid, ask, last, volume, stamp, seen, updates = (self.bid, self.ask, self.last, self.volume, self.time,
+                                                            self.received, self.updates)
+            applied = 0
+            for symbol, b, a, p, v, t in rows:
+                i = index.get(symbol)
+                if i is None:
+                    continue
+                bid[i] = b
+                ask[i] = a
+                last[i] = p
+                volume[i] = v
+                stamp[i] = t
+                seen[i] = received
+                updates[i] += 1
+                applied += 1
+            return applied
+
+    def get(self, symbol):
+        """Latest quote as a dict (same keys as the REST quote's price fields), or None"""
+        i = self.index.get(symbol)
+        if i is None or not self.updates[i]:
+            return None
+        return {'symbol': symbol, 'bid': float(self.bid[i]), 'ask': float(self.ask[i]),
+                'last': float(self.last[i]), 'volume': int(self.volume[i]), 'timestamp': float(self.time[i])}
+
+    def ready(self, symbols=None):
+        """Whether every (given) symbol has received at least one quote"""
+        slots = [self.index[s] for s in symbols] if symbols is not None else range(len(self.symbols))
+        return all(self.updates[i] for i in slots)
+
+
+# --- Client ---
+
+class QuoteStream:
+    """
+    Background WebSocket client keeping a QuoteBook current. `token` is a
+    bearer token or a callable returning the current one (read on every
+    connect). `on_quotes`, if given, is called from the reader thread with
+    each decoded batch of rows.
+    Use as a context manager or call start()/stop().
+    """
+
+    def __init__(self, url, symbols=(), token=None, book=None, capacity=None, on_quotes=None,
+                 reconnect_delay=0.25, max_reconnect_delay=10.0, connect_timeout=5.0, ping_interval=5.0,
+                 read_timeout=15.0):
+        self.url = url
+        self.token = token
+        self.book = book if book is not None else QuoteBook(symbols, capacity)
+        self.book.add(symbols)
+        self.subscribed = list(dict.fromkeys(symbols))
+        self.on_quotes = on_quotes
+        self.reconnect_delay = reconnect_delay
+        self.max_reconnect_delay = max_reconnect_delay
+        self.connect_timeout = connect_timeout
+        self.ping_interval = ping_interval
+        self.read_timeout = read_timeout
+        self.connected = threading.Event()
+        self.messages = 0
+        self.reconnects = 0
+        self.errors = 0  # messages dropped because decoding or on_quotes raised
+        self.last_error = None
+        self._sock = None
+        self._send_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+        self._pinger = None
+
+    def _connect(self):
+        url = urlparse(self.url)
+        secure = url.scheme == 'wss'
+        port = url.port or (443 if secure else 80)
+        sock = socket.create_connection((url.hostname, port), timeout=self.connect_timeout)
+        stream = None
+        try:
+            if secure:
+                import ssl
+                sock = ssl.create_default_context().wrap_socket(sock, server_hostname=url.hostname)
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            key = base64.b64encode(os.urandom(16)).decode('ascii')
+            request = [f"GET {url.path or '/'}{'?' + url.query if url.query else ''} HTTP/1.1",
+                       f"Host: {url.netloc}", "Upgrade: websocket", "Connection: Upgrade",
+                       f"Sec-WebSocket-Key: {key}", "Sec-WebSocket-Version: 13"]
+            token = self.token() if callable(self.token) else self.token
+            if token:
+                request.append(f"Authorization: Bearer {token}")
+            sock.sendall(('\r\n'.join(request) + '\r\n\r\n').encode('ascii'))
+            stream = sock.makefile('rb')
+            status = stream.readline().decode('latin-1')
+            headers = {}
+            for line in iter(stream.readline, b'\r\n'):
+                if not line:
+                    raise ConnectionError("connection closed during handshake")
+                name, _, value = line.decode('latin-1').partition(':')
+                headers[name.strip().lower()] = value.strip()
+            if ' 101 ' not in status or headers.get('sec-websocket-accept') != _accept_key(key):
+                raise ConnectionError(f"WebSocket handshake failed: {status.strip()}")
+            # No frame (not even a pong) within read_timeout: the connection is dead
+            sock.settimeout(self.read_timeout)
+            return sock, stream
+        except BaseException:
+            # Every failed attempt of the reconnect loop would otherwise leak a descriptor
+            if stream is not None:
+                stream.close()
+            sock.close()
+            raise
+
+    def _send(self, message):
+        with self._send_lock:
+            if self._sock is not None:
+                _send_frame(self._sock, OP_TEXT, json.dumps(message).encode('utf-8'), mask=True)
+
+    def _run(self):
+        delay = self.reconnect_delay
+        while not self._stop.is_set():
+            sock = None
+            try:
+                sock, stream = self._connect()
+                with self._send_lock:
+                    self._sock = sock
+                if self.subscribed:
+                    self._send({'action': 'subscribe', 'symbols': self.subscribed})
+                self.connected.set()
+                delay = self.reconnect_delay
+                self._read(sock, stream)
+            except (OSError, ConnectionError, ValueError) as e:
+                self.last_error = e
+            except Exception as e:
+                self.last_error = e
+                print(f"[QuoteStream] Reader failed, reconnecting: {e!r}")
+                traceback.print_exc()
+            finally:
+                self.connected.clear()
+                with self._send_lock:
+                    self._sock = None
+                if sock is not None:
+                    sock.close()
+            if self._stop.wait(delay):
+                break
+            self.reconnects += 1
+            delay = min(delay * 2, self.max_reconnect_delay)
+
+    def _read(self, sock, stream):
+        book = self.book
+        loads = json.loads
+        while not self._stop.is_set():
+            opcode, payload = _recv_message(stream, sock, mask=True, send_lock=self._send_lock)
+            if opcode == OP_CLOSE:
+                raise ConnectionError("closed by server")
+            try:
+                message = loads(payload)
+                if message.get('type') == 'quotes':
+                    rows = message['quotes']
+                    book.update(rows, time.time())
+                    self.messages += 1
+                    if self.on_quotes is not None:
+                        self.on_quotes(rows)
+            except Exception as e:
+                self.errors += 1
+                self.last_error = e
+                print(f"[QuoteStream] Skipped a message: {e!r}")
+
+    def _ping(self):
+        while not self._stop.wait(self.ping_interval):
+            with self._send_lock:
+                if self._sock is None:
+                    continue
+                try:
+                    _send_frame(self._sock, OP_PING, b'', mask=True)
+                except OSError:
+                    pass  # the reader notices the dead connection
+
+    def subscribe(self, symbols):
+        """Add symbols (allocating book slots); sent now if connected and on every reconnect"""
+        new = [s for s in dict.fromkeys(symbols) if s not in self.subscribed]
+        self.book.add(new)
+        self.subscribed.extend(new)
+        if new:
+            self._send({'action': 'subscribe', 'symbols': new})
+
+    def unsubscribe(self, symbols):
+        symbols = set(symbols)
+        self.subscribed = [s for s in self.subscribed if s not in symbols]
+        self._send({'action': 'unsubscribe', 'symbols': sorted(symbols)})
+
+    def quote(self, symbol):
+        return self.book.get(symbol)
+
+    def wait_ready(self, symbols=None, timeout=5.0):
+        """Block until every (given) symbol has a quote; returns whether it did"""
+        deadline = time.monotonic() + timeout
+        while not self.book.ready(symbols):
+            if time.monotonic() > deadline:
+                return False
+            time.sleep(0.001)
+        return True
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name='QuoteStream', daemon=True)
+        self._thread.start()
+        if self.ping_interval:
+            self._pinger = threading.Thread(target=self._ping, name='QuoteStreamPing', daemon=True)
+            self._pinger.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        with self._send_lock:
+            sock = self._sock
+            if sock is not None:
+                try:
+                    _send_frame(sock, OP_CLOSE, struct.pack('!H', 1000), mask=True)
+                    sock.shutdown(socket.SHUT_RDWR)
+                except OSError:
+                    pass
+        if self._thread is not None:
+            self._thread.join()
+        if self._pinger is not None:
+            self._pinger.join()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc, tb):
+        self.stop()
+
+
+# --- Local replay feed ---
+
+def random_tape(symbols, ticks, seed=0, daily_volatility=0.02):
+    """
+    A tape of `ticks` rounds of quotes for every symbol (random walk, same
+    price range as mock_broker): a list of ticks, each a list of
+    (symbol, bid, ask, last, volume) rows.
+    """
+    import numpy as np
+    rng = np.random.default_rng(seed)
+    n = len(symbols)
+    start = np.exp(rng.uniform(np.log(10), np.log(500), n))
+    steps = rng.standard_normal((ticks, n)) * daily_volatility / np.sqrt(390)
+    last = (start * np.exp(np.cumsum(steps, axis=0))).round(2)
+    half = np.maximum(0.01, (last * 0.0001).round(2))
+    volume = np.cumsum(rng.poisson(100, (ticks, n)), axis=0)
+    return [list(zip(symbols, (last[t] - half[t]).round(2).tolist(), (last[t] + half[t]).round(2).tolist(),
+                     last[t].tolist(), volume[t].tolist()))
+            for t in range(ticks)]
+
+
+class _FeedHandler(socketserver.StreamRequestHandler):
+    def handle(self):
+        server = self.server
+        lines = [self.rfile.readline().decode('latin-1')]
+        while lines[-1] not in ('\r\n', ''):
+            lines.append(self.rfile.readline().decode('latin-1'))
+        headers = {k.strip().lower(): v.strip() for k, _, v in (line.partition(':') for line in lines[1:-1])}
+        key = headers.get('sec-websocket-key')
+        if not key or (server.token and headers.get('authorization') != f"Bearer {server.token}"):
+            self.wfile.write(b"HTTP/1.1 401 Unauthorized\r\nContent-Length: 0\r\n\r\n")
+            return
+        self.wfile.write((f"HTTP/1.1 101 Switching Protocols\r\nUpgrade: websocket\r\nConnection: Upgrade\r\n"
+                          f"Sec-WebSocket-Accept: {_accept_key(key)}\r\n\r\n").encode('ascii'))
+        self.request.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+
+        subscribed = set()
+        lock = threading.Lock()
+        send_lock = threading.Lock()  # tape frames and pongs share the socket
+        closed = threading.Event()
+        server.register(self.request)
+
+        def read_commands():
+            try:
+                while True:
+                    opcode, payload = _recv_message(self.rfile, self.request, mask=False, send_lock=send_lock)
+                    if opcode == OP_CLOSE:
+                        break
+                    command = json.loads(payload)
+                    with lock:
+                        if command.get('action') == 'subscribe':
+                            subscribed.update(command.get('symbols', ()))
+                        elif command.get('action') == 'unsubscribe':
+                            subscribed.difference_update(command.get('symbols', ()))
+            except (OSError, ConnectionError, ValueError):
+                pass
+            closed.set()
+
+        reader = threading.Thread(target=read_commands, daemon=True)
+        reader.start()
+        try:
+            tick = 0
+            tape = server.tape
+            while not closed.is_set() and not server.stopping.is_set():
+                if tick == len(tape):
+                    if not server.loop:
+                        break
+                    tick = 0
+                with lock:
+                    rows = [[*row, time.time()] for row in tape[tick] if row[0] in subscribed]
+                tick += 1
+                if rows:
+                    frame = json.dumps({'type': 'quotes', 'quotes': rows}).encode()
+                    with send_lock:
+                        _send_frame(self.request, OP_TEXT, frame, mask=False)
+                if server.interval:
+                    closed.wait(server.interval)
+        except OSError:
+            pass
+        finally:
+            server.unregister(self.request)
+
+
+class QuoteReplayServer:
+    """
+    Local WebSocket feed replaying a tape (see random_tape) to each client,
+    one tick every `interval` seconds, sending only the client's subscribed
+    symbols. drop_clients() cuts every connection (for reconnect tests).
+    Use as a context manager or call start()/stop().
+    """
+
+    def __init__(self, tape, host='127.0.0.1', port=0, interval=0.01, loop=True, token=None):
+        self.httpd = socketserver.ThreadingTCPServer((host, port), _FeedHandler)
+        self.httpd.daemon_threads = True
+        self.httpd.tape = tape
+        self.httpd.interval = interval
+        self.httpd.loop = loop
+        self.httpd.token = token
+        self.httpd.stopping = threading.Event()
+        self.httpd.clients = set()
+        self.httpd.register = self.httpd.clients.add
+        self.httpd.unregister = self.httpd.clients.discard
+        self._thread = None
+
+    @property
+    def url(self):
+        host, port = self.httpd.server_address[:2]
+        return f"ws://{host}:{port}/v1/marketdata/stream"
+
+    @property
+    def clients(self):
+        return len(self.httpd.clients)
+
+    def drop_clients(self):
+        for sock in list(self.httpd.clients):
+            try:
+                sock.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+
+    def start(self):
+        self._thread = threading.Thread(target=self.httpd.serve_forever, name='QuoteReplay', daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.httpd.stopping.set()
+        self.drop_clients()
+        self.httpd.shutdown()
+        self.httpd.server_close()
+        if self._thread is not None:
+            self._thread.join()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc, tb):
+        self.stop()
+
+
+def main():
+    import argparse
+    from mock_broker import make_universe
+    parser = argparse.ArgumentParser(description="Local streaming quote feed")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8766)
+    parser.add_argument('--symbols', type=int, default=22, help="universe size")
+    parser.add_argument('--ticks', type=int, default=2000, help="tape length (replayed in a loop)")
+    parser.add_argument('--interval-ms', type=float, default=100, help="time between ticks")
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+    tape = random_tape(make_universe(args.symbols), args.ticks, args.seed)
+    with QuoteReplayServer(tape, args.host, args.port, args.interval_ms / 1000) as server:
+        print(f"Streaming {args.symbols} symbols on {server.url}")
+        try:
+            threading.Event().wait()
+        except KeyboardInterrupt:
+            pass
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,102 @@
+# Client-side rate limiting for broker API calls
+#
+# One token bucket shared by every FidelityAPI call, with strict priority
+# lanes: when the bucket is empty the next token goes to the oldest request of
+# the most important waiting lane, so a burst of quote polling at the open
+# cannot delay a cancel or a protective stop. `reserve` tokens are only
+# available to the critical lane, keeping headroom for it even while lower
+# lanes drain the bucket. A 429 from the broker (throttled()) empties the
+# bucket and pauses the polling lanes for the Retry-After period.
+#
+# stats() reports per-lane request counts, current / peak queue depth and a
+# histogram of time spent waiting for a token.
+
+import itertools
+import threading
+import time
+from collections import deque
+
+CRITICAL, ORDERS, QUOTES, ACCOUNT = range(4)  # cancels and stop orders, new orders, market data, account/order info
+LANE_NAMES = ('critical', 'orders', 'quotes', 'account')
+POLLING_LANES = (QUOTES, ACCOUNT)
+WAIT_BUCKETS_MS = (1, 5, 10, 50, 100, 500, 1000)
+
+
+class PriorityRateLimiter:
+    """`rate` requests per second on average, bursts of up to `burst`"""
+
+    def __init__(self, rate, burst, reserve=0, clock=time.monotonic):
+        if reserve >= burst:
+            raise ValueError("reserve must be smaller than burst")
+        self.rate = rate
+        self.burst = burst
+        self.reserve = reserve
+        self.clock = clock
+        self.tokens = float(burst)
+        self.paused_until = 0.0  # polling lanes wait until then after a 429
+        self.throttles = 0
+        self._last = clock()
+        self._cond = threading.Condition()
+        self._tickets = itertools.count()
+        self._queues = [deque() for _ in LANE_NAMES]
+        self._requests = [0] * len(LANE_NAMES)
+        self._max_queued = [0] * len(LANE_NAMES)
+        self._wait_total = [0.0] * len(LANE_NAMES)
+        self._wait_histogram = [[0] * (len(WAIT_BUCKETS_MS) + 1) for _ in LANE_NAMES]
+
+    def _refill(self, now):
+        self.tokens = min(self.burst, self.tokens + (now - self._last) * self.rate)
+        self._last = now
+
+    def acquire(self, lane=ACCOUNT):
+        """Block until this request may be sent; returns the seconds waited"""
+        started = self.clock()
+        queue = self._queues[lane]
+        floor = 1 if lane == CRITICAL else 1 + self.reserve
+        with self._cond:
+            ticket = next(self._tickets)
+            queue.append(ticket)
+            self._max_queued[lane] = max(self._max_queued[lane], len(queue))
+            while True:
+                now = self.clock()
+                self._refill(now)
+                first = next(i for i, q in enumerate(self._queues) if q)
+                timeout = None  # not at the front: woken when someone ahead is served
+                if first == lane and queue[0] == ticket:
+                    paused = self.paused_until - now if lane in POLLING_LANES else 0
+                    if paused <= 0 and self.tokens >= floor:
+                        self.tokens -= 1
+                        queue.popleft()
+                        self._cond.notify_all()
+                        break
+                    timeout = max(paused, (floor - self.tokens) / self.rate)
+                self._cond.wait(timeout)
+            waited = self.clock() - started
+            self._requests[lane] += 1
+            self._wait_total[lane] += waited
+            bucket = next((i for i, edge in enumerate(WAIT_BUCKETS_MS) if waited * 1000 <= edge),
+                          len(WAIT_BUCKETS_MS))
+            self._wait_histogram[lane][bucket] += 1
+        return waited
+
+    def throttled(self, retry_after=1.0):
+        """The broker rejected a request with 429: back off polling and drain the bucket"""
+        with self._cond:
+            self.throttles += 1
+            self.tokens = min(self.tokens, 0.0)
+            self.paused_until = max(self.paused_until, self.clock() + retry_after)
+            self._cond.notify_all()
+
+    def stats(self):
+        labels = [f"<={edge}ms" for edge in WAIT_BUCKETS_MS] + [f">{WAIT_BUCKETS_MS[-1]}ms"]
+        with self._cond:
+            return {
+                name: {
+                    'requests': self._requests[lane],
+                    'queued': len(self._queues[lane]),
+                    'max_queued': self._max_queued[lane],
+                    'avg_wait_ms': 1000 * self._wait_total[lane] / self._requests[lane] if self._requests[lane] else 0.0,
+                    'wait_histogram': dict(zip(labels, self._wait_histogram[lane])),
+                }
+                for lane, name in enumerate(LANE_NAMES)
+            }
@@ -0,0 +1,106 @@
+# Content-addressed cache for backtest results
+#
+# Every simulated day is stored under a chained key:
+#   day_key = sha256(previous day_key, date, that day's and the previous day's bars)
+# seeded with a run key covering the strategy/engine source, config.py settings
+# and run arguments. Because the engine carries state between days (accumulated
+# profit), chaining means a day's key changes whenever anything it depends on
+# changes: unchanged runs are pure cache hits, and a data change in the last
+# month only recomputes from the first affected day onward.
+#
+# Downloaded market data is cached alongside (with a TTL) so a fully cached run
+# does not need the network.
+
+import hashlib
+import json
+import os
+import pickle
+import time
+
+DEFAULT_CACHE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '.cache', 'backtest')
+
+
+def _sha256(*parts):
+    h = hashlib.sha256()
+    for part in parts:
+        h.update(part if isinstance(part, bytes) else str(part).encode('utf-8'))
+        h.update(b'\0')
+    return h.hexdigest()
+
+
+def source_digest(*modules):
+    """Hash of the source files of the given modules"""
+    h = hashlib.sha256()
+    for module in modules:
+        with open(module.__file__, 'rb') as f:
+            h.update(f.read())
+    return h.hexdigest()
+
+
+def run_key(engine_version, sources, settings):
+    """
+    Root of the day-key chain: engine version, source digest and every setting
+    that affects results (ticker lists, sizing, strategy config, funds...).
+    """
+    return _sha256('run', engine_version, sources, json.dumps(settings, sort_keys=True, default=str))
+
+
+def day_key(previous_key, date, prev_day_data, day_data):
+    """Chained key for one simulated day"""
+    bars = json.dumps([prev_day_data, day_data], sort_keys=True)
+    return _sha256('day', previous_key, date, bars)
+
+
+class ResultCache:
+    """
+    File-backed content-addressed store. Day results are small JSON files named
+    by key (sharded by the first two hex digits); downloaded data is pickled.
+    """
+
+    def __init__(self, root=DEFAULT_CACHE_DIR, data_ttl=24 * 3600):
+        self.root = root
+        self.data_ttl = data_ttl
+        self.hits = 0
+        self.misses = 0
+
+    def _path(self, kind, key, ext):
+        return os.path.join(self.root, kind, key[:2], f"{key}{ext}")
+
+    def _write(self, path, payload):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp = f"{path}.{os.getpid()}.tmp"
+        with open(tmp, 'wb') as f:
+            f.write(payload)
+        os.replace(tmp, path)  # atomic, so a crash never leaves a torn entry
+
+    def get_day(self, key):
+        """Return (trades, total_profit) for a day key, or None"""
+        try:
+            with open(self._path('days', key, '.json'), 'rb') as f:
+                entry = json.loads(f.read())
+        except (OSError, ValueError):
+            self.misses += 1
+            return None
+        self.hits += 1
+        return entry['trades'], entry['total_profit']
+
+    def put_day(self, key, trades, total_profit):
+        payload = json.dumps({'trades': trades, 'total_profit': total_profit}).encode('utf-8')
+        self._write(self._path('days', key, '.json'), payload)
+
+    def load_data(self, tickers, start, end, fetch):
+        """
+        Return market data for (tickers, start, end), calling fetch() only when
+        there is no cached copy younger than data_ttl seconds.
+        """
+        key = _sha256('data', json.dumps(sorted(tickers)), start, end)
+        path = self._path('data', key, '.pkl')
+        try:
+            if time.time() - os.path.getmtime(path) < self.data_ttl:
+                with open(path, 'rb') as f:
+                    return pickle.load(f)
+        except (OSError, pickle.UnpicklingError, EOFError):
+            pass
+        data = fetch()
+        self._write(path, pickle.dumps(data, protocol=pickle.HIGHEST_PROTOCOL))
+        return data
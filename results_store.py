@@ -0,0 +1,300 @@
+#!/usr/bin/env python3
+"""
+Local results warehouse for backtest runs.
+
+Every backtest_results_*.csv (or a run_backtest() DataFrame) is ingested into
+one SQLite database (results.db by default) with three tables:
+  runs       one row per run: name, source file, date range, trade count, profit
+  trades     one row per trade with the numeric/categorical columns
+  daily_pnl  per-run, per-day trade count, invested and expected profit
+
+trades carries a covering index on (ticker, market_regime, exit_type) so
+cross-run questions such as "average profit of trailing_stop exits on SOXL in
+high_volatility regimes" are answered from the index alone. The nested
+technical_analysis / fibonacci_levels strings stay in the CSVs.
+
+Usage:
+  python results_store.py ingest backtest_results_*.csv
+  python results_store.py runs
+  python results_store.py summary --ticker SOXL --regime high_volatility --by exit_type
+"""
+
+import argparse
+import glob
+import os
+import sqlite3
+from datetime import datetime
+
+DEFAULT_DB = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'results.db')
+
+TRADE_COLUMNS = ('date', 'ticker', 'exit_type', 'market_regime', 'entry', 'exit', 'stop_loss',
+                 'shares', 'invested', 'expected_profit', 'confidence')
+# Columns summary() may group by, and filter name -> SQL condition
+GROUP_COLUMNS = ('run', 'date', 'month', 'ticker', 'exit_type', 'market_regime')
+FILTERS = {
+    'ticker': 't.ticker = ?',
+    'exit_type': 't.exit_type = ?',
+    'market_regime': 't.market_regime = ?',
+    'date_from': 't.date >= ?',
+    'date_to': 't.date <= ?',
+    'min_confidence': 't.confidence >= ?',
+    'max_confidence': 't.confidence < ?',
+    'min_profit': 't.expected_profit >= ?',
+    'profit_above': 't.expected_profit > ?',
+    'max_profit': 't.expected_profit <= ?',
+}
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS runs (
+    run_id INTEGER PRIMARY KEY,
+    name TEXT NOT NULL UNIQUE,
+    source TEXT,
+    source_mtime REAL,
+    source_size INTEGER,
+    ingested_at TEXT,
+    start_date TEXT,
+    end_date TEXT,
+    n_trades INTEGER,
+    total_profit REAL
+);
+CREATE TABLE IF NOT EXISTS trades (
+    run_id INTEGER NOT NULL REFERENCES runs(run_id),
+    date TEXT NOT NULL,
+    ticker TEXT NOT NULL,
+    exit_type TEXT,
+    market_regime TEXT,
+    entry REAL,
+    exit REAL,
+    stop_loss REAL,
+    shares REAL,
+    invested REAL,
+    expected_profit REAL,
+    confidence REAL
+);
+CREATE INDEX IF NOT EXISTS trades_run_date ON trades(run_id, date);
+CREATE INDEX IF NOT EXISTS trades_lookup ON trades(ticker, market_regime, exit_type, expected_profit);
+CREATE INDEX IF NOT EXISTS trades_regime ON trades(market_regime, exit_type, expected_profit);
+CREATE TABLE IF NOT EXISTS daily_pnl (
+    run_id INTEGER NOT NULL REFERENCES runs(run_id),
+    date TEXT NOT NULL,
+    n_trades INTEGER,
+    invested REAL,
+    expected_profit REAL,
+    PRIMARY KEY (run_id, date)
+) WITHOUT ROWID;
+"""
+
+
+def run_name(path):
+    """Run name for a results file: backtest_results_2024.csv -> '2024'"""
+    stem = os.path.splitext(os.path.basename(path))[0]
+    return stem[len('backtest_results_'):] if stem.startswith('backtest_results_') else stem
+
+
+class ResultsStore:
+    """Embedded SQLite store with ingestion and a small query API"""
+
+    def __init__(self, path=DEFAULT_DB):
+        self.path = path
+        self.conn = sqlite3.connect(path)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.executescript(SCHEMA)
+
+    def close(self):
+        self.conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    # --- ingestion -------------------------------------------------------
+
+    def ingest_trades(self, name, trades, source=None):
+        """
+        Store a run's trades (DataFrame or list of trade dicts) under `name`,
+        replacing any earlier run of that name. Returns the run_id.
+        """
+        run_id = self.begin_run(name, source)
+        self.append_trades(run_id, trades)
+        self.finish_run(run_id)
+        return run_id
+
+    def begin_run(self, name, source=None):
+        """
+        Start (or restart) run `name` for chunked ingestion with append_trades()
+        / finish_run(), as used by trade_sinks.StoreSink. Returns the run_id.
+        """
+        stat = os.stat(source) if source else None
+        with self.conn:
+            self._delete(name)
+            cur = self.conn.execute(
+                "INSERT INTO runs (name, source, source_mtime, source_size, ingested_at) VALUES (?, ?, ?, ?, ?)",
+                (name, source, stat.st_mtime if stat else None, stat.st_size if stat else None,
+                 datetime.now().isoformat(timespec='seconds')))
+        return cur.lastrowid
+
+    def append_trades(self, run_id, trades):
+        """Add a chunk of trades (DataFrame or list of trade dicts) to a run"""
+        import pandas as pd
+
+        df = trades if isinstance(trades, pd.DataFrame) else pd.DataFrame(trades)
+        df = df.reindex(columns=list(TRADE_COLUMNS))
+        df['date'] = df['date'].astype(str).str[:10]
+        df = df.astype(object).where(df.notna(), None)
+        with self.conn:
+            self.conn.executemany(
+                f"INSERT INTO trades (run_id, {', '.join(TRADE_COLUMNS)}) VALUES (?{', ?' * len(TRADE_COLUMNS)})",
+                ((run_id, *row) for row in df.itertuples(index=False, name=None)))
+
+    def finish_run(self, run_id):
+        """Build the run's daily P&L and totals once all its trades are in"""
+        with self.conn:
+            self.conn.execute("DELETE FROM daily_pnl WHERE run_id = ?", (run_id,))
+            self.conn.execute("""
+                INSERT INTO daily_pnl (run_id, date, n_trades, invested, expected_profit)
+                SELECT run_id, date, COUNT(*), TOTAL(invested), TOTAL(expected_profit)
+                FROM trades WHERE run_id = ? GROUP BY date""", (run_id,))
+            self.conn.execute("""
+                UPDATE runs SET (start_date, end_date, n_trades, total_profit) =
+                    (SELECT MIN(date), MAX(date), TOTAL(n_trades), TOTAL(expected_profit)
+                     FROM daily_pnl WHERE run_id = ?)
+                WHERE run_id = ?""", (run_id, run_id))
+
+    def ingest_csv(self, path, name=None):
+        """Ingest a backtest results CSV (only the columns the store keeps are read)"""
+        import pandas as pd
+
+        header = pd.read_csv(path, nrows=0).columns
+        df = pd.read_csv(path, usecols=[c for c in TRADE_COLUMNS if c in header])
+        return self.ingest_trades(name or run_name(path), df, source=os.path.abspath(path))
+
+    def ensure_csv(self, path, name=None):
+        """Ingest a CSV unless the stored copy is up to date; returns the run name"""
+        name = name or run_name(path)
+        row = self.conn.execute("SELECT source_mtime, source_size FROM runs WHERE name = ?", (name,)).fetchone()
+        stat = os.stat(path)
+        if row is None or row != (stat.st_mtime, stat.st_size):
+            self.ingest_csv(path, name)
+        return name
+
+    def delete_run(self, name):
+        with self.conn:
+            self._delete(name)
+
+    def _delete(self, name):
+        row = self.conn.execute("SELECT run_id FROM runs WHERE name = ?", (name,)).fetchone()
+        if row:
+            for table in ('trades', 'daily_pnl', 'runs'):
+                self.conn.execute(f"DELETE FROM {table} WHERE run_id = ?", row)
+
+    # --- queries ---------------------------------------------------------
+
+    def _where(self, run, filters):
+        clauses, params = [], []
+        if run is not None:
+            clauses.append("t.run_id = (SELECT run_id FROM runs WHERE name = ?)")
+            params.append(str(run))
+        for key, value in filters.items():
+            if value is None:
+                continue
+            if key not in FILTERS:
+                raise ValueError(f"Unknown filter '{key}' (expected one of {', '.join(FILTERS)})")
+            clauses.append(FILTERS[key])
+            params.append(value)
+        return (" WHERE " + " AND ".join(clauses) if clauses else ""), params
+
+    def runs(self):
+        """All stored runs as a DataFrame"""
+        import pandas as pd
+        return pd.read_sql_query(
+            "SELECT name, start_date, end_date, n_trades, total_profit, source, ingested_at FROM runs ORDER BY name",
+            self.conn)
+
+    def trades(self, run=None, **filters):
+        """Trades matching the filters (see FILTERS) as a DataFrame"""
+        import pandas as pd
+        where, params = self._where(run, filters)
+        return pd.read_sql_query(
+            f"SELECT r.name AS run, {', '.join('t.' + c for c in TRADE_COLUMNS)} "
+            f"FROM trades t JOIN runs r USING (run_id){where} ORDER BY t.run_id, t.rowid",
+            self.conn, params=params)
+
+    def count(self, run=None, column=None, **filters):
+        """Number of trades matching the filters (only those with a non-NULL `column`, if given)"""
+        if column is not None and column not in TRADE_COLUMNS:
+            raise ValueError(f"Unknown column '{column}' (expected one of {', '.join(TRADE_COLUMNS)})")
+        where, params = self._where(run, filters)
+        counted = f"t.{column}" if column is not None else "*"
+        return self.conn.execute(f"SELECT COUNT({counted}) FROM trades t{where}", params).fetchone()[0]
+
+    def summary(self, by=(), run=None, **filters):
+        """
+        Trade count, total/average expected profit and win count, optionally
+        grouped by columns from GROUP_COLUMNS.
+        """
+        import pandas as pd
+        by = [by] if isinstance(by, str) else list(by)
+        for col in by:
+            if col not in GROUP_COLUMNS:
+                raise ValueError(f"Cannot group by '{col}' (expected one of {', '.join(GROUP_COLUMNS)})")
+        exprs = {'run': 'r.name', 'month': 'substr(t.date, 1, 7)'}
+        keys = [f"{exprs.get(c, 't.' + c)} AS {c}" for c in by]
+        where, params = self._where(run, filters)
+        sql = (f"SELECT {', '.join(keys + [''])}COUNT(*) AS trades, TOTAL(t.expected_profit) AS total_profit, "
+               f"AVG(t.expected_profit) AS avg_profit, SUM(t.expected_profit > 0) AS profitable "
+               f"FROM trades t{' JOIN runs r USING (run_id)' if 'run' in by else ''}{where}")
+        if by:
+            sql += f" GROUP BY {', '.join(by)} ORDER BY {', '.join(by)}"
+        return pd.read_sql_query(sql, self.conn, params=params)
+
+    def daily_pnl(self, run):
+        """Expected profit per trading day of a run as a Series indexed by date"""
+        import pandas as pd
+        df = pd.read_sql_query(
+            "SELECT date, expected_profit FROM daily_pnl WHERE run_id = (SELECT run_id FROM runs WHERE name = ?) "
+            "ORDER BY date", self.conn, params=(str(run),), parse_dates=['date'])
+        return df.set_index('date')['expected_profit']
+
+    def monthly_pnl(self, run):
+        """Expected profit per calendar month of a run as a Series indexed by 'YYYY-MM'"""
+        import pandas as pd
+        df = pd.read_sql_query(
+            "SELECT substr(date, 1, 7) AS month, TOTAL(expected_profit) AS expected_profit FROM daily_pnl "
+            "WHERE run_id = (SELECT run_id FROM runs WHERE name = ?) GROUP BY month ORDER BY month",
+            self.conn, params=(str(run),))
+        return df.set_index('month')['expected_profit']
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Backtest results warehouse")
+    parser.add_argument('--db', default=DEFAULT_DB)
+    sub = parser.add_subparsers(dest='command', required=True)
+    ingest = sub.add_parser('ingest', help="ingest results CSVs (default: backtest_results_*.csv)")
+    ingest.add_argument('files', nargs='*')
+    sub.add_parser('runs', help="list stored runs")
+    summary = sub.add_parser('summary', help="aggregate trades across runs")
+    summary.add_argument('--run')
+    summary.add_argument('--ticker')
+    summary.add_argument('--regime', dest='market_regime')
+    summary.add_argument('--exit-type', dest='exit_type')
+    summary.add_argument('--by', default='run', help=f"comma-separated: {', '.join(GROUP_COLUMNS)}")
+    args = parser.parse_args()
+
+    with ResultsStore(args.db) as store:
+        if args.command == 'ingest':
+            for path in args.files or sorted(glob.glob('backtest_results_*.csv')):
+                store.ingest_csv(path)
+                print(f"Ingested {path}")
+        elif args.command == 'runs':
+            print(store.runs().to_string(index=False))
+        else:
+            by = [c for c in args.by.split(',') if c]
+            print(store.summary(by, run=args.run, ticker=args.ticker, market_regime=args.market_regime,
+                                exit_type=args.exit_type).to_string(index=False))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,152 @@
+# Incremental pre-trade risk engine
+#
+# Keeps running aggregates of what has been committed today (gross exposure,
+# per-sector exposure, worst-case stop-loss loss, expected profit, buying power)
+# and checks each new order against POSITION_SIZING before it is submitted.
+# Every check/commit/release is O(1), so it can sit directly in the order path.
+
+from config import FUNDS
+from live_config import current as current_config
+
+
+class RiskEngine:
+    """
+    Pre-trade checks and running risk aggregates.
+
+    Limits (from the active configuration's POSITION_SIZING unless overridden):
+      min_position_value / max_position_value: dollar bounds per position
+      max_positions: open positions allowed at once
+      risk_per_trade: max stop-loss loss per trade as a fraction of funds
+      max_sector_pct: optional cap on exposure per sector as a fraction of funds
+    """
+
+    def __init__(self, funds=FUNDS, limits=None, max_sector_pct=None):
+        limits = dict(current_config().position_sizing, **(limits or {}))
+        self.funds = funds
+        self.min_position_value = limits['min_position_value']
+        self.max_position_value = limits['max_position_value']
+        self.max_positions = limits['max_positions']
+        self.max_loss_per_trade = limits['risk_per_trade'] * funds
+        self.max_sector_value = max_sector_pct * funds if max_sector_pct else None
+
+        self.gross_exposure = 0.0
+        self.max_stop_loss = 0.0
+        self.expected_profit = 0.0
+        self.sector_exposure = {}
+        self.positions = {}  # ticker -> (invested, stop_loss_loss, sector, expected_profit)
+        self.rejected = 0
+        self.resized = 0
+
+    @property
+    def buying_power(self):
+        return self.funds - self.gross_exposure
+
+    def check(self, ticker, price, shares, stop_loss=None, sector=None):
+        """
+        Return (allowed_shares, reason). reason is None when the order passes
+        as-is, 'resized:<limit>' when shares were cut, or 'rejected:<limit>'
+        with allowed_shares 0.
+        """
+        if not shares or shares <= 0 or not price or price <= 0:
+            return 0, 'rejected:no_shares'
+        if ticker in self.positions:
+            return 0, 'rejected:duplicate_position'
+        if len(self.positions) >= self.max_positions:
+            return 0, 'rejected:max_positions'
+
+        reason = None
+        cap_value = min(self.max_position_value, self.buying_power)
+        if self.max_sector_value is not None:
+            cap_value = min(cap_value, self.max_sector_value - self.sector_exposure.get(sector, 0.0))
+        if shares * price > cap_value:
+            shares = int(cap_value // price)
+            reason = 'resized:exposure'
+        if stop_loss and price > stop_loss:
+            max_by_risk = int(self.max_loss_per_trade // (price - stop_loss))
+            if shares > max_by_risk:
+                shares = max_by_risk
+                reason = 'resized:risk_per_trade'
+        if shares <= 0 or shares * price < self.min_position_value:
+            return 0, 'rejected:min_position_value'
+        return shares, reason
+
+    def commit(self, ticker, price, shares, stop_loss=None, sector=None, expected_profit=0.0):
+        """Add an accepted order to the running aggregates"""
+        invested = price * shares
+        loss = (price - stop_loss) * shares if stop_loss else 0.0
+        self.positions[ticker] = (invested, loss, sector, expected_profit)
+        self.gross_exposure += invested
+        self.max_stop_loss += loss
+        self.expected_profit += expected_profit
+        self.sector_exposure[sector] = self.sector_exposure.get(sector, 0.0) + invested
+
+    def release(self, ticker):
+        """Remove a closed (or cancelled) position from the aggregates"""
+        position = self.positions.pop(ticker, None)
+        if position is None:
+            return
+        invested, loss, sector, expected_profit = position
+        self.gross_exposure -= invested
+        self.max_stop_loss -= loss
+        self.expected_profit -= expected_profit
+        self.sector_exposure[sector] -= invested
+
+    def snapshot(self):
+        """Committed positions and counters, as plain data for restore()"""
+        return {'positions': {ticker: list(p) for ticker, p in self.positions.items()},
+                'rejected': self.rejected, 'resized': self.resized}
+
+    def restore(self, state):
+        """Re-add a snapshot()'s positions to the running aggregates"""
+        for ticker, (invested, loss, sector, expected_profit) in state['positions'].items():
+            self.positions[ticker] = (invested, loss, sector, expected_profit)
+            self.gross_exposure += invested
+            self.max_stop_loss += loss
+            self.expected_profit += expected_profit
+            self.sector_exposure[sector] = self.sector_exposure.get(sector, 0.0) + invested
+        self.rejected += state['rejected']
+        self.resized += state['resized']
+
+    def pre_trade(self, ticker, trade_plan, sector=None):
+        """
+        Check a decide_entry_exit_adaptive() plan, commit it if allowed and
+        return the plan with shares/invested/expected_profit adjusted to what
+        the limits allow. Plans without shares pass through untouched.
+        """
+        shares = trade_plan.get('shares')
+        if not shares:
+            return trade_plan
+        entry = trade_plan['entry']
+        allowed, reason = self.check(ticker, entry, shares, trade_plan.get('stop_loss'), sector)
+        if reason is None:
+            self.commit(ticker, entry, shares, trade_plan.get('stop_loss'), sector, trade_plan.get('expected_profit', 0))
+            return trade_plan
+        plan = dict(trade_plan, shares=allowed, risk_check=reason)
+        plan['invested'] = round(allowed * entry, 2)
+        plan['expected_profit'] = round((trade_plan['exit'] - entry) * allowed, 2) if trade_plan.get('exit') else 0
+        if allowed:
+            self.resized += 1
+            self.commit(ticker, entry, allowed, plan.get('stop_loss'), sector, plan['expected_profit'])
+        else:
+            self.rejected += 1
+        return plan
+
+    def report(self):
+        return {
+            'total_invested': round(self.gross_exposure, 2),
+            'max_stop_loss': round(self.max_stop_loss, 2),
+            'expected_profit': round(self.expected_profit, 2),
+            'buying_power': round(self.buying_power, 2),
+            'positions': len(self.positions),
+            'sector_exposure': {s: round(v, 2) for s, v in self.sector_exposure.items() if v},
+            'resized': self.resized,
+            'rejected': self.rejected,
+        }
+
+    def print_report(self):
+        print("\n--- Risk Report ---")
+        print(f"Total Invested: ${self.gross_exposure:.2f}")
+        print(f"Maximum Possible Loss (if all stop-losses hit): ${self.max_stop_loss:.2f}")
+        print(f"Expected Profit (if all targets hit): ${self.expected_profit:.2f}")
+        print(f"Buying Power Remaining: ${self.buying_power:.2f}")
+        print(f"Number of trades: {len(self.positions)} (resized {self.resized}, rejected {self.rejected})")
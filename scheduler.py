@@ -0,0 +1,495 @@
+# Staged pipeline for one trading session
+#
+# Everything that does not depend on the opening price runs before the bell,
+# so the work left at the open is one quote per candidate, a division and the
+# order submission:
+#   warm     prior sessions' bars through the data cache, broker token, account
+#            (buying power) and the HTTP connection
+#   prepare  regime, technical indicators over the close history,
+#            select_tickers_adaptive() ranking and an OrderTemplate per
+#            candidate holding its stop / target percentages and dollar budget
+#            (from allocation.py over the closes' covariance)
+#   open     live quotes for the candidates in parallel, templates filled at
+#            those prices, risk checks, submission through the OrderManager
+#   flatten  cancel working orders and sell every position at market (no more
+#            than the broker reports held, so a stop that filled during the
+#            cancel is not sold twice)
+# Between open and flatten the protective stops trail the high since entry
+# like plan_entry_exit()'s trailing stop, checked every snapshot_interval.
+# Stage times come from SESSION_SCHEDULE relative to the session's open and
+# close in MARKET_TIMEZONE (trading_calendar, so early closes move the flatten
+# stage too). A stage whose time has already passed runs immediately - a late
+# start still gets warmed and prepared - but no entries are opened once the
+# flatten time has passed.
+#
+# With snapshot_path, the engine state (bars, regime, templates, funds, orders,
+# risk positions) is saved to a warm_state snapshot after every stage and every
+# snapshot_interval seconds while waiting. A restarted pipeline for the same
+# session loads it in milliseconds, skips the stages already done and only asks
+# the broker for what changed since (OrderManager.reconcile()).
+#
+# With `shared` (a shared_market.SharedMarket fed and ranked by other
+# processes), prepare takes the screener's ranking instead of screening here
+# and open reads prices from shared memory instead of polling the broker.
+#
+# With config_manager (a live_config.ConfigManager), a changed config file is
+# swapped in before each stage and between waits, never inside one; the
+# session's bars, templates and orders are kept.
+#
+# Usage:
+#   python scheduler.py            # today's session, waiting for each stage
+#   python scheduler.py --now      # run every stage right away (mock broker)
+
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, datetime, timedelta
+
+from allocation import allocation_budgets, signal_score
+from config import FUNDS, MARKET_TIMEZONE, SESSION_SCHEDULE
+from live_config import current as current_config
+from strategy import detect_market_regime, select_tickers_adaptive, signal_params, size_positions, technical_signals
+from trading_calendar import previous_session, session_hours
+
+STAGES = ('warm', 'prepare', 'open', 'flatten')
+HISTORY_DAYS = 70  # calendar days of bars loaded before the session (covers multi_backtest.HISTORY_SESSIONS)
+
+
+def market_now():
+    from zoneinfo import ZoneInfo
+    return datetime.now(ZoneInfo(MARKET_TIMEZONE))
+
+
+def stage_times(day, schedule=SESSION_SCHEDULE):
+    """[(stage, aware datetime)] for a session in MARKET_TIMEZONE, or None on a closed day"""
+    from zoneinfo import ZoneInfo
+    day = date.fromisoformat(day[:10]) if isinstance(day, str) else day
+    hours = session_hours(day)
+    if hours is None:
+        return None
+    zone = ZoneInfo(MARKET_TIMEZONE)
+    open_at, close_at = (datetime.combine(day, datetime.strptime(t, '%H:%M').time(), zone) for t in hours)
+    return [
+        ('warm', open_at - timedelta(minutes=schedule['warm_before_open'])),
+        ('prepare', open_at - timedelta(minutes=schedule['prepare_before_open'])),
+        ('open', open_at),
+        ('flatten', close_at - timedelta(minutes=schedule['flatten_before_close'])),
+    ]
+
+
+class OrderTemplate:
+    """A candidate's order with everything but the entry price filled in"""
+
+    __slots__ = ('symbol', 'sector', 'regime', 'technical', 'stop_loss_pct', 'target_pct', 'budget',
+                 'trailing_trigger', 'trailing_stop_pct')
+
+    def __init__(self, symbol, sector, regime, technical, stop_loss_pct, target_pct, budget,
+                 trailing_trigger=None, trailing_stop_pct=None):
+        self.symbol = symbol
+        self.sector = sector
+        self.regime = regime
+        self.technical = technical
+        self.stop_loss_pct = stop_loss_pct
+        self.target_pct = target_pct
+        self.budget = budget
+        self.trailing_trigger = trailing_trigger    # trail once the high reaches entry * trailing_trigger
+        self.trailing_stop_pct = trailing_stop_pct  # ... at this fraction below the high
+
+    def fill(self, price, shares=None):
+        """decide_entry_exit_adaptive()-style plan dict for an entry at price (shares default: budget // price)"""
+        if shares is None:
+            shares = int(self.budget // price) if price and price > 0 else 0
+        exit_price = round(price * (1 + self.target_pct), 2) if shares else None
+        return {
+            'entry': price, 'exit': exit_price, 'stop_loss': round(price * (1 - self.stop_loss_pct), 2),
+            'shares': shares, 'invested': round(shares * price, 2),
+            'expected_profit': round((exit_price - price) * shares, 2) if shares else 0,
+            'market_regime': self.regime, 'technical_analysis': self.technical.to_dict(),
+        }
+
+    def __repr__(self):
+        return f"OrderTemplate({self.symbol!r}, budget={self.budget:.2f}, stop={self.stop_loss_pct:.4f})"
+
+
+class SessionPipeline:
+    """
+    One session's warm / prepare / open / flatten stages against a FidelityAPI.
+
+    `data` (ticker -> OHLCV DataFrame, e.g. synthetic_data.to_frames()) skips
+    the download; otherwise bars come through `cache` (a ResultCache, created
+    on demand). `clock` returns an aware datetime and `sleep(seconds)` waits,
+    so tests can drive the schedule without waiting.
+    """
+
+    def __init__(self, api, day=None, tickers=None, funds=FUNDS, data=None, symbol_index=None, cache=None,
+                 orders=None, risk=None, journal=None, schedule=SESSION_SCHEDULE, clock=market_now, sleep=time.sleep,
+                 quote_workers=8, snapshot_path=None, snapshot_interval=60, shared=None, config_manager=None):
+        self.api = api
+        self.clock = clock
+        self.sleep = sleep
+        day = day or clock().date()
+        self.day = date.fromisoformat(day[:10]) if isinstance(day, str) else day
+        self.stages = stage_times(self.day, schedule)
+        if self.stages is None:
+            raise ValueError(f"{self.day} is not a trading session")
+        self.tickers = list(tickers) if tickers is not None else None  # None: the active config's tickers
+        self.funds = funds
+        self.data = data
+        self.symbol_index = symbol_index
+        self.cache = cache
+        self.orders = orders
+        self.risk = risk
+        self.journal = journal
+        self.quote_workers = quote_workers
+        self.snapshot_path = snapshot_path
+        self.snapshot_interval = snapshot_interval
+        self.shared = shared
+        self.config_manager = config_manager
+
+        self.history = {}        # ticker -> closes of the sessions before this one
+        self.prev_day_data = {}  # previous session's bars (market_data dict)
+        self.regime = None
+        self.templates = []
+        self.submitted = []
+        self.flattened = []
+        self.highs = {}          # symbol -> highest price seen since its entry filled (trailing stops)
+        self.started = {}        # stage -> clock() when it began
+        self.timings = {}        # stage -> seconds it took
+        self.skipped = []
+        self.time_to_first_order = None  # seconds from the start of the open stage to the first broker ack
+        self.restored = False
+        self.restore_ms = None
+        self._bar_tickers = []
+        self._sectors = []
+        self._closes = None      # sessions x tickers closes before this session (NaN where missing)
+        self._prev_bars = None   # tickers x BAR_FIELDS of the previous session
+
+    def at(self, stage):
+        return dict(self.stages)[stage]
+
+    # --- Stages ---
+
+    def warm(self):
+        from backtest import align_bars, download_data
+        from symbol_index import load_symbol_index
+        from trading_calendar import sessions
+        last = previous_session(self.day)
+        start = (last - timedelta(days=HISTORY_DAYS)).isoformat()
+        end = self.day.isoformat()  # exclusive for the download: only bars before this session
+        universe = self.tickers or list(current_config().tickers)
+        data = self.data
+        if data is None:
+            from result_cache import ResultCache
+            cache = self.cache if self.cache is not None else ResultCache()
+            data = cache.load_data(universe, start, end, lambda: download_data(universe, start, end))
+        if self.symbol_index is None:
+            self.symbol_index = load_symbol_index()
+        sectors = {ticker: self.symbol_index.sector_of(ticker) for ticker in data}
+        tickers, bars = align_bars(data, sessions(start, last))
+        self._bar_tickers = tickers
+        self._sectors = [sectors[t] for t in tickers]
+        self._closes = bars[:, :, 3]
+        self._prev_bars = bars[-1] if len(bars) else None
+        self._load_bars()
+
+        # Token refresh, TLS handshake and buying power before anything is time critical
+        self.api.tokens.token()
+        account = self.api.get_account_info()
+        if account and account.get('buyingPower') is not None:
+            self.funds = min(self.funds, account['buyingPower'])
+
+    def _load_bars(self):
+        from backtest import build_day_data
+        closes = self._closes
+        self.history = {t: [p for p in closes[:, j].tolist() if p == p] for j, t in enumerate(self._bar_tickers)}
+        self.prev_day_data = ({} if self._prev_bars is None else
+                              build_day_data(self._bar_tickers, dict(zip(self._bar_tickers, self._sectors)),
+                                             self._prev_bars))
+
+    def prepare(self):
+        from order_manager import OrderManager
+        from risk_engine import RiskEngine
+        prev = self.prev_day_data
+        self.regime = detect_market_regime(prev)
+        ranked = self.shared.candidates() if self.shared is not None else []
+        if ranked:
+            candidates = [t for t in ranked if t in prev]
+        else:
+            candidates = select_tickers_adaptive(prev, market_regime=self.regime, historical_data=self.history,
+                                                 symbol_index=self.symbol_index) if prev else []
+        candidates = candidates[:current_config().position_sizing['max_positions']]
+        allocation = self.funds / max(5, len(candidates))
+        technicals = [technical_signals(prev[ticker], self.history.get(ticker)) for ticker in candidates]
+        budgets = None
+        if candidates:
+            # Covariance from the cached closes of the candidates
+            columns = {t: j for j, t in enumerate(self._bar_tickers)}
+            budgets = allocation_budgets([signal_score(t.overall, t.confidence) for t in technicals], self.funds,
+                                         closes=self._closes[:, [columns[t] for t in candidates]],
+                                         bars=[prev[t] for t in candidates])
+        self.templates = []
+        for i, (ticker, technical) in enumerate(zip(candidates, technicals)):
+            stop_loss_pct, trailing_trigger, trailing_stop_pct, min_profit_pct, max_allocation = \
+                signal_params(self.regime, technical.overall)
+            budget = allocation * max_allocation if budgets is None else float(budgets[i])
+            self.templates.append(OrderTemplate(ticker, prev[ticker].get('sector'), self.regime, technical,
+                                                stop_loss_pct, min_profit_pct, budget,
+                                                trailing_trigger, trailing_stop_pct))
+        if self.risk is None:
+            self.risk = RiskEngine(self.funds)
+        if self.orders is None:
+            self.orders = OrderManager(self.api)
+
+    def _quote_price(self, symbol):
+        quote = self.shared.quote(symbol) if self.shared is not None else None
+        if quote is None:
+            quote = self.api.get_market_data(symbol, max_age=0)
+        if not quote:
+            return None
+        return quote.get('ask') or quote.get('last')
+
+    def open(self):
+        started = time.time()
+        symbols = [t.symbol for t in self.templates]
+        with ThreadPoolExecutor(max_workers=self.quote_workers, thread_name_prefix='OpenQuotes') as executor:
+            prices = list(executor.map(self._quote_price, symbols))
+        # Size the whole book in one pass: template budgets, min/max position value, one funds pool
+        shares, _ = size_positions(symbols, [p or 0.0 for p in prices], self.risk.buying_power,
+                                   targets=[t.budget for t in self.templates])
+        for template, price, qty in zip(self.templates, prices, shares.tolist()):
+            if not price:
+                continue
+            plan = self.risk.pre_trade(template.symbol, template.fill(price, qty), template.sector)
+            self.orders.place_trade_plan(template.symbol, plan)
+            if self.journal is not None:
+                self.journal.record(template.symbol, plan)
+        self.submitted = self.orders.submit_pending()
+        acked = [o.updated_at for o in self.submitted if o.broker_id is not None]
+        if acked:
+            self.time_to_first_order = min(acked) - started
+
+    def trail_stops(self):
+        """
+        Ratchet each held name's protective stop the way plan_entry_exit()
+        trails: once the high since the entry fill reaches entry *
+        trailing_trigger, the stop follows it trailing_stop_pct below.
+        Also sends the stops of entries that filled since the last call.
+        Returns the replacement stop orders.
+        """
+        if self.orders is None:
+            return []
+        self.orders.reconcile()
+        self.orders.submit_pending()
+        moved = []
+        for template in self.templates:
+            symbol = template.symbol
+            if template.trailing_trigger is None or self.orders.working_stop(symbol) is None:
+                continue
+            entry = next((o.avg_fill_price for o in self.orders.orders_for(symbol)
+                          if o.tag == 'entry' and o.avg_fill_price), None)
+            price = self._quote_price(symbol)
+            if entry is None or not price:
+                continue
+            high = self.highs[symbol] = max(self.highs.get(symbol, entry), price)
+            if high >= entry * template.trailing_trigger:
+                replacement = self.orders.update_stop(symbol, high * (1 - template.trailing_stop_pct))
+                if replacement is not None:
+                    moved.append(replacement)
+        return moved
+
+    def _broker_positions(self):
+        """symbol -> shares held according to the broker, or None if the account is unavailable"""
+        account = self.api.get_account_info()
+        if not account or account.get('positions') is None:
+            return None
+        return {p['symbol']: p['quantity'] for p in account['positions']}
+
+    def flatten(self):
+        if self.orders is None:
+            return
+        self.orders.reconcile()  # pick up fills (entries, triggered stops) first
+        for order in self.orders.open_orders():
+            self.orders.cancel(order.client_id)
+        # A refused cancel usually means the stop filled in the meantime: settle those
+        # fills and never sell more than the broker says is held
+        self.orders.reconcile()
+        held = self._broker_positions()
+        self.flattened = []
+        for template in self.templates:
+            symbol = template.symbol
+            qty = self.orders.position(symbol)
+            if held is not None:
+                qty = min(qty, held.get(symbol, 0))
+            if qty > 0 and self.orders.orders_for(symbol, open_only=True):
+                print(f"[SessionPipeline] {symbol}: {qty} shares left, an order could not be cancelled")
+                continue  # still held: the risk engine keeps the position
+            if qty > 0:
+                self.flattened.append(self.orders.new_order(symbol, qty, 'sell', 'market', tag='flatten'))
+            self.risk.release(symbol)
+        self.orders.submit_pending()
+
+    # --- Snapshots ---
+
+    def save_snapshot(self):
+        from warm_state import save_snapshot
+        if not self.snapshot_path:
+            return
+        meta = {
+            'day': self.day.isoformat(), 'funds': self.funds, 'regime': self.regime,
+            'started': {stage: at.isoformat() for stage, at in self.started.items()},
+            'skipped': self.skipped, 'time_to_first_order': self.time_to_first_order,
+            'bar_tickers': self._bar_tickers, 'sectors': self._sectors,
+            'templates': [[t.symbol, t.sector, t.regime, t.technical.to_dict(), t.stop_loss_pct, t.target_pct,
+                           t.budget, t.trailing_trigger, t.trailing_stop_pct] for t in self.templates],
+            'highs': self.highs,
+            'submitted': [o.client_id for o in self.submitted],
+            'flattened': [o.client_id for o in self.flattened],
+            'orders': self.orders.snapshot() if self.orders is not None else None,
+            'risk': self.risk.snapshot() if self.risk is not None else None,
+        }
+        arrays = {}
+        if self._closes is not None:
+            arrays['closes'] = self._closes
+        if self._prev_bars is not None:
+            arrays['prev_bars'] = self._prev_bars
+        save_snapshot(self.snapshot_path, meta, arrays)
+
+    def restore_snapshot(self):
+        """
+        Load this session's snapshot, if there is one, and reconcile open
+        orders with the broker. Returns whether state was restored.
+        """
+        from order_manager import OrderManager
+        from risk_engine import RiskEngine
+        from trade_plan import TechnicalAnalysis
+        from warm_state import load_snapshot
+        t0 = time.perf_counter()
+        loaded = load_snapshot(self.snapshot_path) if self.snapshot_path else None
+        if loaded is None or loaded[0]['day'] != self.day.isoformat():
+            return False
+        meta, arrays = loaded
+        self.funds = meta['funds']
+        self.regime = meta['regime']
+        self.started = {stage: datetime.fromisoformat(at) for stage, at in meta['started'].items()}
+        self.skipped = meta['skipped']
+        self.time_to_first_order = meta['time_to_first_order']
+        self._bar_tickers = meta['bar_tickers']
+        self._sectors = meta['sectors']
+        self._closes = arrays.get('closes')
+        self._prev_bars = arrays.get('prev_bars')
+        if self._closes is not None:
+            self._load_bars()
+        self.templates = [OrderTemplate(symbol, sector, regime, TechnicalAnalysis.from_dict(technical), *params)
+                          for symbol, sector, regime, technical, *params in meta['templates']]
+        self.highs = meta.get('highs', {})
+        if meta['risk'] is not None:
+            if self.risk is None:
+                self.risk = RiskEngine(self.funds)
+            self.risk.restore(meta['risk'])
+        if meta['orders'] is not None:
+            if self.orders is None:
+                self.orders = OrderManager(self.api)
+            self.orders.restore(meta['orders'])
+            self.submitted = [self.orders.get(client_id) for client_id in meta['submitted']]
+            self.flattened = [self.orders.get(client_id) for client_id in meta['flattened']]
+        self.restored = True
+        self.restore_ms = (time.perf_counter() - t0) * 1000
+        if self.orders is not None:
+            self.orders.reconcile()  # only what changed at the broker since the snapshot
+        return True
+
+    # --- Scheduling ---
+
+    def wait_until(self, at):
+        """
+        Sleep until `at`; every snapshot_interval seconds trail the stops (between
+        the open and flatten stages) and reconcile and snapshot open orders
+        """
+        while True:
+            remaining = (at - self.clock()).total_seconds()
+            if remaining <= 0:
+                return
+            self.sleep(min(remaining, self.snapshot_interval))
+            if self.config_manager is not None:
+                self.config_manager.swap()
+            if 'open' in self.started and 'flatten' not in self.started:
+                self.trail_stops()
+            if self.snapshot_path and self.orders is not None and self.orders.open_orders():
+                self.orders.reconcile()
+                self.save_snapshot()
+
+    def run(self, wait=True):
+        """
+        Run every stage at its time (or all at once with wait=False) after
+        restoring any snapshot of this session; returns report()
+        """
+        if self.snapshot_path:
+            self.restore_snapshot()
+        for stage, at in self.stages:
+            if stage in self.started or stage in self.skipped:
+                continue
+            if wait:
+                if stage == 'open' and self.clock() >= self.at('flatten'):
+                    self.skipped.append(stage)
+                    continue
+                self.wait_until(at)
+            if self.config_manager is not None:
+                self.config_manager.swap()
+            self.started[stage] = self.clock()
+            t0 = time.perf_counter()
+            getattr(self, stage)()
+            self.timings[stage] = time.perf_counter() - t0
+            self.save_snapshot()
+        if self.orders is not None:
+            self.orders.close()
+        return self.report()
+
+    def report(self):
+        return {
+            'day': self.day.isoformat(),
+            'regime': self.regime,
+            'candidates': [t.symbol for t in self.templates],
+            'entries': sum(o.tag == 'entry' for o in self.submitted),
+            'submitted': len(self.submitted),
+            'flattened': len(self.flattened),
+            'skipped': list(self.skipped),
+            'restore_ms': round(self.restore_ms, 2) if self.restore_ms is not None else None,
+            'stage_ms': {stage: round(seconds * 1000, 2) for stage, seconds in self.timings.items()},
+            'time_to_first_order_ms': round(self.time_to_first_order * 1000, 2)
+                                      if self.time_to_first_order is not None else None,
+        }
+
+
+def main():
+    import argparse
+    from journal import TradeJournal
+    from main import connect_api
+    parser = argparse.ArgumentParser(description="Run today's trading session on its schedule")
+    parser.add_argument('--now', action='store_true', help="run every stage immediately instead of waiting")
+    parser.add_argument('--day', help="session date (YYYY-MM-DD, default today)")
+    parser.add_argument('--config', help="JSON trading config to load and watch (see live_config.py)")
+    parser.add_argument('--snapshot', default=os.path.join('logs', 'session.snapshot'),
+                        help="warm-state snapshot file ('' to disable)")
+    args = parser.parse_args()
+    day = date.fromisoformat(args.day) if args.day else None
+    journal = TradeJournal(log_dir="logs")
+    manager = None
+    if args.config:
+        from live_config import ConfigManager
+        manager = ConfigManager(args.config).start()
+    pipeline = SessionPipeline(connect_api(), day, journal=journal, snapshot_path=args.snapshot or None,
+                               config_manager=manager)
+    for stage, at in pipeline.stages:
+        print(f"  {stage:<8} {at:%Y-%m-%d %H:%M %Z}")
+    try:
+        report = pipeline.run(wait=not args.now)
+    finally:
+        journal.close()
+        if manager is not None:
+            manager.stop()
+    print(report)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,298 @@
+#!/usr/bin/env python3
+"""
+Shared-memory market snapshot for running screening and execution in
+separate processes.
+
+One multiprocessing.shared_memory block holds, per symbol, the session's
+open/high/low/close/volume built from live quotes plus the latest bid/ask/last
+and quote time, and a candidate ranking with scores. Two regions, each with
+its own single writer and sequence counter (a seqlock):
+  market   written by the feed process (publish_quotes(), e.g. as a
+           QuoteStream on_quotes callback)
+  ranking  written by the screener process (publish_ranking())
+A writer makes the counter odd, writes in place and makes it even again;
+readers never lock: read_market(fn) / read_ranking(fn) call fn on zero-copy
+views and retry if the counter moved (or was odd) meanwhile, so the result is
+always from one complete update and a slow screener never blocks the executor.
+Results must not keep the views past fn. Ordering relies on the stores to
+the block being visible in program order to other cores, as on x86-64; the
+counter and data are plain numpy stores.
+
+Processes attach by name only: the symbol list lives in the block too.
+
+Usage:
+  python shared_market.py --symbols 2000 --seconds 5    # feed + screener processes, executor reads
+"""
+
+import os
+import sys
+import time
+from multiprocessing import resource_tracker, shared_memory
+
+FIELDS = ('open', 'high', 'low', 'close', 'volume', 'bid', 'ask', 'last', 'time')
+OPEN, HIGH, LOW, CLOSE, VOLUME, BID, ASK, LAST, TIME = range(len(FIELDS))
+# int64 header: magic, layout version, symbols, max ranked, symbol width, market seq, ranking seq, ranked count
+_MAGIC = 0x54424d4b54  # 'TBMKT'
+_HEADER_WORDS = 8
+_MARKET_SEQ, _RANKING_SEQ, _RANKED = 5, 6, 7
+_ALIGN = 64
+
+
+def _aligned(n):
+    return n + (-n % _ALIGN)
+
+
+class SharedMarket:
+    """
+    A named shared-memory snapshot. Use create() in the process that owns it
+    (it unlinks the block on close) and attach(name) everywhere else.
+    """
+
+    def __init__(self, shm, owner=False):
+        import numpy as np
+        self.shm = shm
+        self.owner = owner
+        self.retries = 0  # reads repeated because a write overlapped
+        buf = shm.buf
+        self._header = np.ndarray((_HEADER_WORDS,), dtype=np.int64, buffer=buf)
+        if self._header[0] != _MAGIC:
+            raise ValueError(f"{shm.name} is not a SharedMarket block")
+        n, max_ranked, width = (int(v) for v in self._header[2:5])
+        offset = _aligned(self._header.nbytes)
+        names = np.ndarray((n,), dtype=f'S{width}', buffer=buf, offset=offset)
+        offset = _aligned(offset + names.nbytes)
+        self.symbols = [s.decode() for s in names.tolist()]
+        self.index = {s: i for i, s in enumerate(self.symbols)}
+        self._values = np.ndarray((n, len(FIELDS)), dtype=np.float64, buffer=buf, offset=offset)
+        offset = _aligned(offset + self._values.nbytes)
+        self._ranking = np.ndarray((max_ranked,), dtype=np.int64, buffer=buf, offset=offset)
+        offset = _aligned(offset + self._ranking.nbytes)
+        self._scores = np.ndarray((max_ranked,), dtype=np.float64, buffer=buf, offset=offset)
+
+    @classmethod
+    def create(cls, symbols, name=None, max_ranked=None):
+        import numpy as np
+        symbols = list(symbols)
+        n = len(symbols)
+        max_ranked = max_ranked or n
+        width = max((len(s.encode()) for s in symbols), default=1)
+        size = (_aligned(_HEADER_WORDS * 8) + _aligned(n * width) + _aligned(n * len(FIELDS) * 8)
+                + _aligned(max_ranked * 8) * 2)
+        shm = shared_memory.SharedMemory(name=name, create=True, size=size)
+        header = np.ndarray((_HEADER_WORDS,), dtype=np.int64, buffer=shm.buf)
+        header[:] = (_MAGIC, 1, n, max_ranked, width, 0, 0, 0)
+        offset = _aligned(header.nbytes)
+        np.ndarray((n,), dtype=f'S{width}', buffer=shm.buf, offset=offset)[:] = [s.encode() for s in symbols]
+        del header
+        market = cls(shm, owner=True)
+        market._values[:] = np.nan
+        return market
+
+    @classmethod
+    def attach(cls, name):
+        if sys.version_info >= (3, 13):
+            return cls(shared_memory.SharedMemory(name=name, track=False), owner=False)
+        shm = shared_memory.SharedMemory(name=name)
+        if os.name == 'posix':
+            # Attaching registers the block with this process's resource tracker as
+            # well, which would unlink it (and warn of a leak) when this process exits
+            resource_tracker.unregister(shm._name, 'shared_memory')
+        return cls(shm, owner=False)
+
+    @property
+    def name(self):
+        return self.shm.name
+
+    # --- Writers (one process per region) ---
+
+    def publish_quotes(self, rows):
+        """
+        Apply [symbol, bid, ask, last, volume, time] rows (the QuoteStream
+        on_quotes format): latest quote, plus the session bar built from last
+        prices. Unknown symbols are ignored.
+        """
+        import numpy as np
+        known = [r for r in rows if r[0] in self.index]
+        if not known:
+            return 0
+        idx = np.fromiter((self.index[r[0]] for r in known), dtype=np.int64, count=len(known))
+        quotes = np.array([r[1:6] for r in known], dtype=np.float64)
+        # A symbol repeated in one batch keeps its last row
+        idx, last_pos = np.unique(idx[::-1], return_index=True)
+        quotes = quotes[::-1][last_pos]
+        values = self._values
+        header = self._header
+        header[_MARKET_SEQ] += 1
+        try:
+            last = quotes[:, 2]
+            values[idx, OPEN] = np.where(np.isnan(values[idx, OPEN]), last, values[idx, OPEN])
+            values[idx, HIGH] = np.fmax(values[idx, HIGH], last)
+            values[idx, LOW] = np.fmin(values[idx, LOW], last)
+            values[idx, CLOSE] = last
+            values[idx, VOLUME] = quotes[:, 3]
+            values[idx, BID] = quotes[:, 0]
+            values[idx, ASK] = quotes[:, 1]
+            values[idx, LAST] = last
+            values[idx, TIME] = quotes[:, 4]
+        finally:
+            header[_MARKET_SEQ] += 1
+        return len(idx)
+
+    def publish_ranking(self, symbols, scores=None):
+        """Replace the candidate ranking (best first; truncated to max_ranked)"""
+        if scores is None:
+            scores = [0.0] * len(symbols)
+        ranked = [(self.index[s], score) for s, score in zip(symbols, scores) if s in self.index]
+        ranked = ranked[:len(self._ranking)]
+        header = self._header
+        header[_RANKING_SEQ] += 1
+        try:
+            self._ranking[:len(ranked)] = [i for i, _ in ranked]
+            self._scores[:len(ranked)] = [score for _, score in ranked]
+            header[_RANKED] = len(ranked)
+        finally:
+            header[_RANKING_SEQ] += 1
+
+    # --- Readers ---
+
+    def _read(self, seq_word, fn):
+        header = self._header
+        while True:
+            before = int(header[seq_word])
+            if before & 1:
+                self.retries += 1
+                time.sleep(0)
+                continue
+            result = fn()
+            if int(header[seq_word]) == before:
+                return result
+            self.retries += 1
+
+    def read_market(self, fn):
+        """fn(values) on the (symbols x FIELDS) array, consistent with one publish_quotes()"""
+        return self._read(_MARKET_SEQ, lambda: fn(self._values))
+
+    def read_ranking(self, fn):
+        """fn(indices, scores) on the current ranking, consistent with one publish_ranking()"""
+        def call():
+            k = int(self._header[_RANKED])
+            return fn(self._ranking[:k], self._scores[:k])
+        return self._read(_RANKING_SEQ, call)
+
+    def quote(self, symbol):
+        """Latest values for one symbol as a dict, or None before its first quote"""
+        i = self.index.get(symbol)
+        if i is None:
+            return None
+        row = self.read_market(lambda values: values[i].tolist())
+        return None if row[LAST] != row[LAST] else dict(zip(FIELDS, row))
+
+    def candidates(self):
+        """Ranked candidate symbols, best first"""
+        indices = self.read_ranking(lambda indices, scores: indices.tolist())
+        return [self.symbols[i] for i in indices]
+
+    def market_data(self, sectors=None):
+        """select_tickers_adaptive()-style dict of the session bars so far"""
+        rows = self.read_market(lambda values: values[:, :VOLUME + 1].tolist())
+        sectors = sectors or {}
+        return {s: {'open': o, 'high': h, 'low': l, 'close': c, 'volume': v, 'sector': sectors.get(s, 'Unknown')}
+                for s, (o, h, l, c, v) in zip(self.symbols, rows) if o == o}
+
+    @property
+    def market_seq(self):
+        return int(self._header[_MARKET_SEQ])
+
+    @property
+    def ranking_seq(self):
+        return int(self._header[_RANKING_SEQ])
+
+    def close(self):
+        """Detach (and unlink the block if this process created it)"""
+        self._header = self._values = self._ranking = self._scores = None
+        self.shm.close()
+        if self.owner:
+            if sys.version_info < (3, 13) and os.name == 'posix':
+                # A child sharing our resource tracker unregistered the block when it
+                # attached; unlink() unregisters it again
+                resource_tracker.register(self.shm._name, 'shared_memory')
+            self.shm.unlink()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+
+# --- Process entry points ---
+
+def run_feed(name, url, stop, token=None):
+    """Feed process: stream quotes for every symbol of the block into it until `stop` is set"""
+    from quote_stream import QuoteStream
+    market = SharedMarket.attach(name)
+    try:
+        with QuoteStream(url, market.symbols, token=token, on_quotes=market.publish_quotes):
+            stop.wait()
+    finally:
+        market.close()
+
+
+def run_screener(name, stop, interval=1.0, sectors=None, history=None):
+    """
+    Screener process: rank the live session bars with select_tickers_adaptive()
+    every `interval` seconds (when they changed) until `stop` is set
+    """
+    from strategy import detect_market_regime, select_tickers_adaptive
+    market = SharedMarket.attach(name)
+    try:
+        seen = None
+        while not stop.is_set():
+            seq = market.market_seq
+            if seq != seen:
+                market_data = market.market_data(sectors)
+                if market_data:
+                    regime = detect_market_regime(market_data)
+                    market.publish_ranking(select_tickers_adaptive(market_data, market_regime=regime,
+                                                                   historical_data=history))
+                seen = seq
+            stop.wait(interval)
+    finally:
+        market.close()
+
+
+def main():
+    import argparse
+    import multiprocessing
+    from mock_broker import make_universe
+    from quote_stream import QuoteReplayServer, random_tape
+    parser = argparse.ArgumentParser(description="Feed and screener processes sharing one market snapshot")
+    parser.add_argument('--symbols', type=int, default=2000)
+    parser.add_argument('--seconds', type=float, default=5.0)
+    parser.add_argument('--interval-ms', type=float, default=10, help="feed tick interval")
+    args = parser.parse_args()
+    symbols = make_universe(args.symbols)
+    tape = random_tape(symbols, 500)
+    with QuoteReplayServer(tape, interval=args.interval_ms / 1000) as server, SharedMarket.create(symbols) as market:
+        stop = multiprocessing.Event()
+        workers = [multiprocessing.Process(target=run_feed, args=(market.name, server.url, stop)),
+                   multiprocessing.Process(target=run_screener, args=(market.name, stop, 0.5))]
+        for w in workers:
+            w.start()
+        reads = 0
+        started = time.perf_counter()
+        while time.perf_counter() - started < args.seconds:
+            market.quote(symbols[reads % len(symbols)])
+            market.candidates()
+            reads += 1
+        elapsed = time.perf_counter() - started
+        stop.set()
+        for w in workers:
+            w.join()
+        print(f"Executor: {reads / elapsed:,.0f} quote+ranking reads/s ({market.retries} retries), "
+              f"{market.market_seq // 2} feed updates, {market.ranking_seq // 2} rankings, "
+              f"top candidates {market.candidates()[:5]}")
+
+
+if __name__ == "__main__":
+    sys.exit(main())
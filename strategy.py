@@ -65,15 +65,18 @@ CONFIGURATION:
 - Easy deployment for live trading with enhanced signal generation
 """
 
-import numpy as np
-import pandas as pd
+# numpy/pandas are imported inside the functions that use them so that
+# `import strategy` (and therefore `import main`) stays cheap on cold start.
 from datetime import datetime, timedelta
-from config import CUSTOM_TICKERS, POSITION_SIZING, CUSTOM_POSITION_SIZES, STRATEGY_CONFIG, FUNDS
+from config import FUNDS
+from live_config import current as current_config
+from trade_plan import IS_BUY, IS_SELL, Signal, TechnicalAnalysis, TradePlan, fibonacci_levels
 
 def calculate_bollinger_bands(prices, window=20, num_std=2):
     """
     Calculate Bollinger Bands for price analysis
     """
+    import numpy as np
     if len(prices) < window:
         return None, None, None
     
@@ -89,24 +92,13 @@ def calculate_fibonacci_levels(high_price, low_price):
     """
     Calculate Fibonacci retracement levels
     """
-    diff = high_price - low_price
-    
-    fib_levels = {
-        'fib_0': high_price,
-        'fib_236': high_price - (0.236 * diff),
-        'fib_382': high_price - (0.382 * diff),
-        'fib_500': high_price - (0.500 * diff),
-        'fib_618': high_price - (0.618 * diff),
-        'fib_786': high_price - (0.786 * diff),
-        'fib_100': low_price
-    }
-    
-    return fib_levels
+    return fibonacci_levels(high_price, low_price)
 
 def calculate_rsi(prices, window=14):
     """
     Calculate Relative Strength Index (RSI)
     """
+    import numpy as np
     if len(prices) < window + 1:
         return 50  # Neutral RSI if not enough data
     
@@ -129,6 +121,7 @@ def calculate_macd(prices, fast_period=12, slow_period=26, signal_period=9):
     """
     Calculate MACD (Moving Average Convergence Divergence)
     """
+    import pandas as pd
     if len(prices) < slow_period:
         return 0, 0, 0
     
@@ -171,23 +164,20 @@ def analyze_technical_indicators(ticker_data, historical_prices=None):
     """
     if not ticker_data:
         return {}
-    
+    return technical_signals(ticker_data, historical_prices).to_dict()
+
+def technical_signals(ticker_data, historical_prices=None):
+    """
+    analyze_technical_indicators() as a TechnicalAnalysis record of Signal
+    codes (no per-call dicts or string matching)
+    """
     current_price = float(ticker_data['close'])
     open_price = float(ticker_data['open'])
     high_price = float(ticker_data['high'])
     low_price = float(ticker_data['low'])
     
     # Initialize default analysis
-    analysis = {
-        'price_action': 'neutral',
-        'bollinger_signal': 'neutral',
-        'fibonacci_signal': 'neutral',
-        'rsi_signal': 'neutral',
-        'macd_signal': 'neutral',
-        'stochastic_signal': 'neutral',
-        'overall_signal': 'neutral',
-        'confidence': 0.5
-    }
+    analysis = TechnicalAnalysis()
     
     # If historical prices are available, use advanced indicators
     if historical_prices and len(historical_prices) > 20:
@@ -200,13 +190,13 @@ def analyze_technical_indicators(ticker_data, historical_prices=None):
             upper_bb, middle_bb, lower_bb = calculate_bollinger_bands(prices)
             if upper_bb and lower_bb:
                 if current_price <= lower_bb:
-                    analysis['bollinger_signal'] = 'oversold_buy'
+                    analysis.bollinger = Signal.OVERSOLD_BUY
                 elif current_price >= upper_bb:
-                    analysis['bollinger_signal'] = 'overbought_sell'
+                    analysis.bollinger = Signal.OVERBOUGHT_SELL
                 elif current_price < middle_bb:
-                    analysis['bollinger_signal'] = 'below_mean'
+                    analysis.bollinger = Signal.BELOW_MEAN
                 else:
-                    analysis['bollinger_signal'] = 'above_mean'
+                    analysis.bollinger = Signal.ABOVE_MEAN
         except:
             pass
         
@@ -214,13 +204,13 @@ def analyze_technical_indicators(ticker_data, historical_prices=None):
         try:
             rsi = calculate_rsi(prices)
             if rsi < 30:
-                analysis['rsi_signal'] = 'oversold_buy'
+                analysis.rsi = Signal.OVERSOLD_BUY
             elif rsi > 70:
-                analysis['rsi_signal'] = 'overbought_sell'
+                analysis.rsi = Signal.OVERBOUGHT_SELL
             elif rsi < 50:
-                analysis['rsi_signal'] = 'bearish'
+                analysis.rsi = Signal.BEARISH
             else:
-                analysis['rsi_signal'] = 'bullish'
+                analysis.rsi = Signal.BULLISH
         except:
             pass
         
@@ -228,9 +218,9 @@ def analyze_technical_indicators(ticker_data, historical_prices=None):
         try:
             macd, signal, histogram = calculate_macd(prices)
             if macd > signal and histogram > 0:
-                analysis['macd_signal'] = 'bullish'
+                analysis.macd = Signal.BULLISH
             elif macd < signal and histogram < 0:
-                analysis['macd_signal'] = 'bearish'
+                analysis.macd = Signal.BEARISH
         except:
             pass
         
@@ -238,69 +228,55 @@ def analyze_technical_indicators(ticker_data, historical_prices=None):
         try:
             k_percent, d_percent = calculate_stochastic(highs, lows, prices)
             if k_percent < 20:
-                analysis['stochastic_signal'] = 'oversold_buy'
+                analysis.stochastic = Signal.OVERSOLD_BUY
             elif k_percent > 80:
-                analysis['stochastic_signal'] = 'overbought_sell'
+                analysis.stochastic = Signal.OVERBOUGHT_SELL
             elif k_percent > d_percent:
-                analysis['stochastic_signal'] = 'bullish'
+                analysis.stochastic = Signal.BULLISH
             else:
-                analysis['stochastic_signal'] = 'bearish'
+                analysis.stochastic = Signal.BEARISH
         except:
             pass
     
     # Fibonacci Analysis (using day's high/low)
-    try:
-        fib_levels = calculate_fibonacci_levels(high_price, low_price)
-        if current_price <= fib_levels['fib_618']:
-            analysis['fibonacci_signal'] = 'strong_support'
-        elif current_price <= fib_levels['fib_382']:
-            analysis['fibonacci_signal'] = 'support'
-        elif current_price >= fib_levels['fib_382']:
-            analysis['fibonacci_signal'] = 'resistance'
-        else:
-            analysis['fibonacci_signal'] = 'neutral'
-    except:
-        pass
+    diff = high_price - low_price
+    fib_382 = high_price - (0.382 * diff)
+    if current_price <= high_price - (0.618 * diff):
+        analysis.fibonacci = Signal.STRONG_SUPPORT
+    elif current_price <= fib_382:
+        analysis.fibonacci = Signal.SUPPORT
+    elif current_price >= fib_382:
+        analysis.fibonacci = Signal.RESISTANCE
     
     # Price Action Analysis
     price_change = (current_price - open_price) / open_price
     if price_change > 0.02:
-        analysis['price_action'] = 'strong_bullish'
+        analysis.price_action = Signal.STRONG_BULLISH
     elif price_change > 0.005:
-        analysis['price_action'] = 'bullish'
+        analysis.price_action = Signal.BULLISH
     elif price_change < -0.02:
-        analysis['price_action'] = 'strong_bearish'
+        analysis.price_action = Signal.STRONG_BEARISH
     elif price_change < -0.005:
-        analysis['price_action'] = 'bearish'
+        analysis.price_action = Signal.BEARISH
     
     # Calculate overall signal and confidence
-    signals = [
-        analysis['bollinger_signal'],
-        analysis['rsi_signal'],
-        analysis['macd_signal'],
-        analysis['stochastic_signal'],
-        analysis['fibonacci_signal'],
-        analysis['price_action']
-    ]
-    
-    buy_signals = sum(1 for s in signals if 'buy' in s or 'bullish' in s or 'support' in s)
-    sell_signals = sum(1 for s in signals if 'sell' in s or 'bearish' in s or 'resistance' in s)
+    signals = (analysis.bollinger, analysis.rsi, analysis.macd, analysis.stochastic,
+               analysis.fibonacci, analysis.price_action)
+    buy_signals = sum(IS_BUY[s] for s in signals)
+    sell_signals = sum(IS_SELL[s] for s in signals)
     
     if buy_signals >= 4:
-        analysis['overall_signal'] = 'strong_buy'
-        analysis['confidence'] = 0.9
+        analysis.overall = Signal.STRONG_BUY
+        analysis.confidence = 0.9
     elif buy_signals >= 3:
-        analysis['overall_signal'] = 'buy'
-        analysis['confidence'] = 0.7
+        analysis.overall = Signal.BUY
+        analysis.confidence = 0.7
     elif sell_signals >= 4:
-        analysis['overall_signal'] = 'strong_sell'
-        analysis['confidence'] = 0.9
+        analysis.overall = Signal.STRONG_SELL
+        analysis.confidence = 0.9
     elif sell_signals >= 3:
-        analysis['overall_signal'] = 'sell'
-        analysis['confidence'] = 0.7
-    else:
-        analysis['overall_signal'] = 'neutral'
-        analysis['confidence'] = 0.5
+        analysis.overall = Signal.SELL
+        analysis.confidence = 0.7
     
     return analysis
 
@@ -308,6 +284,7 @@ def detect_market_regime(market_data, lookback_days=20):
     """
     Detect market regime (high volatility vs low volatility) and adjust thresholds
     """
+    import numpy as np
     if not market_data:
         return 'normal'
     
@@ -333,10 +310,14 @@ def detect_market_regime(market_data, lookback_days=20):
     else:
         return 'normal'
 
-def select_tickers_adaptive(market_data, allowed_sectors=None, min_per_sector=1, market_regime='normal', historical_data=None):
+def select_tickers_adaptive(market_data, allowed_sectors=None, min_per_sector=1, market_regime='normal', historical_data=None,
+                            symbol_index=None):
     """
-    Enhanced adaptive ticker selection with technical indicators
+    Enhanced adaptive ticker selection with technical indicators. Sector
+    diversification groups by symbol_index's integer sector codes when given,
+    else by the bars' 'sector' labels.
     """
+    import numpy as np
     if allowed_sectors is None:
         allowed_sectors = ['Tech', 'Auto', 'Media', 'E-Commerce', 'Finance', 'Healthcare', 'Energy', 'Consumer']
     
@@ -387,8 +368,9 @@ def select_tickers_adaptive(market_data, allowed_sectors=None, min_per_sector=1,
         volume_threshold = 0.2   # 20% of median volume (lower)
     
     # Score and filter tickers with technical analysis
+    allowed = set(allowed_sectors)
     for ticker, d in market_data.items():
-        if allowed_sectors and d.get('sector') not in allowed_sectors:
+        if allowed_sectors and d.get('sector') not in allowed:
             continue
         
         try:
@@ -437,24 +419,24 @@ def select_tickers_adaptive(market_data, allowed_sectors=None, min_per_sector=1,
                 
                 # Add technical analysis bonus
                 if historical_data and ticker in historical_data:
-                    tech_analysis = analyze_technical_indicators(d, historical_data[ticker])
+                    tech_analysis = technical_signals(d, historical_data[ticker])
                     
                     # Technical indicator bonus scoring
-                    if tech_analysis['overall_signal'] == 'strong_buy':
-                        technical_bonus = 0.3 * tech_analysis['confidence']
-                    elif tech_analysis['overall_signal'] == 'buy':
-                        technical_bonus = 0.2 * tech_analysis['confidence']
-                    elif tech_analysis['overall_signal'] == 'strong_sell':
-                        technical_bonus = -0.2 * tech_analysis['confidence']
-                    elif tech_analysis['overall_signal'] == 'sell':
-                        technical_bonus = -0.1 * tech_analysis['confidence']
+                    if tech_analysis.overall == Signal.STRONG_BUY:
+                        technical_bonus = 0.3 * tech_analysis.confidence
+                    elif tech_analysis.overall == Signal.BUY:
+                        technical_bonus = 0.2 * tech_analysis.confidence
+                    elif tech_analysis.overall == Signal.STRONG_SELL:
+                        technical_bonus = -0.2 * tech_analysis.confidence
+                    elif tech_analysis.overall == Signal.SELL:
+                        technical_bonus = -0.1 * tech_analysis.confidence
                     
                     # Specific indicator bonuses
-                    if tech_analysis['bollinger_signal'] == 'oversold_buy':
+                    if tech_analysis.bollinger == Signal.OVERSOLD_BUY:
                         technical_bonus += 0.1
-                    if tech_analysis['rsi_signal'] == 'oversold_buy':
+                    if tech_analysis.rsi == Signal.OVERSOLD_BUY:
                         technical_bonus += 0.1
-                    if tech_analysis['fibonacci_signal'] == 'strong_support':
+                    if tech_analysis.fibonacci == Signal.STRONG_SUPPORT:
                         technical_bonus += 0.05
                 
                 final_score = base_score + technical_bonus
@@ -470,12 +452,21 @@ def select_tickers_adaptive(market_data, allowed_sectors=None, min_per_sector=1,
     diversified = []
     used = set()
     
-    # First, prioritize technically strong candidates from each sector
-    for sector in allowed_sectors:
-        sector_tickers = [g for g in gainers if g[5] == sector and g[0] not in used and g[6] > 0]  # g[6] is technical_bonus
-        if sector_tickers:
-            diversified.append(sector_tickers[0])
-            used.add(sector_tickers[0][0])
+    # First, prioritize technically strong candidates from each sector. Grouping
+    # is a stable argsort over integer sector codes and gainers is sorted by
+    # score, so each group's first ticker is that sector's best.
+    strong = [g for g in gainers if g[6] > 0]  # g[6] is technical_bonus
+    if strong:
+        from symbol_index import SymbolIndex
+        index = symbol_index if symbol_index is not None else \
+            SymbolIndex([{'symbol': g[0], 'sector': g[5]} for g in strong])
+        groups = index.group_by_sector([g[0] for g in strong])
+        by_symbol = {g[0]: g for g in strong}
+        for sector in allowed_sectors:
+            best = groups.get(sector)
+            if best and best[0] not in used:
+                diversified.append(by_symbol[best[0]])
+                used.add(best[0])
     
     # Fill remaining spots with best candidates (technical analysis considered)
     for g in gainers:
@@ -498,68 +489,66 @@ def select_tickers_adaptive(market_data, allowed_sectors=None, min_per_sector=1,
     
     return [g[0] for g in diversified[:15]]
 
-def decide_entry_exit_adaptive(ticker_data, available_funds=25000, min_tickers=5, market_regime='normal', historical_prices=None):
+# (stop_loss_pct, trailing_trigger, trailing_stop_pct, min_profit_pct, max_allocation) per regime - ENHANCED
+ADAPTIVE_PARAMS = {
+    'high_volatility': (0.03, 1.12, 0.04, 0.008, 0.85),
+    'low_volatility': (0.02, 1.04, 0.02, 0.002, 0.9),
+    'normal': (0.025, 1.08, 0.03, 0.004, 0.8),
+}
+
+def signal_params(market_regime='normal', overall_signal=Signal.NEUTRAL):
+    """
+    ADAPTIVE_PARAMS for a regime adjusted for the overall technical signal:
+    (stop_loss_pct, trailing_trigger, trailing_stop_pct, min_profit_pct, max_allocation)
+    """
+    stop_loss_pct, trailing_trigger, trailing_stop_pct, min_profit_pct, max_allocation = \
+        ADAPTIVE_PARAMS.get(market_regime, ADAPTIVE_PARAMS['normal'])
+    if overall_signal == Signal.STRONG_BUY or overall_signal == Signal.BUY:
+        # More aggressive parameters for strong signals
+        stop_loss_pct *= 0.8  # Tighter stop loss
+        trailing_trigger *= 0.9  # Earlier trailing stop trigger
+        min_profit_pct *= 0.7  # Lower minimum profit requirement
+        max_allocation *= 1.1  # Larger position size
+    elif overall_signal == Signal.STRONG_SELL or overall_signal == Signal.SELL:
+        # More conservative parameters for weak signals
+        stop_loss_pct *= 1.2  # Wider stop loss
+        trailing_trigger *= 1.1  # Later trailing stop trigger
+        min_profit_pct *= 1.3  # Higher minimum profit requirement
+        max_allocation *= 0.8  # Smaller position size
+    return stop_loss_pct, trailing_trigger, trailing_stop_pct, min_profit_pct, max_allocation
+
+def decide_entry_exit_adaptive(ticker_data, available_funds=25000, min_tickers=5, market_regime='normal', historical_prices=None,
+                               budget=None):
     """
     Enhanced adaptive entry/exit decisions with technical indicators
     """
     if not ticker_data:
         return {'entry': None, 'exit': None}
-    
+    return plan_entry_exit(ticker_data, available_funds, min_tickers, market_regime, historical_prices,
+                           budget=budget).to_dict()
+
+def plan_entry_exit(ticker_data, available_funds=25000, min_tickers=5, market_regime='normal', historical_prices=None,
+                    technical=None, budget=None):
+    """
+    decide_entry_exit_adaptive() returning a compact TradePlan (to_dict()
+    gives the legacy dict). ticker_data must not be empty. `technical` is a
+    precomputed technical_signals() result to reuse instead of recomputing.
+    `budget` (dollars, e.g. from allocation.allocation_budgets()) replaces the
+    profit-target sizing: the plan buys as many shares as it affords.
+    """
     entry = ticker_data['open']
     high = ticker_data['high']
     low = ticker_data['low']
     close = ticker_data['close']
     
     # Perform technical analysis
-    tech_analysis = analyze_technical_indicators(ticker_data, historical_prices)
+    tech_analysis = technical if technical is not None else technical_signals(ticker_data, historical_prices)
     
-    # Adaptive parameters based on market regime and technical signals - ENHANCED
-    base_params = {}
-    if market_regime == 'high_volatility':
-        base_params = {
-            'stop_loss_pct': 0.03,
-            'trailing_trigger': 1.12,
-            'trailing_stop_pct': 0.04,
-            'min_profit_pct': 0.008,
-            'max_allocation': 0.85
-        }
-    elif market_regime == 'low_volatility':
-        base_params = {
-            'stop_loss_pct': 0.02,
-            'trailing_trigger': 1.04,
-            'trailing_stop_pct': 0.02,
-            'min_profit_pct': 0.002,
-            'max_allocation': 0.9
-        }
-    else:  # normal
-        base_params = {
-            'stop_loss_pct': 0.025,
-            'trailing_trigger': 1.08,
-            'trailing_stop_pct': 0.03,
-            'min_profit_pct': 0.004,
-            'max_allocation': 0.8
-        }
-    
-    # Adjust parameters based on technical analysis
-    confidence_multiplier = tech_analysis.get('confidence', 0.5)
-    overall_signal = tech_analysis.get('overall_signal', 'neutral')
-    
-    # Technical indicator adjustments
-    if overall_signal in ['strong_buy', 'buy']:
-        # More aggressive parameters for strong signals
-        base_params['stop_loss_pct'] *= 0.8  # Tighter stop loss
-        base_params['trailing_trigger'] *= 0.9  # Earlier trailing stop trigger
-        base_params['min_profit_pct'] *= 0.7  # Lower minimum profit requirement
-        base_params['max_allocation'] *= 1.1  # Larger position size
-    elif overall_signal in ['strong_sell', 'sell']:
-        # More conservative parameters for weak signals
-        base_params['stop_loss_pct'] *= 1.2  # Wider stop loss
-        base_params['trailing_trigger'] *= 1.1  # Later trailing stop trigger
-        base_params['min_profit_pct'] *= 1.3  # Higher minimum profit requirement
-        base_params['max_allocation'] *= 0.8  # Smaller position size
-    
-    # Fibonacci-based entry/exit levels
-    fib_levels = calculate_fibonacci_levels(high, low)
+    # Adaptive parameters based on market regime and technical signals
+    stop_loss_pct, trailing_trigger, trailing_stop_pct, min_profit_pct, max_allocation = \
+        signal_params(market_regime, tech_analysis.overall)
+    confidence_multiplier = tech_analysis.confidence
+    overall_signal = tech_analysis.overall
     
     # Bollinger Bands adjustment for entry
     if historical_prices and len(historical_prices) > 20:
@@ -569,24 +558,24 @@ def decide_entry_exit_adaptive(ticker_data, available_funds=25000, min_tickers=5
                 # Adjust entry based on Bollinger position
                 bb_position = (entry - lower_bb) / (upper_bb - lower_bb)
                 if bb_position < 0.2:  # Near lower band - oversold
-                    base_params['min_profit_pct'] *= 0.6  # Lower profit requirement
-                    base_params['max_allocation'] *= 1.2  # Larger position
+                    min_profit_pct *= 0.6  # Lower profit requirement
+                    max_allocation *= 1.2  # Larger position
                 elif bb_position > 0.8:  # Near upper band - overbought
-                    base_params['min_profit_pct'] *= 1.4  # Higher profit requirement
-                    base_params['max_allocation'] *= 0.7  # Smaller position
+                    min_profit_pct *= 1.4  # Higher profit requirement
+                    max_allocation *= 0.7  # Smaller position
         except:
             pass
     
     # Calculate dynamic stop loss and exit strategy
-    stop_loss = round(entry * (1 - base_params['stop_loss_pct']), 2)
+    stop_loss = round(entry * (1 - stop_loss_pct), 2)
     
     # Enhanced exit logic with Fibonacci levels
     exit_price = close
     exit_type = 'close'
     
     # Check for trailing stop trigger
-    if high >= entry * base_params['trailing_trigger']:
-        trail_exit = round(high * (1 - base_params['trailing_stop_pct']), 2)
+    if high >= entry * trailing_trigger:
+        trail_exit = round(high * (1 - trailing_stop_pct), 2)
         if trail_exit > close:
             exit_price = trail_exit
             exit_type = 'trailing_stop'
@@ -597,38 +586,36 @@ def decide_entry_exit_adaptive(ticker_data, available_funds=25000, min_tickers=5
         exit_type = 'stop_loss'
     
     # Fibonacci-based profit taking
-    elif close >= fib_levels['fib_618'] and close > entry * 1.05:  # At least 5% gain at Fib 61.8%
+    elif close >= high - (0.618 * (high - low)) and close > entry * 1.05:  # At least 5% gain at Fib 61.8%
         exit_price = close
         exit_type = 'fibonacci_profit'
     
     # Technical indicator-based exits
-    elif tech_analysis.get('overall_signal') == 'strong_sell' and close > entry:
+    elif overall_signal == Signal.STRONG_SELL and close > entry:
         exit_price = close
         exit_type = 'technical_exit'
     
     # Enhanced minimum profit check with technical confirmation
     if exit_price > entry:
         profit_pct = (exit_price - entry) / entry
-        min_profit_required = base_params['min_profit_pct']
+        min_profit_required = min_profit_pct
         
         # Reduce minimum profit requirement for strong technical signals
-        if overall_signal == 'strong_buy':
+        if overall_signal == Signal.STRONG_BUY:
             min_profit_required *= 0.5
-        elif overall_signal == 'buy':
+        elif overall_signal == Signal.BUY:
             min_profit_required *= 0.7
         
         if profit_pct < min_profit_required:
-            return {
-                'entry': entry, 
-                'exit': None, 
-                'exit_type': 'skip_low_reward',
-                'technical_analysis': tech_analysis
-            }
+            return TradePlan(entry, None, 'skip_low_reward', shares=None, invested=None, expected_profit=None,
+                             technical=tech_analysis)
     
     # Enhanced position sizing with technical analysis
     allocation = available_funds / max(1, min_tickers)
     
-    if exit_price > entry:
+    if exit_price > entry and budget is not None:
+        shares = int(budget / entry) if budget > 0 else 0
+    elif exit_price > entry:
         profit_per_share = exit_price - entry
         
         # Dynamic target profit based on technical strength
@@ -643,21 +630,21 @@ def decide_entry_exit_adaptive(ticker_data, available_funds=25000, min_tickers=5
         target_profit = base_target * (0.8 + 0.4 * confidence_multiplier)
         
         # Strong technical signals get larger positions
-        if overall_signal == 'strong_buy':
+        if overall_signal == Signal.STRONG_BUY:
             target_profit *= 1.5
-        elif overall_signal == 'buy':
+        elif overall_signal == Signal.BUY:
             target_profit *= 1.2
         
         # Calculate shares
         target_shares = int(target_profit / profit_per_share) if profit_per_share > 0 else 0
-        max_shares_by_allocation = int(allocation * base_params['max_allocation'] / entry)
+        max_shares_by_allocation = int(allocation * max_allocation / entry)
         
         shares = min(target_shares, max_shares_by_allocation)
         
         # Enhanced minimum share logic
-        min_shares = 15 if overall_signal in ['strong_buy', 'buy'] else 10
+        min_shares = 15 if overall_signal == Signal.STRONG_BUY or overall_signal == Signal.BUY else 10
         if shares < min_shares:
-            allocation_pct = 0.6 if overall_signal == 'strong_buy' else 0.5
+            allocation_pct = 0.6 if overall_signal == Signal.STRONG_BUY else 0.5
             shares = max(min_shares, int(allocation * allocation_pct / entry))
             shares = min(shares, max_shares_by_allocation)
     else:
@@ -666,74 +653,84 @@ def decide_entry_exit_adaptive(ticker_data, available_funds=25000, min_tickers=5
     invested = round(shares * entry, 2) if shares > 0 else 0
     expected_profit = round((exit_price - entry) * shares, 2) if shares > 0 else 0
     
-    return {
-        'entry': entry,
-        'exit': exit_price,
-        'exit_type': exit_type,
-        'stop_loss': stop_loss,
-        'shares': shares,
-        'invested': invested,
-        'expected_profit': expected_profit,
-        'market_regime': market_regime,
-        'technical_analysis': tech_analysis,
-        'fibonacci_levels': fib_levels,
-        'confidence': confidence_multiplier
-    }
+    return TradePlan(entry, exit_price, exit_type, stop_loss, shares, invested, expected_profit,
+                     market_regime, tech_analysis, high, low)
 
 def get_custom_tickers():
     """
-    Get the custom ticker list from configuration
+    Get the custom ticker list from the active configuration
     """
-    return CUSTOM_TICKERS
+    return list(current_config().tickers)
 
 def select_custom_tickers(market_data=None):
     """
     Select tickers from the custom configuration list
     """
-    custom_tickers = get_custom_tickers()
+    cfg = current_config()
+    custom_tickers = list(cfg.tickers)
+    max_positions = cfg.position_sizing['max_positions']
     
     if market_data:
         # Filter to only include tickers that have market data
         available_tickers = [ticker for ticker in custom_tickers if ticker in market_data]
-        return available_tickers[:POSITION_SIZING['max_positions']]
+        return available_tickers[:max_positions]
     else:
         # Return all custom tickers up to max positions
-        return custom_tickers[:POSITION_SIZING['max_positions']]
+        return custom_tickers[:max_positions]
+
+REGIME_SIZE_MULTIPLIERS = {'high_volatility': 0.8, 'low_volatility': 1.2}  # adaptive sizing per regime
 
 def calculate_position_size(ticker, price, available_funds, market_regime='normal'):
     """
     Calculate position size based on configuration method
     """
-    method = POSITION_SIZING['method']
-    
-    if method == 'custom' and ticker in CUSTOM_POSITION_SIZES:
-        # Use custom position size for this ticker
-        target_value = CUSTOM_POSITION_SIZES[ticker]
-    elif method == 'equal':
-        # Equal position sizing
-        target_value = available_funds / POSITION_SIZING['max_positions']
+    shares, invested = size_positions([ticker], [price], available_funds, market_regime)
+    return int(shares[0]), float(invested[0])
+
+def size_positions(tickers, prices, available_funds, market_regimes='normal', confidences=None, targets=None):
+    """
+    calculate_position_size() for a whole book in one vectorized pass.
+    Returns (shares, invested) arrays in candidate order.
+    
+    Dollar targets follow the configured method ('equal': funds / max_positions;
+    'adaptive': that scaled by regime, and by 0.8 + 0.4 * confidence when
+    confidences are given; 'custom': the ticker's custom size, else adaptive)
+    unless `targets` gives them directly. Each is clamped to
+    [min_position_value, max_position_value] and the candidates are then funded
+    in order (best first) from one pool of available_funds: the running total
+    is capped at the pool, so a candidate gets what is left once those before
+    it are funded. Unused dollars from rounding down to whole shares are not
+    passed on. Candidates without a positive price get nothing.
+    """
+    import numpy as np
+    cfg = current_config()
+    sizing = cfg.position_sizing
+    prices = np.asarray(prices, dtype=float)
+    n = len(prices)
+    if targets is not None:
+        target = np.array(targets, dtype=float)
     else:
-        # Adaptive position sizing (default)
-        base_allocation = available_funds / POSITION_SIZING['max_positions']
-        
-        # Adjust based on market regime
-        if market_regime == 'high_volatility':
-            target_value = base_allocation * 0.8  # Reduce size in volatile markets
-        elif market_regime == 'low_volatility':
-            target_value = base_allocation * 1.2  # Increase size in stable markets
+        base = available_funds / sizing['max_positions']
+        if sizing['method'] == 'equal':
+            target = np.full(n, base)
         else:
-            target_value = base_allocation
-    
-    # Apply min/max constraints
-    target_value = max(target_value, POSITION_SIZING['min_position_value'])
-    target_value = min(target_value, POSITION_SIZING['max_position_value'])
-    target_value = min(target_value, available_funds)
-    
-    # Calculate number of shares
-    shares = int(target_value / price) if price > 0 else 0
-    actual_investment = shares * price
-    
-    return shares, actual_investment
+            regimes = np.broadcast_to(np.asarray(market_regimes, dtype=object), (n,))
+            target = base * np.select([regimes == r for r in REGIME_SIZE_MULTIPLIERS],
+                                      list(REGIME_SIZE_MULTIPLIERS.values()), 1.0)
+            if confidences is not None:
+                target *= 0.8 + 0.4 * np.asarray(confidences, dtype=float)
+            if sizing['method'] == 'custom' and cfg.custom_sizes:
+                index = np.fromiter((cfg.ticker_index.get(t, -1) for t in tickers), dtype=np.int64, count=n)
+                custom = np.where(index >= 0, cfg.size_array[index], np.nan)
+                target = np.where(np.isnan(custom), target, custom)
+    
+    # Apply min/max constraints, then fund in order from the shared pool
+    priced = prices > 0
+    target = np.where(priced, np.clip(target, sizing['min_position_value'], sizing['max_position_value']), 0.0)
+    funded = np.diff(np.minimum(np.cumsum(target), max(available_funds, 0)), prepend=0.0)
+    shares = np.zeros(n, dtype=np.int64)
+    shares[priced] = np.floor(funded[priced] / prices[priced])
+    return shares, shares * np.where(priced, prices, 0.0)
 
 # Legacy function names for backward compatibility
 def select_tickers(market_data, allowed_sectors=None, min_per_sector=1, historical_data=None):
@@ -741,8 +738,9 @@ def select_tickers(market_data, allowed_sectors=None, min_per_sector=1, historic
     market_regime = detect_market_regime(market_data)
     return select_tickers_adaptive(market_data, allowed_sectors, min_per_sector, market_regime, historical_data)
 
-def decide_entry_exit(ticker_data, available_funds=25000, min_tickers=5, historical_prices=None):
+def decide_entry_exit(ticker_data, available_funds=25000, min_tickers=5, historical_prices=None, budget=None):
     """Enhanced legacy wrapper with technical analysis support"""
     # For legacy calls, we don't have market context, so use normal regime
     market_regime = 'normal'
-    return decide_entry_exit_adaptive(ticker_data, available_funds, min_tickers, market_regime, historical_prices)
+    return decide_entry_exit_adaptive(ticker_data, available_funds, min_tickers, market_regime, historical_prices,
+                                      budget)
@@ -0,0 +1,124 @@
+# Symbol metadata index for the ticker universe
+#
+# Loads sector, industry, leveraged/inverse ETF flags, average volume and share
+# class for every symbol once from a local CSV (symbols.csv by default) into
+# integer-coded arrays, so sector grouping is a bincount/argsort over codes
+# instead of string comparisons. Unknown symbols map to the 'Unknown' sector.
+
+import csv
+import os
+
+import numpy as np
+
+DEFAULT_SYMBOLS_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'symbols.csv')
+UNKNOWN = 'Unknown'
+
+_cache = {}
+
+
+class SymbolIndex:
+    """
+    Column-oriented symbol metadata.
+
+    symbols[i] has sector sector_names[sector_code[i]], industry
+    industry_names[industry_code[i]], flags leveraged[i] / inverse[i],
+    avg_volume[i] and share_class[i]. Code 0 is always 'Unknown'.
+    """
+
+    def __init__(self, rows):
+        self.symbols = [r['symbol'] for r in rows]
+        self.position = {s: i for i, s in enumerate(self.symbols)}
+        self.sector_names, self.sector_code = self._encode([r.get('sector') for r in rows])
+        self.industry_names, self.industry_code = self._encode([r.get('industry') for r in rows])
+        self.leveraged = np.array([str(r.get('leveraged', '0')) in ('1', 'True', 'true') for r in rows], dtype=bool)
+        self.inverse = np.array([str(r.get('inverse', '0')) in ('1', 'True', 'true') for r in rows], dtype=bool)
+        self.avg_volume = np.array([float(r.get('avg_volume') or 0) for r in rows])
+        self.share_class = [r.get('share_class') or '' for r in rows]
+        self._sector_lookup = {name: code for code, name in enumerate(self.sector_names)}
+
+    @staticmethod
+    def _encode(values):
+        names = [UNKNOWN]
+        lookup = {UNKNOWN: 0}
+        codes = np.empty(len(values), dtype=np.int32)
+        for i, value in enumerate(values):
+            value = value or UNKNOWN
+            code = lookup.get(value)
+            if code is None:
+                code = lookup[value] = len(names)
+                names.append(value)
+            codes[i] = code
+        return names, codes
+
+    def __len__(self):
+        return len(self.symbols)
+
+    def __contains__(self, symbol):
+        return symbol in self.position
+
+    def positions(self, symbols):
+        """Row index per symbol (-1 for symbols not in the index)"""
+        position = self.position
+        return np.array([position.get(s, -1) for s in symbols], dtype=np.int64)
+
+    def sector_codes(self, symbols):
+        """Integer sector code per symbol (0 / 'Unknown' if not in the index)"""
+        rows = self.positions(symbols)
+        return np.where(rows >= 0, self.sector_code[rows], 0)
+
+    def sector_code_of(self, sector):
+        return self._sector_lookup.get(sector, 0)
+
+    def sector_of(self, symbol):
+        i = self.position.get(symbol)
+        return self.sector_names[self.sector_code[i]] if i is not None else UNKNOWN
+
+    def info(self, symbol):
+        i = self.position.get(symbol)
+        if i is None:
+            return None
+        return {
+            'symbol': symbol,
+            'sector': self.sector_names[self.sector_code[i]],
+            'industry': self.industry_names[self.industry_code[i]],
+            'leveraged': bool(self.leveraged[i]),
+            'inverse': bool(self.inverse[i]),
+            'avg_volume': float(self.avg_volume[i]),
+            'share_class': self.share_class[i],
+        }
+
+    def sector_counts(self, symbols):
+        """Number of symbols per sector code (bincount over codes)"""
+        return np.bincount(self.sector_codes(symbols), minlength=len(self.sector_names))
+
+    def group_by_sector(self, symbols):
+        """{sector name: [symbols]} using a stable argsort over sector codes"""
+        codes = self.sector_codes(symbols)
+        order = np.argsort(codes, kind='stable')
+        bounds = np.cumsum(np.bincount(codes, minlength=len(self.sector_names)))
+        groups = {}
+        start = 0
+        for code, end in enumerate(bounds):
+            if end > start:
+                groups[self.sector_names[code]] = [symbols[j] for j in order[start:end]]
+            start = end
+        return groups
+
+
+def load_symbol_index(path=DEFAULT_SYMBOLS_FILE):
+    """Load (once per path) and return the SymbolIndex for a metadata CSV"""
+    index = _cache.get(path)
+    if index is None:
+        rows = []
+        if os.path.exists(path):
+            with open(path, newline='') as f:
+                rows = list(csv.DictReader(f))
+        index = _cache[path] = SymbolIndex(rows)
+    return index
+
+
+def index_from_market(market):
+    """Build a SymbolIndex from a synthetic_data market dict (tickers/sectors/leveraged)"""
+    rows = [{'symbol': t, 'sector': s, 'leveraged': int(l)}
+            for t, s, l in zip(market['tickers'], market['sectors'], market['leveraged'])]
+    return SymbolIndex(rows)
@@ -0,0 +1,237 @@
+#!/usr/bin/env python3
+"""
+Synthetic market data generator for stress-testing the strategy at scale.
+
+Produces years of correlated daily OHLCV bars for universes of 10 to 10,000+
+tickers, fully vectorized and deterministic for a given seed:
+  - a sticky Markov chain of market regimes whose average daily range
+    (high - low) / open lands inside the bands used by detect_market_regime
+    (< 1.5% low_volatility, 1.5-3.5% normal, > 3.5% high_volatility)
+  - returns from a market factor + sector factor + idiosyncratic noise
+  - NYSE session dates (trading_calendar), so there are no holiday bars
+  - sector labels, leveraged tickers (3x volatility) and per-ticker volume
+    profiles where volume rises with the size of the day's move
+
+The result is a dict of (days, tickers) arrays. It can be fed to
+run_backtest(data=to_frames(market), symbol_index=index_from_market(market)), consumed day by day through
+to_day_dicts(), or saved to / loaded from an .npz file.
+
+Usage:
+  python synthetic_data.py --tickers 1000 --years 5 --seed 7 --out synthetic.npz
+  python synthetic_data.py --stress 10,100,1000,5000
+"""
+
+import argparse
+import time
+
+import numpy as np
+
+SECTORS = ['Tech', 'Auto', 'Media', 'E-Commerce', 'Finance', 'Healthcare', 'Energy', 'Consumer']
+SECTOR_WEIGHTS = [0.30, 0.05, 0.08, 0.07, 0.18, 0.14, 0.08, 0.10]
+
+REGIMES = ['low_volatility', 'normal', 'high_volatility']
+# Target average daily range per regime, well inside detect_market_regime's bands
+REGIME_RANGE = np.array([0.010, 0.025, 0.050])
+# Daily transition probabilities (rows: from, cols: to)
+REGIME_TRANSITIONS = np.array([
+    [0.97, 0.03, 0.00],
+    [0.02, 0.96, 0.02],
+    [0.00, 0.06, 0.94],
+])
+
+TRADING_DAYS_PER_YEAR = 252
+
+
+def _regime_path(rng, n_days, start_regime=1):
+    cumulative = REGIME_TRANSITIONS.cumsum(axis=1)
+    draws = rng.random(n_days)
+    path = np.empty(n_days, dtype=np.int8)
+    state = start_regime
+    for t in range(n_days):
+        path[t] = state
+        state = int(np.searchsorted(cumulative[state], draws[t], side='right'))
+    return path
+
+
+def generate_market_data(n_tickers=100, years=1, start='2020-01-01', seed=0, tickers=None,
+                         leveraged_fraction=0.05, start_regime='normal', dtype=np.float32, chunk_days=TRADING_DAYS_PER_YEAR):
+    """
+    Generate a synthetic market.
+
+    Returns a dict with:
+      'dates' (datetime64[D] array), 'tickers', 'sectors', 'leveraged' (bool array),
+      'regimes' (regime name per day), 'open', 'high', 'low', 'close' (days x tickers
+      arrays of `dtype`) and 'volume' (days x tickers int64).
+    """
+    from trading_calendar import sessions_from
+
+    rng = np.random.default_rng(seed)
+    if tickers is None:
+        tickers = [f"SYN{i:05d}" for i in range(n_tickers)]
+    tickers = list(tickers)
+    n = len(tickers)
+    dates = sessions_from(start, int(round(years * TRADING_DAYS_PER_YEAR))).values.astype('datetime64[D]')
+    n_days = len(dates)
+
+    # Static per-ticker attributes
+    sector_codes = rng.choice(len(SECTORS), size=n, p=SECTOR_WEIGHTS)
+    leveraged = rng.random(n) < leveraged_fraction
+    vol_mult = np.exp(rng.normal(0.0, 0.25, n)) * np.where(leveraged, 3.0, 1.0)
+    vol_mult /= vol_mult.mean()  # keep the cross-sectional average range on target
+    beta = rng.uniform(0.6, 1.4, n)
+    sector_loading = rng.uniform(0.3, 0.8, n)
+    base_volume = np.exp(rng.uniform(np.log(2e5), np.log(5e7), n))
+    price = np.exp(rng.uniform(np.log(5), np.log(800), n))
+
+    regime_path = _regime_path(rng, n_days, REGIMES.index(start_regime))
+
+    out = {k: np.empty((n_days, n), dtype=dtype) for k in ('open', 'high', 'low', 'close')}
+    out['volume'] = np.empty((n_days, n), dtype=np.int64)
+
+    for lo in range(0, n_days, chunk_days):
+        hi = min(n_days, lo + chunk_days)
+        days = hi - lo
+        # Expected range of a day is ~2.2x the intraday sigma under this construction
+        sigma = (REGIME_RANGE[regime_path[lo:hi]] / 2.2)[:, None] * vol_mult[None, :]
+
+        market = rng.standard_normal((days, 1))
+        sector = rng.standard_normal((days, len(SECTORS)))[:, sector_codes]
+        idio = rng.standard_normal((days, n))
+        factor = beta * 0.5 * market + sector_loading * 0.5 * sector
+        z = (factor + idio) / np.sqrt(1.0 + (0.5 * beta) ** 2 + (0.5 * sector_loading) ** 2)
+        intraday = sigma * z
+        gap = 0.25 * sigma * rng.standard_normal((days, n))
+
+        # Open/close path, carrying the previous close across days and chunks
+        log_ret = gap + intraday
+        cum = np.cumsum(log_ret, axis=0)
+        close = price * np.exp(cum)
+        prev_close = np.vstack([price[None, :], close[:-1]])
+        open_ = prev_close * np.exp(gap)
+
+        # Extend beyond the open/close body by half-normal excursions
+        up = np.abs(rng.standard_normal((days, n))) * sigma * 0.7
+        down = np.abs(rng.standard_normal((days, n))) * sigma * 0.7
+        high = np.maximum(open_, close) * np.exp(up)
+        low = np.minimum(open_, close) * np.exp(-down)
+
+        # Volume: per-ticker base, heavier on big moves and in volatile regimes
+        move = np.abs(log_ret) / sigma
+        volume = base_volume * np.exp(0.3 * rng.standard_normal((days, n))) * (0.6 + 0.4 * move)
+        volume *= (1.0 + 0.5 * regime_path[lo:hi])[:, None]
+
+        out['open'][lo:hi] = open_
+        out['high'][lo:hi] = high
+        out['low'][lo:hi] = low
+        out['close'][lo:hi] = close
+        out['volume'][lo:hi] = volume.astype(np.int64)
+        price = close[-1]
+
+    out.update({
+        'dates': dates,
+        'tickers': tickers,
+        'sectors': [SECTORS[c] for c in sector_codes],
+        'leveraged': leveraged,
+        'regimes': [REGIMES[r] for r in regime_path],
+    })
+    return out
+
+
+def to_day_dicts(market, day):
+    """
+    The market_data dict for one day (by index) in the format consumed by
+    detect_market_regime / select_tickers_adaptive / decide_entry_exit_adaptive.
+    """
+    o, h, l, c, v = (market[k][day].tolist() for k in ('open', 'high', 'low', 'close', 'volume'))
+    return {
+        ticker: {'open': o[j], 'high': h[j], 'low': l[j], 'close': c[j], 'volume': v[j], 'sector': sector}
+        for j, (ticker, sector) in enumerate(zip(market['tickers'], market['sectors']))
+    }
+
+
+def to_frames(market):
+    """Per-ticker DataFrames in the download_data() layout, for run_backtest(data=...)"""
+    import pandas as pd
+
+    index = pd.DatetimeIndex(market['dates'])
+    frames = {}
+    for j, ticker in enumerate(market['tickers']):
+        frames[ticker] = pd.DataFrame({
+            'Open': market['open'][:, j], 'High': market['high'][:, j], 'Low': market['low'][:, j],
+            'Close': market['close'][:, j], 'Volume': market['volume'][:, j],
+        }, index=index)
+    return frames
+
+
+def save_market(market, path):
+    """Write a generated market to an uncompressed .npz file"""
+    np.savez(path, dates=market['dates'], tickers=np.array(market['tickers']), sectors=np.array(market['sectors']),
+             leveraged=market['leveraged'], regimes=np.array(market['regimes']),
+             open=market['open'], high=market['high'], low=market['low'], close=market['close'],
+             volume=market['volume'])
+
+
+def load_market(path):
+    """Load a market written by save_market()"""
+    with np.load(path) as f:
+        market = {k: f[k] for k in f.files}
+    for key in ('tickers', 'sectors', 'regimes'):
+        market[key] = market[key].tolist()
+    return market
+
+
+def stress_selection(sizes, days=5, seed=0):
+    """
+    Time one morning's regime detection, ticker selection and entry/exit
+    planning at each universe size, to find where the per-day cost stops
+    scaling linearly.
+    """
+    from strategy import detect_market_regime, select_tickers_adaptive, decide_entry_exit_adaptive
+
+    print(f"{'tickers':>8} {'regime ms':>10} {'select ms':>10} {'plan ms':>9} {'us/ticker':>10}")
+    for size in sizes:
+        market = generate_market_data(n_tickers=size, years=days / TRADING_DAYS_PER_YEAR + 0.01, seed=seed)
+        timings = np.zeros(3)
+        for day in range(1, days):
+            prev, today = to_day_dicts(market, day - 1), to_day_dicts(market, day)
+            t0 = time.perf_counter()
+            regime = detect_market_regime(prev)
+            t1 = time.perf_counter()
+            selected = select_tickers_adaptive(prev, market_regime=regime)
+            t2 = time.perf_counter()
+            for ticker in selected:
+                decide_entry_exit_adaptive(today[ticker], 25000, max(5, len(selected)), regime)
+            t3 = time.perf_counter()
+            timings += (t1 - t0, t2 - t1, t3 - t2)
+        timings = timings / (days - 1) * 1000
+        print(f"{size:>8} {timings[0]:>10.2f} {timings[1]:>10.2f} {timings[2]:>9.2f} "
+              f"{timings.sum() * 1000 / size:>10.2f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate synthetic OHLCV data for stress tests")
+    parser.add_argument('--tickers', type=int, default=100)
+    parser.add_argument('--years', type=float, default=1)
+    parser.add_argument('--start', default='2020-01-01')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--out', help="write the market to this .npz file")
+    parser.add_argument('--stress', help="comma-separated universe sizes to time selection at")
+    args = parser.parse_args()
+
+    if args.stress:
+        stress_selection([int(s) for s in args.stress.split(',')], seed=args.seed)
+        return
+
+    t0 = time.perf_counter()
+    market = generate_market_data(args.tickers, args.years, args.start, args.seed)
+    elapsed = time.perf_counter() - t0
+    regimes = {r: market['regimes'].count(r) for r in REGIMES}
+    print(f"Generated {len(market['dates'])} days x {len(market['tickers'])} tickers in {elapsed:.2f}s")
+    print(f"Regime days: {regimes}")
+    if args.out:
+        save_market(market, args.out)
+        print(f"Saved to {args.out}")
+
+
+if __name__ == "__main__":
+    main()
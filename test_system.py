@@ -6,8 +6,17 @@ Tests all major components to ensure they work together properly
 
 import sys
 import os
+import subprocess
 from datetime import datetime
 
+# Cold-start budget for `import main` (microseconds, as reported by -X importtime;
+# best of IMPORT_TIME_RUNS so a busy machine does not fail the test)
+IMPORT_TIME_BUDGET_US = 50000
+IMPORT_TIME_RUNS = 5
+HEAVY_MODULES = ('numpy', 'pandas', 'requests', 'yfinance', 'matplotlib')
+# Only needed once main() runs, imported there
+DEFERRED_MODULES = ('order_manager', 'journal', 'risk_engine', 'allocation', 'concurrent.futures')
+
 def test_imports():
     """Test that all modules can be imported"""
     try:
@@ -82,6 +91,1459 @@ def test_main_demo():
         print(f"❌ Main demo test error: {e}")
         return False
 
+def test_startup_import_time():
+    """Test that importing the live bot path stays within the cold-start budget"""
+    try:
+        here = os.path.dirname(os.path.abspath(__file__))
+        probe = (
+            "import sys, main; "
+            f"print(','.join(m for m in {HEAVY_MODULES + DEFERRED_MODULES!r} if m in sys.modules))"
+        )
+        cmd = [sys.executable, '-X', 'importtime', '-c', probe]
+        # First run warms the bytecode cache, the later ones are what cron/supervisor restarts see
+        subprocess.run(cmd, cwd=here, capture_output=True, text=True)
+        cumulative_us = None
+        for _ in range(IMPORT_TIME_RUNS):
+            result = subprocess.run(cmd, cwd=here, capture_output=True, text=True)
+            if result.returncode != 0:
+                print(f"❌ Startup test error: {result.stderr.strip().splitlines()[-1:]}")
+                return False
+            for line in result.stderr.splitlines():
+                parts = line.split('|')
+                if len(parts) == 3 and parts[2].strip() == 'main':
+                    run_us = int(parts[1].strip())
+                    cumulative_us = run_us if cumulative_us is None else min(cumulative_us, run_us)
+        loaded_eagerly = result.stdout.strip()
+        
+        if cumulative_us is None:
+            print("❌ Startup test failed - no importtime entry for main")
+            return False
+        if loaded_eagerly:
+            print(f"❌ Startup test failed - modules imported eagerly: {loaded_eagerly}")
+            return False
+        if cumulative_us > IMPORT_TIME_BUDGET_US:
+            print(f"❌ Startup test failed - import main took {cumulative_us/1000:.1f}ms "
+                  f"(budget {IMPORT_TIME_BUDGET_US/1000:.0f}ms)")
+            return False
+        print(f"✅ Startup test passed - import main took {cumulative_us/1000:.1f}ms")
+        return True
+    except Exception as e:
+        print(f"❌ Startup test error: {e}")
+        return False
+
+def test_trade_journal():
+    """Test that the trade journal batches, rotates daily and replays in order"""
+    try:
+        import tempfile
+        from datetime import timedelta
+        from journal import TradeJournal, read_journal
+        
+        for fmt in ('jsonl', 'framed'):
+            with tempfile.TemporaryDirectory() as log_dir:
+                day_one = datetime(2024, 3, 1, 9, 30)
+                now = [day_one]
+                journal = TradeJournal(log_dir=log_dir, fmt=fmt, max_batch=50,
+                                       flush_interval=0.05, clock=lambda: now[0])
+                for i in range(200):
+                    if i == 150:
+                        now[0] = day_one + timedelta(days=1)
+                    journal.record('SOXL', {'entry': 26.0, 'exit': 27.2, 'shares': i})
+                journal.close()
+                
+                first = list(read_journal(journal.path_for('20240301')))
+                second = list(read_journal(journal.path_for('20240302')))
+                shares = [r['shares'] for r in first + second]
+                if len(first) != 150 or len(second) != 50 or shares != list(range(200)):
+                    print(f"❌ Journal test failed ({fmt}) - got {len(first)}/{len(second)} records")
+                    return False
+
+        # A failed write (disk full) keeps the batch for the next flush, without duplicates
+        from unittest import mock
+        import journal as journal_module
+        with tempfile.TemporaryDirectory() as log_dir:
+            journal = TradeJournal(log_dir=log_dir, flush_interval=60, clock=lambda: day_one)
+            for i in range(10):
+                journal.record('SOXL', {'shares': i})
+            real_fsync = journal_module.os.fsync
+            failures = [OSError(28, 'No space left on device')]
+
+            def fsync(fd):
+                if failures:
+                    raise failures.pop()
+                real_fsync(fd)
+
+            with mock.patch.object(journal_module.os, 'fsync', fsync):
+                try:
+                    journal.flush()
+                except OSError:
+                    pass
+            for i in range(10, 15):
+                journal.record('SOXL', {'shares': i})
+            journal.close()
+            shares = [r['shares'] for r in read_journal(journal.path_for('20240301'))]
+            if shares != list(range(15)) or journal.write_errors != 1:
+                print(f"❌ Journal test failed - after a failed write got {shares}, {journal.write_errors} errors")
+                return False
+
+            # A final flush that fails still closes the file
+            journal = TradeJournal(log_dir=log_dir, flush_interval=60)
+            journal.record('SOXL', {'shares': 0})
+            journal.flush()
+            journal.record('SOXL', {'shares': 1})
+            with mock.patch.object(journal_module.os, 'fsync', side_effect=OSError(5, 'I/O error')):
+                try:
+                    journal.close()
+                except OSError:
+                    pass
+            if journal._file is not None:
+                print("❌ Journal test failed - file left open after a failed close")
+                return False
+        print("✅ Journal test passed - 200 records replayed across a daily rotation, failed writes retried")
+        return True
+    except Exception as e:
+        print(f"❌ Journal test error: {e}")
+        return False
+
+class FakeBroker:
+    """In-process broker stand-in: market orders fill at once, stops rest until triggered"""
+    
+    def __init__(self):
+        self.orders = {}
+        self.next_id = 1
+    
+    def place_order(self, symbol, qty, side, order_type, price=None, stop_price=None, client_order_id=None):
+        order_id = f"B{self.next_id}"
+        self.next_id += 1
+        filled = order_type == 'market'
+        self.orders[order_id] = {
+            'orderId': order_id, 'clientOrderId': client_order_id, 'symbol': symbol,
+            'status': 'filled' if filled else 'working',
+            'filledQuantity': qty if filled else 0, 'avgFillPrice': 100.0 if filled else None,
+        }
+        return dict(self.orders[order_id])
+    
+    def cancel_order(self, order_id):
+        order = self.orders.get(order_id)
+        if order is None or order['status'] != 'working':
+            return None
+        order['status'] = 'cancelled'
+        return dict(order)
+    
+    def get_orders(self, status=None):
+        return [dict(o) for o in self.orders.values() if status is None or o['status'] == status]
+
+def test_order_manager():
+    """Test batched submission, stop arming, cancel-and-replace and reconciliation"""
+    try:
+        import time
+        from order_manager import OrderManager
+        
+        broker = FakeBroker()
+        orders = OrderManager(broker, batch_size=50)
+        symbols = [f"SYM{i}" for i in range(300)]
+        for symbol in symbols:
+            orders.place_trade_plan(symbol, {'entry': 100.0, 'exit': 104.0, 'stop_loss': 97.5, 'shares': 10})
+        started = time.perf_counter()
+        orders.submit_pending()
+        # No pacing of its own: rate limiting belongs to the broker client's shared limiter
+        if time.perf_counter() - started > 2:
+            print("❌ Order manager test failed - submission was throttled inside the order manager")
+            return False
+        
+        counts = orders.counts()
+        if counts['filled'] != 300 or counts['working'] != 300:
+            print(f"❌ Order manager test failed - unexpected states {counts}")
+            return False
+        
+        replacement = orders.update_stop('SYM7', 101.25)
+        if replacement is None or orders.working_stop('SYM7') is not replacement or replacement.stop_price != 101.25:
+            print("❌ Order manager test failed - stop was not replaced")
+            return False
+        if orders.update_stop('SYM7', 99.0) is not None:
+            print("❌ Order manager test failed - stop moved down")
+            return False
+        
+        # Broker-side fill of one stop picked up by polling
+        stop = orders.working_stop('SYM3')
+        broker.orders[stop.broker_id].update(status='filled', filledQuantity=10, avgFillPrice=97.5)
+        orders.reconcile()
+        if orders.position('SYM3') != 0 or orders.position('SYM4') != 10:
+            print("❌ Order manager test failed - fill not reconciled")
+            return False
+        orders.close()
+        print(f"✅ Order manager test passed - {orders.counts()}")
+        return True
+    except Exception as e:
+        print(f"❌ Order manager test error: {e}")
+        return False
+
+def test_mock_broker():
+    """Test FidelityAPI and OrderManager end to end against the local mock broker"""
+    try:
+        from mock_broker import MockBrokerServer
+        from order_manager import OrderManager
+        from fidelity_api import FidelityAPI
+        
+        with MockBrokerServer(n_symbols=2000, seed=1, fill_latency_ms=100) as server:
+            if FidelityAPI(base_url=server.base_url, oauth_url=server.url).get_account_info() is not None:
+                print("❌ Mock broker test failed - unauthenticated request succeeded")
+                return False
+            api = server.api()
+            quote = api.get_market_data('SYM01500')
+            if not quote or quote['bid'] >= quote['ask']:
+                print(f"❌ Mock broker test failed - bad quote {quote}")
+                return False
+            
+            orders = OrderManager(api, batch_size=25)
+            for symbol in server.exchange.symbols[:100]:
+                orders.place_trade_plan(symbol, {'entry': 1.0, 'exit': 1.1, 'stop_loss': 0.01, 'shares': 5})
+            orders.submit_pending()
+            if orders.working_stop(server.exchange.symbols[0]) is not None:
+                print("❌ Mock broker test failed - stop sent before its entry filled")
+                return False
+            unfilled = orders.await_entries(timeout=5, interval=0.05)
+            account = api.get_account_info()
+            orders.close()
+            
+            counts = orders.counts()
+            if unfilled or counts['filled'] != 100 or counts['working'] != 100 or len(account['positions']) != 100:
+                print(f"❌ Mock broker test failed - {counts}, {len(account['positions'])} positions")
+                return False
+        # Concurrent refreshes with one refresh token: exactly one is honoured
+        import threading
+        exchange = server.exchange
+        refresh = exchange.issue_token({'grant_type': 'authorization_code', 'code': 'x'})['refresh_token']
+        barrier = threading.Barrier(16)
+        granted = []
+        def redeem():
+            barrier.wait()
+            granted.append(exchange.issue_token({'grant_type': 'refresh_token', 'refresh_token': refresh}))
+        threads = [threading.Thread(target=redeem) for _ in range(16)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        if sum(g is not None for g in granted) != 1:
+            print(f"❌ Mock broker test failed - refresh token redeemed {sum(g is not None for g in granted)} times")
+            return False
+        # Proxy settings are resolved per host: the local broker bypasses the proxy, the token host does not
+        from unittest import mock
+        with mock.patch.dict(os.environ, {'HTTPS_PROXY': 'http://proxy.invalid:3128', 'NO_PROXY': '127.0.0.1'}):
+            session = FidelityAPI(base_url=server.base_url)._http()
+            local = session.merge_environment_settings(server.base_url, {}, None, None, None)['proxies']
+            remote = session.merge_environment_settings(f"{FidelityAPI.OAUTH_URL}/token", {}, None, None, None)['proxies']
+        if not session.trust_env or local.get('http') or remote.get('https') != 'http://proxy.invalid:3128':
+            print(f"❌ Mock broker test failed - proxies {local} locally, {remote} for the token host")
+            return False
+        print(f"✅ Mock broker test passed - 100 entries filled after 100ms, 100 stops working, cash ${account['cash']:,.2f}")
+        return True
+    except Exception as e:
+        print(f"❌ Mock broker test error: {e}")
+        return False
+
+def test_synthetic_data():
+    """Test the synthetic market generator: determinism, regimes and backtest hookup"""
+    try:
+        import numpy as np
+        from synthetic_data import generate_market_data, to_day_dicts, to_frames
+        from strategy import detect_market_regime
+        from backtest import run_backtest
+        from config import CUSTOM_TICKERS
+        
+        market = generate_market_data(n_tickers=300, years=1, seed=42)
+        again = generate_market_data(n_tickers=300, years=1, seed=42)
+        if not np.array_equal(market['close'], again['close']):
+            print("❌ Synthetic data test failed - same seed gave different data")
+            return False
+        if not (market['low'] <= np.minimum(market['open'], market['close'])).all() or \
+                not (market['high'] >= np.maximum(market['open'], market['close'])).all():
+            print("❌ Synthetic data test failed - inconsistent OHLC bars")
+            return False
+        days = len(market['dates'])
+        matches = sum(detect_market_regime(to_day_dicts(market, i)) == market['regimes'][i] for i in range(days))
+        if matches / days < 0.95:
+            print(f"❌ Synthetic data test failed - regimes recovered on {matches}/{days} days")
+            return False
+        
+        small = generate_market_data(tickers=CUSTOM_TICKERS, years=0.1, start='2024-01-01', seed=1)
+        trades = run_backtest(CUSTOM_TICKERS, '2024-01-01', '2024-02-15', data=to_frames(small))
+        if trades.empty:
+            print("❌ Synthetic data test failed - backtest produced no trades")
+            return False
+        print(f"✅ Synthetic data test passed - regimes recovered on {matches}/{days} days, "
+              f"{len(trades)} backtest trades")
+        return True
+    except Exception as e:
+        print(f"❌ Synthetic data test error: {e}")
+        return False
+
+def test_risk_engine():
+    """Test pre-trade resize/reject decisions, running aggregates and check latency"""
+    try:
+        import time
+        from risk_engine import RiskEngine
+        
+        risk = RiskEngine(25000, {'max_positions': 3, 'max_position_value': 5000,
+                                  'min_position_value': 500, 'risk_per_trade': 0.02})
+        big = risk.pre_trade('NVDA', {'entry': 100.0, 'exit': 104.0, 'stop_loss': 97.5, 'shares': 80, 'expected_profit': 320.0})
+        tiny = risk.pre_trade('SOXL', {'entry': 26.0, 'exit': 27.2, 'stop_loss': 25.35, 'shares': 16, 'expected_profit': 19.2})
+        risky = risk.pre_trade('TSLA', {'entry': 200.0, 'exit': 210.0, 'stop_loss': 150.0, 'shares': 20, 'expected_profit': 200.0})
+        if big['shares'] != 50 or tiny['shares'] != 0 or risky['shares'] != 10:
+            print(f"❌ Risk engine test failed - shares {big['shares']}, {tiny['shares']}, {risky['shares']}")
+            return False
+        if risk.gross_exposure != 7000 or risk.max_stop_loss != 625 or risk.buying_power != 18000:
+            print(f"❌ Risk engine test failed - aggregates {risk.report()}")
+            return False
+        risk.release('TSLA')
+        if risk.gross_exposure != 5000 or len(risk.positions) != 1:
+            print(f"❌ Risk engine test failed - release left {risk.report()}")
+            return False
+        
+        n = 20000
+        start = time.perf_counter()
+        for _ in range(n):
+            risk.check('AAPL', 190.0, 20, 185.0, 'Tech')
+        per_check_us = (time.perf_counter() - start) / n * 1e6
+        if per_check_us > 50:
+            print(f"❌ Risk engine test failed - {per_check_us:.1f}us per check")
+            return False
+        print(f"✅ Risk engine test passed - {per_check_us:.2f}us per pre-trade check")
+        return True
+    except Exception as e:
+        print(f"❌ Risk engine test error: {e}")
+        return False
+
+def test_symbol_index():
+    """Test symbol metadata loading, integer sector coding and grouping"""
+    try:
+        from symbol_index import load_symbol_index
+        from config import CUSTOM_TICKERS
+        
+        index = load_symbol_index()
+        if load_symbol_index() is not index:
+            print("❌ Symbol index test failed - index reloaded instead of cached")
+            return False
+        missing = [t for t in CUSTOM_TICKERS if t not in index]
+        if missing:
+            print(f"❌ Symbol index test failed - no metadata for {missing}")
+            return False
+        info = index.info('SOXS')
+        if info['sector'] != 'Tech' or not info['leveraged'] or not info['inverse']:
+            print(f"❌ Symbol index test failed - bad SOXS metadata {info}")
+            return False
+        groups = index.group_by_sector(CUSTOM_TICKERS + ['NOPE'])
+        counts = index.sector_counts(CUSTOM_TICKERS)
+        if groups['Unknown'] != ['NOPE'] or counts[index.sector_code_of('Tech')] != len(groups['Tech']):
+            print(f"❌ Symbol index test failed - grouping {groups}")
+            return False
+        
+        # Diversification grouped by the index's sector codes matches grouping the bars' labels
+        from strategy import select_tickers_adaptive
+        from symbol_index import index_from_market
+        from synthetic_data import generate_market_data, to_day_dicts
+        market = generate_market_data(n_tickers=300, years=0.2, seed=4)
+        prev = to_day_dicts(market, 40)
+        history = {t: market['close'][10:40, j].tolist() for j, t in enumerate(market['tickers'])}
+        by_label = select_tickers_adaptive(prev, historical_data=history)
+        by_code = select_tickers_adaptive(prev, historical_data=history, symbol_index=index_from_market(market))
+        if not by_code or by_code != by_label:
+            print(f"❌ Symbol index test failed - selection {by_code} != {by_label}")
+            return False
+        print(f"✅ Symbol index test passed - {len(index)} symbols in {len(groups) - 1} sectors")
+        return True
+    except Exception as e:
+        print(f"❌ Symbol index test error: {e}")
+        return False
+
+def test_result_cache():
+    """Test that cached backtests are reused and only changed days are recomputed"""
+    try:
+        import tempfile
+        from backtest import run_backtest
+        from result_cache import ResultCache
+        from synthetic_data import generate_market_data, to_frames
+        from config import CUSTOM_TICKERS
+        
+        market = generate_market_data(tickers=CUSTOM_TICKERS, years=0.5, start='2023-01-01', seed=9)
+        data = {t: df[:'2023-06-30'] for t, df in to_frames(market).items()}  # last row = last session run
+        args = (CUSTOM_TICKERS, '2023-01-01', '2023-06-30', 25000)
+        baseline = run_backtest(*args, data=data)
+        
+        with tempfile.TemporaryDirectory() as cache_dir:
+            run_backtest(*args, data=data, cache=ResultCache(cache_dir))
+            cache = ResultCache(cache_dir)
+            cached = run_backtest(*args, data=data, cache=cache)
+            if cache.misses != 0 or not cached.equals(baseline):
+                print(f"❌ Result cache test failed - rerun computed {cache.misses} days")
+                return False
+            
+            # Change the last 10 sessions of one ticker: only those days recompute
+            changed = {t: df.copy() for t, df in data.items()}
+            changed['NVDA'].iloc[-10:, 3] *= 1.02
+            cache = ResultCache(cache_dir)
+            partial = run_backtest(*args, data=changed, cache=cache)
+            if cache.misses != 10 or not partial.equals(run_backtest(*args, data=changed)):
+                print(f"❌ Result cache test failed - {cache.misses} days recomputed after a tail change")
+                return False
+        
+        # The run key covers the source of every module that shapes the cached trades
+        from unittest import mock
+        import result_cache
+        from backtest import run_settings
+        with mock.patch.object(result_cache, 'source_digest', side_effect=lambda *modules: modules) as digest:
+            run_settings(CUSTOM_TICKERS, 25000)
+        hashed = {m.__name__ for m in digest.call_args.args}
+        if not {'strategy', 'backtest', 'cost_model', 'trade_plan', 'live_config'} <= hashed:
+            print(f"❌ Result cache test failed - run key only hashes {sorted(hashed)}")
+            return False
+        print(f"✅ Result cache test passed - tail change reused {cache.hits} days, recomputed 10")
+        return True
+    except Exception as e:
+        print(f"❌ Result cache test error: {e}")
+        return False
+
+def test_backtest_append():
+    """Test that appending new days to a checkpointed backtest matches a full rerun"""
+    try:
+        import os
+        import tempfile
+        import pandas as pd
+        from backtest import run_backtest, append_backtest
+        from synthetic_data import generate_market_data, to_frames
+        from config import CUSTOM_TICKERS
+        
+        market = generate_market_data(tickers=CUSTOM_TICKERS, years=0.5, start='2023-01-01', seed=11)
+        data = to_frames(market)
+        full = run_backtest(CUSTOM_TICKERS, '2023-01-01', '2023-06-30', 25000, data=data)
+        
+        with tempfile.TemporaryDirectory() as tmp:
+            results = os.path.join(tmp, 'results.csv')
+            checkpoint = os.path.join(tmp, 'results.checkpoint.json')
+            head = {t: df[:'2023-04-28'] for t, df in data.items()}
+            run_backtest(CUSTOM_TICKERS, '2023-01-01', '2023-04-28', 25000, data=head,
+                         checkpoint_file=checkpoint).to_csv(results, index=False)
+            # Two nightly appends, each given only the new days
+            for start, end in (('2023-05-01', '2023-05-31'), ('2023-06-01', '2023-06-30')):
+                append_backtest(results, checkpoint, end, data={t: df[start:end] for t, df in data.items()})
+            full_file = os.path.join(tmp, 'full.csv')
+            full.to_csv(full_file, index=False)
+            if not pd.read_csv(results).equals(pd.read_csv(full_file)):
+                print("❌ Backtest append test failed - appended results differ from a full run")
+                return False
+        print(f"✅ Backtest append test passed - {len(full)} trades match a full run")
+        return True
+    except Exception as e:
+        print(f"❌ Backtest append test error: {e}")
+        return False
+
+def test_results_store():
+    """Test ingesting backtest results and querying them across runs"""
+    try:
+        import os
+        import tempfile
+        import pandas as pd
+        from results_store import ResultsStore
+        
+        trades = pd.DataFrame([
+            {'date': '2024-01-02', 'ticker': 'SOXL', 'exit_type': 'trailing_stop', 'market_regime': 'high_volatility', 'entry': 30.0, 'shares': 10, 'invested': 300.0, 'expected_profit': 40.0, 'confidence': 0.8},
+            {'date': '2024-01-02', 'ticker': 'TSLA', 'exit_type': 'stop_loss', 'market_regime': 'high_volatility', 'entry': 250.0, 'shares': 2, 'invested': 500.0, 'expected_profit': 0.0, 'confidence': 0.5},
+            {'date': '2024-01-03', 'ticker': 'SOXL', 'exit_type': 'trailing_stop', 'market_regime': 'high_volatility', 'entry': 31.0, 'shares': 10, 'invested': 310.0, 'expected_profit': 20.0, 'confidence': 0.6},
+        ])
+        with tempfile.TemporaryDirectory() as tmp:
+            csv_file = os.path.join(tmp, 'backtest_results_2024.csv')
+            trades.to_csv(csv_file, index=False)
+            with ResultsStore(os.path.join(tmp, 'results.db')) as store:
+                run = store.ensure_csv(csv_file)
+                store.ingest_trades('other', trades.iloc[:1])
+                store.ensure_csv(csv_file)  # unchanged file: no re-ingest, no duplicates
+                soxl = store.summary(ticker='SOXL', market_regime='high_volatility', exit_type='trailing_stop').iloc[0]
+                daily = store.daily_pnl(run)
+                if run != '2024' or soxl['trades'] != 3 or abs(soxl['avg_profit'] - 100 / 3) > 1e-9:
+                    print(f"❌ Results store test failed - cross-run summary {soxl.to_dict()}")
+                    return False
+                if daily.tolist() != [40.0, 20.0] or store.runs()['n_trades'].tolist() != [3, 1]:
+                    print("❌ Results store test failed - daily P&L or run table wrong")
+                    return False
+                store.ingest_trades('unscored', trades.drop(columns='confidence'))
+                counts = (store.count(run), store.count(run, ticker='SOXL'), store.count('unscored'),
+                          store.count('unscored', column='confidence'))
+                if counts != (3, 2, 3, 0):
+                    print(f"❌ Results store test failed - counts {counts}")
+                    return False
+        print("✅ Results store test passed")
+        return True
+    except Exception as e:
+        print(f"❌ Results store test error: {e}")
+        return False
+
+def test_streaming_backtest():
+    """Test that streaming trades to sinks matches the in-memory backtest"""
+    try:
+        import os
+        import tempfile
+        from backtest import run_backtest
+        from trade_plan import as_dict
+        from trade_sinks import ArraySink, CsvSink, SummarySink, TeeSink
+        from synthetic_data import generate_market_data, to_frames
+        from config import CUSTOM_TICKERS
+        
+        data = to_frames(generate_market_data(tickers=CUSTOM_TICKERS, years=0.3, start='2023-01-01', seed=5))
+        args = (CUSTOM_TICKERS, '2023-01-01', '2023-04-28', 25000)
+        df = run_backtest(*args, data=data)
+        
+        with tempfile.TemporaryDirectory() as tmp:
+            expected, streamed = os.path.join(tmp, 'expected.csv'), os.path.join(tmp, 'streamed.csv')
+            df.to_csv(expected, index=False)
+            rows, summary = run_backtest(*args, data=data, chunk_size=50,
+                                         sink=TeeSink(CsvSink(streamed), SummarySink()))
+            with open(expected) as a, open(streamed) as b:
+                same_file = a.read() == b.read()
+        if not same_file or rows != len(df) or summary['trades'] != len(df):
+            print("❌ Streaming backtest test failed - streamed output differs")
+            return False
+        if abs(summary['total_profit'] - df['expected_profit'].sum()) > 0.01:
+            print("❌ Streaming backtest test failed - summary profit differs")
+            return False
+        
+        # Sinks take legacy dicts as well as TradePlans
+        plans = []
+        class Collect:
+            def write(self, trades):
+                plans.extend(trades)
+            def close(self):
+                return plans
+        run_backtest(*args, data=data, sink=Collect())
+        dicts = [as_dict(p) for p in plans]
+        from_dicts, from_plans = SummarySink(), ArraySink()
+        from_dicts.write(dicts)
+        from_plans.write(plans)
+        array_from_dicts = ArraySink()
+        array_from_dicts.write(dicts)
+        if from_dicts.close() != summary or array_from_dicts.close().tobytes() != from_plans.close().tobytes():
+            print("❌ Streaming backtest test failed - dict trades summarized differently")
+            return False
+        print(f"✅ Streaming backtest test passed - {rows} trades streamed in chunks")
+        return True
+    except Exception as e:
+        print(f"❌ Streaming backtest test error: {e}")
+        return False
+
+def test_trade_plan():
+    """Test compact TradePlan records against the legacy dict plans"""
+    try:
+        from strategy import decide_entry_exit_adaptive, plan_entry_exit, analyze_technical_indicators
+        from trade_plan import TradePlan, Signal, plans_to_array, SIGNAL_NAMES
+        
+        prices = [100 - i * 0.8 for i in range(30)]  # falling trend: oversold signals
+        days = [
+            {'open': 100.0, 'high': 112.0, 'low': 99.0, 'close': 104.0},
+            {'open': 100.0, 'high': 101.0, 'low': 95.0, 'close': 96.0},
+            {'open': 100.0, 'high': 100.5, 'low': 99.8, 'close': 100.1},
+        ]
+        plans = []
+        for regime in ('normal', 'high_volatility', 'low_volatility'):
+            for day in days:
+                for history in (None, prices):
+                    plan = plan_entry_exit(day, 25000, 5, regime, history)
+                    legacy = decide_entry_exit_adaptive(day, 25000, 5, regime, history)
+                    if plan.to_dict() != legacy or TradePlan.from_dict(legacy).to_dict() != legacy:
+                        print(f"❌ Trade plan test failed - {regime} plan differs from the dict version")
+                        return False
+                    plans.append(plan)
+        
+        technical = analyze_technical_indicators(days[1], prices)
+        if SIGNAL_NAMES[Signal.OVERSOLD_BUY] != 'oversold_buy' or technical['rsi_signal'] != 'oversold_buy':
+            print(f"❌ Trade plan test failed - unexpected signals {technical}")
+            return False
+        
+        array = plans_to_array(plans)
+        if len(array) != len(plans) or abs(array['expected_profit'].sum() - sum(p.expected_profit or 0 for p in plans)) > 1e-6:
+            print("❌ Trade plan test failed - structured array does not match the plans")
+            return False
+        print(f"✅ Trade plan test passed - {len(plans)} plans match their dict form")
+        return True
+    except Exception as e:
+        print(f"❌ Trade plan test error: {e}")
+        return False
+
+def test_trading_calendar():
+    """Test NYSE sessions and that the backtest trades the session after a holiday"""
+    try:
+        from datetime import date
+        import trading_calendar as tc
+        from backtest import run_backtest
+        from synthetic_data import generate_market_data, to_frames
+        from config import CUSTOM_TICKERS
+        
+        counts = {year: len(tc.sessions(f'{year}-01-01', f'{year}-12-31')) for year in (2012, 2018, 2022, 2024, 2025)}
+        if counts != {2012: 250, 2018: 251, 2022: 251, 2024: 252, 2025: 250}:
+            print(f"❌ Trading calendar test failed - session counts {counts}")
+            return False
+        if tc.is_session('2024-03-29') or tc.previous_session('2024-07-05') != date(2024, 7, 3) \
+                or tc.session_hours('2024-11-29') != (tc.MARKET_OPEN, tc.EARLY_CLOSE):
+            print("❌ Trading calendar test failed - Good Friday / July 4th / early close")
+            return False
+        
+        data = to_frames(generate_market_data(tickers=CUSTOM_TICKERS, years=0.25, start='2024-01-02', seed=2))
+        df = run_backtest(CUSTOM_TICKERS, '2024-01-02', '2024-03-29', 25000, data=data)
+        # Jan 16 follows MLK Day and Feb 20 follows Presidents' Day
+        if not {'2024-01-16', '2024-02-20'} <= set(df['date']):
+            print("❌ Trading calendar test failed - no trades on the session after a holiday")
+            return False
+        print(f"✅ Trading calendar test passed - {sum(counts.values())} sessions checked")
+        return True
+    except Exception as e:
+        print(f"❌ Trading calendar test error: {e}")
+        return False
+
+def test_multi_backtest():
+    """Test that variants evaluated in one pass match separate runs"""
+    try:
+        from backtest import run_backtest
+        from multi_backtest import Variant, run_variants
+        from synthetic_data import generate_market_data, to_frames
+        from config import CUSTOM_TICKERS
+        
+        data = to_frames(generate_market_data(tickers=CUSTOM_TICKERS, years=0.25, start='2023-01-03', seed=8))
+        args = (CUSTOM_TICKERS, '2023-01-03', '2023-03-31', 25000)
+        variants = [Variant('adaptive'), Variant('legacy_normal', regime='normal'),
+                    Variant('no_technical', technical='none'), Variant('select_custom', selection='select_custom')]
+        together = run_variants(variants, *args, data=data)
+        
+        if not together['adaptive'].equals(run_backtest(*args, data=data)):
+            print("❌ Multi backtest test failed - 'adaptive' variant differs from run_backtest")
+            return False
+        for variant in variants[1:]:
+            alone = run_variants([variant], *args, data=data)[variant.name]
+            if not together[variant.name].equals(alone):
+                print(f"❌ Multi backtest test failed - '{variant.name}' differs when run alone")
+                return False
+        if set(together['legacy_normal']['market_regime'].dropna()) != {'normal'}:
+            print("❌ Multi backtest test failed - legacy variant did not force the normal regime")
+            return False
+        print(f"✅ Multi backtest test passed - {len(variants)} variants in one pass")
+        return True
+    except Exception as e:
+        print(f"❌ Multi backtest test error: {e}")
+        return False
+
+def test_cost_model():
+    """Test transaction costs against hand-computed values and a frictionless run"""
+    try:
+        from backtest import run_backtest
+        from cost_model import CostModel, DEFAULT_COST_MODEL
+        from trade_sinks import SummarySink
+        from synthetic_data import generate_market_data, to_frames
+        from config import CUSTOM_TICKERS
+        
+        model = CostModel(commission_per_trade=1.0, min_commission=1.5, spread_fraction=0.01,
+                          impact_coefficient=0.1, stop_slippage_fraction=0.05, sec_fee_rate=0.0000278,
+                          taf_per_share=0.000166, taf_max=8.30)
+        # 100 shares of 1M volume over a $2 range: spread 0.02, impact 2*0.1*2*0.01 = 0.004 per share,
+        # commissions 2 * 1.5, SEC 0.0000278 * 100 * 101, TAF 0.0166
+        costs = model.costs([101.0, 101.0], [100, 100], [102.0, 102.0], [100.0, 100.0], [1e6, 1e6], [0, 1])
+        if costs.tolist() != [5.70, 15.70]:
+            print(f"❌ Cost model test failed - costs {costs.tolist()}")
+            return False
+        
+        data = to_frames(generate_market_data(tickers=CUSTOM_TICKERS, years=0.25, start='2023-01-03', seed=4))
+        args = (CUSTOM_TICKERS, '2023-01-03', '2023-03-31', 25000)
+        frictionless = run_backtest(*args, data=data, cost_model=None)
+        zero = run_backtest(*args, data=data, cost_model=CostModel())
+        if not zero.drop(columns=['costs', 'net_profit']).equals(frictionless) or zero['costs'].sum() != 0:
+            print("❌ Cost model test failed - a zero-cost model changed the run")
+            return False
+        
+        costed = run_backtest(*args, data=data)
+        summary = run_backtest(*args, data=data, sink=SummarySink(), cost_model=DEFAULT_COST_MODEL)
+        traded = costed[costed['shares'] > 0]
+        if not (traded['costs'] > 0).all() or \
+                not ((traded['expected_profit'] - traded['costs']).round(2) == traded['net_profit']).all():
+            print("❌ Cost model test failed - traded rows are not costed")
+            return False
+        if abs(summary['net_profit'] - costed['net_profit'].sum()) > 0.01 or \
+                summary['net_profit'] >= frictionless['expected_profit'].sum():
+            print("❌ Cost model test failed - net profit does not reflect costs")
+            return False
+        print(f"✅ Cost model test passed - ${summary['total_costs']:.2f} costs over {len(traded)} trades")
+        return True
+    except Exception as e:
+        print(f"❌ Cost model test error: {e}")
+        return False
+
+def test_quote_stream():
+    """Test streaming quotes from the local replay feed, including reconnect and resubscribe"""
+    try:
+        import threading
+        import time
+        from quote_stream import QuoteReplayServer, QuoteStream, random_tape
+        from mock_broker import make_universe
+        from fidelity_api import FidelityAPI
+        
+        symbols = make_universe(60)
+        tape = random_tape(symbols, 100, seed=2)
+        with QuoteReplayServer(tape, interval=0.002, token='stream-token') as server:
+            api = FidelityAPI(stream_url=server.url)
+            api.access_token = 'stream-token'
+            stream = api.stream_quotes(symbols[:20])
+            try:
+                if not stream.wait_ready(timeout=5):
+                    print("❌ Quote stream test failed - subscribed symbols never quoted")
+                    return False
+                quote = stream.quote('AAPL')
+                if (quote['bid'], quote['ask'], quote['last'], quote['volume']) not in \
+                        {tuple(row[1:]) for tick in tape for row in tick if row[0] == 'AAPL'}:
+                    print(f"❌ Quote stream test failed - quote not from the tape: {quote}")
+                    return False
+                if stream.quote(symbols[40]) is not None:
+                    print("❌ Quote stream test failed - got quotes for an unsubscribed symbol")
+                    return False
+                
+                # Drop the connection: the client reconnects and resubscribes everything
+                stream.subscribe(symbols[40:45])
+                server.drop_clients()
+                seen = stream.book.updates.copy()
+                deadline = time.monotonic() + 5
+                while stream.reconnects == 0 or not (stream.book.updates[:25] > seen[:25]).all():
+                    if time.monotonic() > deadline:
+                        print("❌ Quote stream test failed - no quotes after a reconnect")
+                        return False
+                    time.sleep(0.01)
+            finally:
+                stream.stop()
+        
+        # A callback that raises skips that batch only; an idle feed is kept alive by pings
+        failures = []
+        def flaky(rows):
+            if not failures:
+                failures.append(rows)
+                raise RuntimeError("downstream hiccup")
+        with QuoteReplayServer(tape[:1], interval=0.5) as server:
+            with QuoteStream(server.url, symbols[:5], on_quotes=flaky, ping_interval=0.05, read_timeout=0.3) as idle:
+                deadline = time.monotonic() + 5
+                while idle.messages < 3 and time.monotonic() < deadline:
+                    time.sleep(0.01)
+                if idle.errors != 1 or idle.messages < 3 or idle.reconnects:
+                    print(f"❌ Quote stream test failed - {idle.errors} errors, {idle.messages} batches, "
+                          f"{idle.reconnects} reconnects on an idle feed")
+                    return False
+        
+        # A half-open connection (handshake, then silence) is detected by the read timeout
+        import socketserver
+        from quote_stream import _accept_key
+        class Silent(socketserver.StreamRequestHandler):
+            def handle(self):
+                lines = [self.rfile.readline()]
+                while lines[-1] not in (b'\r\n', b''):
+                    lines.append(self.rfile.readline())
+                key = next(l.split(b':', 1)[1].strip().decode() for l in lines if l.lower().startswith(b'sec-websocket-key'))
+                self.wfile.write(f"HTTP/1.1 101 Switching Protocols\r\nSec-WebSocket-Accept: {_accept_key(key)}\r\n\r\n".encode())
+                time.sleep(1)
+        silent = socketserver.ThreadingTCPServer(('127.0.0.1', 0), Silent)
+        silent.daemon_threads = True
+        threading.Thread(target=silent.serve_forever, daemon=True).start()
+        try:
+            with QuoteStream(f"ws://127.0.0.1:{silent.server_address[1]}/", ['AAPL'], ping_interval=0.05,
+                             read_timeout=0.2, reconnect_delay=0.01) as dead:
+                deadline = time.monotonic() + 5
+                while dead.reconnects == 0 and time.monotonic() < deadline:
+                    time.sleep(0.01)
+                if dead.reconnects == 0:
+                    print("❌ Quote stream test failed - half-open connection never detected")
+                    return False
+        finally:
+            silent.shutdown()
+            silent.server_close()
+
+        # Failed handshakes close their socket (the exceptions are kept, as last_error keeps one)
+        class Hangup(socketserver.StreamRequestHandler):
+            def handle(self):
+                self.rfile.readline()
+        hangup = socketserver.ThreadingTCPServer(('127.0.0.1', 0), Hangup)
+        hangup.daemon_threads = True
+        threading.Thread(target=hangup.serve_forever, daemon=True).start()
+        try:
+            client = QuoteStream(f"ws://127.0.0.1:{hangup.server_address[1]}/", ['AAPL'])
+            fds = len(os.listdir('/proc/self/fd')) if os.path.isdir('/proc/self/fd') else None
+            failures = []
+            for _ in range(20):
+                try:
+                    client._connect()
+                except ConnectionError as e:
+                    failures.append(e)
+            leaked = len(os.listdir('/proc/self/fd')) - fds if fds is not None else 0
+        finally:
+            hangup.shutdown()
+            hangup.server_close()
+        if len(failures) != 20 or leaked > 2:
+            print(f"❌ Quote stream test failed - {leaked} descriptors leaked by {len(failures)} failed handshakes")
+            return False
+        print(f"✅ Quote stream test passed - {stream.messages} pushed batches, {stream.reconnects} reconnect(s), "
+              f"half-open connection dropped after {dead.read_timeout}s")
+        return True
+    except Exception as e:
+        print(f"❌ Quote stream test error: {e}")
+        return False
+
+def test_quote_cache():
+    """Test the FidelityAPI quote cache: TTL hits, coalesced concurrent requests and metrics"""
+    try:
+        import threading
+        from mock_broker import MockBrokerServer
+        
+        with MockBrokerServer(n_symbols=50, seed=3, latency_ms=20) as server:
+            api = server.api()
+            api.quotes.ttl = 60
+            exchange = server.exchange
+            before = exchange.requests
+            
+            # 16 components asking for the same quote at once share one HTTP call
+            results = []
+            threads = [threading.Thread(target=lambda: results.append(api.get_market_data('AAPL')))
+                       for _ in range(16)]
+            for t in threads:
+                t.start()
+            for t in threads:
+                t.join()
+            if exchange.requests - before != 1 or len(results) != 16 or any(r is not results[0] for r in results):
+                print(f"❌ Quote cache test failed - {exchange.requests - before} requests for 16 callers")
+                return False
+            
+            # Within the TTL: served from memory; max_age=0 forces a fresh quote
+            api.get_market_data('AAPL')
+            if exchange.requests - before != 1 or api.get_market_data('AAPL', max_age=0) is None \
+                    or exchange.requests - before != 2:
+                print("❌ Quote cache test failed - TTL not honoured")
+                return False
+            # Failures are not cached
+            if api.get_market_data('NOPE') is not None or api.get_market_data('NOPE') is not None \
+                    or exchange.requests - before != 4:
+                print("❌ Quote cache test failed - failed quote was cached")
+                return False
+            stats = api.quotes.stats()
+        if (stats['hits'] + stats['coalesced'], stats['misses'], stats['errors']) != (16, 4, 2) or \
+                stats['avg_fetch_ms'] < 20:
+            print(f"❌ Quote cache test failed - stats {stats}")
+            return False
+        print(f"✅ Quote cache test passed - 20 quote requests, 4 HTTP calls, "
+              f"{stats['avg_wait_ms']:.1f}ms avg coalesced wait")
+        return True
+    except Exception as e:
+        print(f"❌ Quote cache test error: {e}")
+        return False
+
+def test_token_manager():
+    """Test persisted OAuth tokens, proactive refresh and the transparent 401 retry"""
+    try:
+        import os
+        import stat
+        import tempfile
+        import threading
+        import time
+        from mock_broker import MockBrokerServer
+        from fidelity_api import FidelityAPI
+        
+        with tempfile.TemporaryDirectory() as tmp, MockBrokerServer(n_symbols=10, token_ttl=1.0) as server:
+            path = os.path.join(tmp, 'tokens', 'fidelity_token.json')
+            api = server.api(token_file=path)
+            if stat.S_IMODE(os.stat(path).st_mode) != 0o600:
+                print("❌ Token manager test failed - token file is readable by others")
+                return False
+            
+            # Refreshed in the background before the 1s token expires
+            first = api.access_token
+            deadline = time.monotonic() + 2
+            while api.access_token == first and time.monotonic() < deadline:
+                time.sleep(0.01)
+            if api.access_token == first or api.get_account_info() is None:
+                print("❌ Token manager test failed - token was not refreshed ahead of expiry")
+                return False
+            api.tokens.stop()
+            server.exchange.token_ttl = 60  # long-lived from here on, so only the 401s below cause refreshes
+            api.tokens.refresh()
+            
+            # A restart picks up the saved tokens without touching the token endpoint
+            requests_before = server.exchange.requests
+            restarted = FidelityAPI(base_url=server.base_url, oauth_url=server.url, token_file=path)
+            if not restarted.restore_session('mock-client', 'mock-secret') or \
+                    server.exchange.requests != requests_before:
+                print("❌ Token manager test failed - restart needed an auth round trip")
+                return False
+            restarted.tokens.stop()
+            
+            # Server-side revocation: 8 concurrent 401s share one refresh and all succeed
+            server.exchange.tokens.clear()
+            refreshes = restarted.tokens.refreshes
+            results = []
+            threads = [threading.Thread(target=lambda: results.append(restarted.get_account_info())) for _ in range(8)]
+            for t in threads:
+                t.start()
+            for t in threads:
+                t.join()
+            if not all(results) or len(results) != 8 or restarted.tokens.refreshes != refreshes + 1:
+                print(f"❌ Token manager test failed - {restarted.tokens.refreshes - refreshes} refreshes after 401s")
+                return False
+            restarted.tokens.stop()
+            
+            # A revoked refresh token: restore_session asks for a new code, nothing keeps retrying
+            server.exchange.refresh_tokens.clear()
+            restarted.tokens.expires_at = time.time() - 1
+            restarted.tokens.save()
+            token_posts = []
+            stale = FidelityAPI(base_url=server.base_url, oauth_url=server.url, token_file=path)
+            post = stale.tokens.post
+            stale.tokens.post = lambda url, data: token_posts.append(data) or post(url, data)
+            stale.tokens.retry_delay = 0.01
+            if stale.restore_session('mock-client', 'mock-secret') or not stale.tokens.revoked:
+                print("❌ Token manager test failed - stale session reported as restored")
+                return False
+            stale.tokens.start()
+            time.sleep(0.1)
+            stale.tokens.stop()
+            if len(token_posts) != 1 or 'invalid_grant' not in stale.tokens.last_error:
+                print(f"❌ Token manager test failed - {len(token_posts)} refresh attempts with a revoked token")
+                return False
+        print("✅ Token manager test passed - tokens persisted 0600, refreshed ahead of expiry and after a 401, "
+              "revoked refresh token dropped")
+        return True
+    except Exception as e:
+        print(f"❌ Token manager test error: {e}")
+        return False
+
+def test_rate_limiter():
+    """Test priority lanes: critical order traffic keeps its latency while polling is throttled"""
+    try:
+        import threading
+        import time
+        from mock_broker import MockBrokerServer
+        from rate_limiter import CRITICAL, QUOTES, PriorityRateLimiter
+        
+        # After a 429 polling lanes pause for Retry-After; the critical lane only waits for a token
+        limiter = PriorityRateLimiter(rate=100, burst=5, reserve=1)
+        limiter.throttled(0.2)
+        critical_wait, quote_wait = limiter.acquire(CRITICAL), limiter.acquire(QUOTES)
+        if critical_wait > 0.05 or quote_wait < 0.19:
+            print(f"❌ Rate limiter test failed - waits after a 429: {critical_wait:.3f}s / {quote_wait:.3f}s")
+            return False
+        
+        # Broker allows 50 req/s; 4 threads poll quotes flat out while stops are placed and cancelled
+        with MockBrokerServer(n_symbols=20, seed=1, rate_limit=50) as server:
+            api = server.api(quote_ttl=0, rate_limit={'rate': 45, 'burst': 10, 'reserve': 3})
+            symbols = server.exchange.symbols
+            done = threading.Event()
+            
+            def poll(k):
+                while not done.is_set():
+                    api.get_market_data(symbols[k])
+            pollers = [threading.Thread(target=poll, args=(k,)) for k in range(4)]
+            for t in pollers:
+                t.start()
+            time.sleep(0.2)
+            failures = 0
+            for symbol in symbols[:10]:
+                order = api.place_order(symbol, 1, 'sell', 'stop', stop_price=1.0)
+                failures += order is None or api.cancel_order(order['orderId']) is None
+                time.sleep(0.02)
+            done.set()
+            for t in pollers:
+                t.join()
+            stats = api.limiter.stats()
+            throttled = server.exchange.throttled
+        critical, quotes = stats['critical'], stats['quotes']
+        if failures or throttled or critical['requests'] != 20 or critical['avg_wait_ms'] >= quotes['avg_wait_ms']:
+            print(f"❌ Rate limiter test failed - {failures} failed orders, {throttled} 429s, "
+                  f"waits {critical['avg_wait_ms']:.1f}ms vs {quotes['avg_wait_ms']:.1f}ms")
+            return False
+        if sum(critical['wait_histogram'].values()) != critical['requests'] or quotes['max_queued'] < 2:
+            print(f"❌ Rate limiter test failed - bad stats {stats}")
+            return False
+        print(f"✅ Rate limiter test passed - critical wait {critical['avg_wait_ms']:.1f}ms, "
+              f"quotes wait {quotes['avg_wait_ms']:.1f}ms, no 429s")
+        return True
+    except Exception as e:
+        print(f"❌ Rate limiter test error: {e}")
+        return False
+
+def test_session_pipeline():
+    """Test the session pipeline: stages on schedule, entries at the open, flat before an early close"""
+    try:
+        import time
+        from datetime import datetime, timedelta
+        from zoneinfo import ZoneInfo
+        from config import CUSTOM_TICKERS
+        from mock_broker import MockBrokerServer
+        from scheduler import SessionPipeline, stage_times
+        from synthetic_data import generate_market_data, to_frames
+        
+        if stage_times('2024-11-28') is not None:
+            print("❌ Session pipeline test failed - Thanksgiving has a schedule")
+            return False
+        
+        # Day after Thanksgiving closes at 13:00, so the flatten stage moves to 12:50
+        day = '2024-11-29'
+        data = to_frames(generate_market_data(tickers=CUSTOM_TICKERS, years=1, start='2024-06-03', seed=7))
+        now = [datetime(2024, 11, 29, 8, 0, tzinfo=ZoneInfo('America/New_York'))]
+        
+        def sleep(seconds):
+            now[0] += timedelta(seconds=seconds)
+        
+        with MockBrokerServer(symbols=CUSTOM_TICKERS, seed=3) as server:
+            api = server.api()
+            pipeline = SessionPipeline(api, day, data=data, clock=lambda: now[0], sleep=sleep)
+            report = pipeline.run()
+            positions = server.exchange.account()['positions']
+            working = len(server.exchange.working)
+        
+        started = {stage: at.strftime('%H:%M') for stage, at in pipeline.started.items()}
+        if started != {'warm': '08:45', 'prepare': '09:15', 'open': '09:30', 'flatten': '12:50'}:
+            print(f"❌ Session pipeline test failed - stages ran at {started}")
+            return False
+        if not report['candidates'] or not report['entries'] or report['time_to_first_order_ms'] is None:
+            print(f"❌ Session pipeline test failed - nothing traded: {report}")
+            return False
+        if positions or working or report['flattened'] != report['entries']:
+            print(f"❌ Session pipeline test failed - not flat: {positions}, {working} working orders, {report}")
+            return False
+        
+        # Trailing stops follow a rally; a stop that fills while flatten cancels it is not sold again
+        with MockBrokerServer(symbols=CUSTOM_TICKERS, seed=3) as server:
+            api = server.api()
+            managed = SessionPipeline(api, day, data=data, clock=lambda: now[0], sleep=sleep)
+            managed.warm()
+            managed.prepare()
+            managed.open()
+            managed.orders.await_entries(timeout=5, interval=0.05)
+            stop = next(o for o in managed.orders.open_orders() if o.tag == 'stop')
+            first_stop = stop.stop_price
+            template = next(t for t in managed.templates if t.symbol == stop.symbol)
+            exchange = server.exchange
+            with exchange._lock:
+                exchange.last[exchange.index[stop.symbol]] *= max(template.trailing_trigger, 1) * 1.1
+            moved = managed.trail_stops()
+            trailed = managed.orders.working_stop(stop.symbol)
+
+            cancel_order = api.cancel_order
+            # ... and another stop the broker refuses to cancel stays held, and in the risk engine
+            stuck = next(o for o in managed.orders.open_orders() if o.tag == 'stop' and o.symbol != stop.symbol)
+
+            def cancel_after_fill(order_id):
+                if order_id == stuck.broker_id:
+                    return None
+                with exchange._lock:
+                    order = exchange.working.get(order_id)
+                    if order is not None and order['type'] == 'stop' and order['symbol'] == stop.symbol:
+                        exchange._fill(order, float(exchange.last[exchange.index[stop.symbol]]))
+                return cancel_order(order_id)
+
+            api.cancel_order = cancel_after_fill
+            managed.flatten()
+            time.sleep(0.2)
+            short = [p for p in exchange.account()['positions'] if p['quantity'] < 0]
+        if not moved or trailed is None or trailed.stop_price <= first_stop:
+            print(f"❌ Session pipeline test failed - stop not trailed: {stop} -> {moved}")
+            return False
+        if short or any(o.symbol == stop.symbol for o in managed.flattened):
+            print(f"❌ Session pipeline test failed - sold a filled stop again: {short}")
+            return False
+        if stuck.symbol not in managed.risk.positions or stop.symbol in managed.risk.positions:
+            print(f"❌ Session pipeline test failed - risk positions after flatten {sorted(managed.risk.positions)}")
+            return False
+
+        # Started after the flatten time: prepared, but no entries
+        now[0] = datetime(2024, 11, 29, 12, 55, tzinfo=ZoneInfo('America/New_York'))
+        with MockBrokerServer(symbols=CUSTOM_TICKERS, seed=3) as server:
+            late = SessionPipeline(server.api(), day, data=data, clock=lambda: now[0], sleep=sleep).run()
+        if late['skipped'] != ['open'] or late['submitted'] or not late['candidates']:
+            print(f"❌ Session pipeline test failed - late start: {late}")
+            return False
+        print(f"✅ Session pipeline test passed - {report['entries']} entries, "
+              f"first order {report['time_to_first_order_ms']:.1f}ms after the open, "
+              f"open stage {report['stage_ms']['open']:.1f}ms (prepare {report['stage_ms']['prepare']:.1f}ms)")
+        return True
+    except Exception as e:
+        print(f"❌ Session pipeline test error: {e}")
+        return False
+
+def test_warm_state():
+    """Test warm-state snapshots: round trip, corruption check, restart mid-session without refetching"""
+    try:
+        import os
+        import tempfile
+        from datetime import datetime, timedelta
+        from zoneinfo import ZoneInfo
+        import numpy as np
+        from config import CUSTOM_TICKERS
+        from mock_broker import MockBrokerServer
+        from scheduler import SessionPipeline
+        from synthetic_data import generate_market_data, to_frames
+        from warm_state import load_snapshot, save_snapshot
+        
+        tmpdir = tempfile.mkdtemp()
+        path = os.path.join(tmpdir, 'state.snapshot')
+        closes = np.arange(12.0).reshape(3, 4)
+        save_snapshot(path, {'day': '2024-11-29'}, {'closes': closes, 'flags': np.array([1, 0, 1], dtype=np.int8)})
+        meta, arrays = load_snapshot(path)
+        if meta != {'day': '2024-11-29'} or not np.array_equal(arrays['closes'], closes) or arrays['flags'].tolist() != [1, 0, 1]:
+            print(f"❌ Warm state test failed - round trip gave {meta}, {arrays}")
+            return False
+        with open(path, 'r+b') as f:
+            f.seek(-3, os.SEEK_END)
+            f.write(b'\xff')
+        if load_snapshot(path) is not None:
+            print("❌ Warm state test failed - corrupt snapshot loaded")
+            return False
+        
+        class Crash(Exception):
+            pass
+        
+        day = '2024-11-29'
+        data = to_frames(generate_market_data(tickers=CUSTOM_TICKERS, years=1, start='2024-06-03', seed=7))
+        zone = ZoneInfo('America/New_York')
+        now = [datetime(2024, 11, 29, 8, 0, tzinfo=zone)]
+        
+        def crash_at_ten(seconds):
+            now[0] += timedelta(seconds=seconds)
+            if now[0].hour >= 10:
+                raise Crash()
+        
+        def sleep(seconds):
+            now[0] += timedelta(seconds=seconds)
+        
+        snapshot = os.path.join(tmpdir, 'session.snapshot')
+        with MockBrokerServer(symbols=CUSTOM_TICKERS, seed=3) as server:
+            first = SessionPipeline(server.api(), day, data=data, clock=lambda: now[0], sleep=crash_at_ten,
+                                    snapshot_path=snapshot)
+            try:
+                first.run()
+            except Crash:
+                pass
+            entries = sum(o.tag == 'entry' for o in first.submitted)
+            # While the bot is down one protective stop is cancelled at the broker
+            stop = next(o for o in first.orders.open_orders() if o.tag == 'stop')
+            server.exchange.cancel_order(stop.broker_id)
+            first.orders.close()
+            
+            # data={}: any refetch or recomputation of the morning stages would leave no candidates
+            second = SessionPipeline(server.api(), day, data={}, clock=lambda: now[0], sleep=sleep,
+                                     snapshot_path=snapshot)
+            report = second.run()
+            positions = server.exchange.account()['positions']
+        
+        if not second.restored or report['candidates'] != [t.symbol for t in first.templates] or not entries:
+            print(f"❌ Warm state test failed - not restored: {report}")
+            return False
+        if second.orders.get(stop.client_id).state != 'cancelled' or set(report['stage_ms']) != {'flatten'}:
+            print(f"❌ Warm state test failed - delta not reconciled: {second.orders.get(stop.client_id)}, {report}")
+            return False
+        if positions or report['flattened'] != entries or report['restore_ms'] > 50:
+            print(f"❌ Warm state test failed - after restart: {positions}, {report}")
+            return False
+        print(f"✅ Warm state test passed - restored {entries} positions, their stops and "
+              f"{len(second.history)} histories in {report['restore_ms']:.2f}ms, flat at the close")
+        return True
+    except Exception as e:
+        print(f"❌ Warm state test error: {e}")
+        return False
+
+def test_shared_market():
+    """Test the shared-memory snapshot: no torn reads across processes, ranking and quotes feed the pipeline"""
+    try:
+        import multiprocessing
+        from config import CUSTOM_TICKERS
+        from mock_broker import MockBrokerServer
+        from scheduler import SessionPipeline
+        from shared_market import SharedMarket, run_screener
+        from synthetic_data import generate_market_data, to_frames
+        
+        symbols = [f"SYM{i:05d}" for i in range(2000)]
+        with SharedMarket.create(symbols) as market:
+            def feed(name, updates):
+                writer = SharedMarket.attach(name)
+                for k in range(1, updates + 1):
+                    writer.publish_quotes([[s, k, k, k, k, k] for s in symbols])
+                writer.close()
+            
+            writer = multiprocessing.Process(target=feed, args=(market.name, 300))
+            writer.start()
+            torn = reads = 0
+            while writer.is_alive() or reads == 0:
+                # bid/ask/last/volume/time of every symbol come from one update
+                lo, hi = market.read_market(lambda v: (v[:, 4:].min(), v[:, 4:].max()))
+                torn += lo == lo and lo != hi
+                reads += 1
+            writer.join()
+            final = market.quote('SYM01999')
+            if torn or final['last'] != 300 or final['open'] != 1 or final['high'] != 300:
+                print(f"❌ Shared market test failed - {torn} torn reads of {reads}, final {final}")
+                return False
+            
+            # Screener process ranks the live bars
+            stop = multiprocessing.Event()
+            screener = multiprocessing.Process(target=run_screener, args=(market.name, stop, 0.01))
+            screener.start()
+            while market.ranking_seq == 0 and screener.is_alive():
+                pass
+            stop.set()
+            screener.join()
+            if not market.candidates():
+                print("❌ Shared market test failed - screener published no ranking")
+                return False
+
+            # Scores stay with their symbols when unknown ones are dropped
+            market.publish_ranking(['SYM00002', 'UNKNOWN', 'SYM00001'], [0.9, 0.8, 0.7])
+            ranking = market.read_ranking(lambda indices, scores: list(zip(indices.tolist(), scores.tolist())))
+            if ranking != [(2, 0.9), (1, 0.7)]:
+                print(f"❌ Shared market test failed - ranking {ranking}")
+                return False
+
+            # A separate process that attaches and exits leaves the block alone
+            attached = subprocess.run([sys.executable, '-c', "import sys; from shared_market import SharedMarket; "
+                                       "SharedMarket.attach(sys.argv[1]).close()", market.name],
+                                      capture_output=True, text=True, timeout=60)
+            try:
+                SharedMarket.attach(market.name).close()
+            except FileNotFoundError:
+                print("❌ Shared market test failed - block unlinked by a process that attached")
+                return False
+            if attached.returncode or 'leaked' in attached.stderr:
+                print(f"❌ Shared market test failed - attaching process: {attached.stderr}")
+                return False
+
+        # Executor side: the pipeline takes ranking and opening prices from shared memory
+        data = to_frames(generate_market_data(tickers=CUSTOM_TICKERS, years=1, start='2024-06-03', seed=7))
+        with SharedMarket.create(CUSTOM_TICKERS) as market, MockBrokerServer(symbols=CUSTOM_TICKERS, seed=3) as server:
+            market.publish_ranking(['NVDA', 'AAPL', 'UNKNOWN', 'MSFT'])
+            market.publish_quotes([[s, 99.9, 100.0, 100.0, 1e6, 0.0] for s in CUSTOM_TICKERS])
+            api = server.api()
+            pipeline = SessionPipeline(api, '2024-11-29', data=data, shared=market)
+            pipeline.warm()
+            pipeline.prepare()
+            pipeline.open()
+            entries = [o for o in pipeline.submitted if o.tag == 'entry']
+            http_quotes = api.quotes.stats()['requests']
+            pipeline.orders.close()
+        if [t.symbol for t in pipeline.templates] != ['NVDA', 'AAPL', 'MSFT'] or http_quotes or not entries:
+            print(f"❌ Shared market test failed - pipeline used {pipeline.templates}, {http_quotes} HTTP quotes")
+            return False
+        print(f"✅ Shared market test passed - {reads} reads across 300 updates of 2000 symbols, none torn; "
+              f"pipeline opened {len(entries)} positions from shared quotes")
+        return True
+    except Exception as e:
+        print(f"❌ Shared market test error: {e}")
+        return False
+
+def test_live_config():
+    """Test validated hot-reloadable config: errors reported, swaps only between cycles, strategy follows"""
+    import live_config
+    try:
+        import json
+        import os
+        import tempfile
+        import time
+        from config import CUSTOM_TICKERS, POSITION_SIZING
+        from live_config import ConfigError, ConfigManager, current, validate
+        from risk_engine import RiskEngine
+        from strategy import calculate_position_size, select_custom_tickers
+        
+        if list(current().tickers) != CUSTOM_TICKERS or current().position_sizing != POSITION_SIZING:
+            print("❌ Live config test failed - defaults differ from config.py")
+            return False
+        try:
+            validate({'POSITION_SIZING': {'method': 'kelly', 'max_positions': 0, 'max_posittions': 3},
+                      'CUSTOM_TICKERS': ['AAPL', 'aapl', 'AAPL'], 'EXTRA': 1})
+            print("❌ Live config test failed - invalid config accepted")
+            return False
+        except ConfigError as e:
+            if len(e.problems) < 5:
+                print(f"❌ Live config test failed - problems not all reported: {e.problems}")
+                return False
+        
+        path = os.path.join(tempfile.mkdtemp(), 'tradebot.json')
+        def write(raw):
+            with open(path, 'w') as f:
+                json.dump(raw, f)
+        write({'CUSTOM_TICKERS': ['AAPL', 'MSFT', 'NVDA'],
+               'POSITION_SIZING': {'method': 'custom', 'max_positions': 2},
+               'CUSTOM_POSITION_SIZES': {'AAPL': 1000, 'NVDA': 3000}})
+        manager = ConfigManager(path, interval=0.01).start()
+        try:
+            cfg = current()
+            if (select_custom_tickers() != ['AAPL', 'MSFT'] or calculate_position_size('NVDA', 100, 25000)[0] != 30
+                    or RiskEngine(25000).max_positions != 2 or cfg.size_array[cfg.ticker_index['NVDA']] != 3000):
+                print(f"❌ Live config test failed - file not applied: {cfg}")
+                return False
+            
+            # A change is staged by the watcher but only becomes current on swap()
+            time.sleep(0.02)
+            write({'CUSTOM_TICKERS': ['SPY', 'QQQ'], 'POSITION_SIZING': {'method': 'equal'}})
+            deadline = time.time() + 5
+            while manager.pending is None and time.time() < deadline:
+                time.sleep(0.005)
+            staged = current()
+            started = time.perf_counter()
+            manager.swap()
+            swap_ms = (time.perf_counter() - started) * 1000
+            if staged is not cfg or select_custom_tickers() != ['SPY', 'QQQ'] or current().version != 2:
+                print(f"❌ Live config test failed - swap: staged {staged}, now {current()}")
+                return False
+            
+            # An invalid edit is ignored and the running config kept
+            time.sleep(0.02)
+            write({'POSITION_SIZING': {'min_position_value': 9000, 'max_position_value': 100}})
+            deadline = time.time() + 5
+            while manager.last_error is None and time.time() < deadline:
+                time.sleep(0.005)
+            manager.swap()
+            if manager.last_error is None or select_custom_tickers() != ['SPY', 'QQQ']:
+                print(f"❌ Live config test failed - invalid edit applied: {current()}")
+                return False
+        finally:
+            manager.stop()
+        print(f"✅ Live config test passed - reload validated off-cycle, swapped in {swap_ms:.3f}ms, "
+              f"invalid edit rejected ({manager.last_error[:40]}...)")
+        return True
+    except Exception as e:
+        print(f"❌ Live config test error: {e}")
+        return False
+    finally:
+        live_config.activate(live_config.validate({}, source='config.py'))
+
+def test_position_sizing():
+    """Test batch position sizing: matches the scalar sizer, shares one funds pool, sizes 1,000 names at once"""
+    import live_config
+    try:
+        import time
+        import numpy as np
+        from strategy import calculate_position_size, size_positions
+        
+        rng = np.random.default_rng(7)
+        prices = rng.uniform(5, 600, 1000)
+        regimes = rng.choice(['normal', 'high_volatility', 'low_volatility'], 1000)
+        for sizing in ({'method': 'adaptive'}, {'method': 'equal'}, {'method': 'custom'}):
+            live_config.activate(live_config.validate({'POSITION_SIZING': sizing,
+                                                       'CUSTOM_POSITION_SIZES': {'AAPL': 4000}}))
+            for ticker, price, regime in [('AAPL', 190.0, 'normal'), ('MSFT', 410.0, 'high_volatility'),
+                                          ('NVDA', 7.5, 'low_volatility')]:
+                shares, invested = size_positions([ticker], [price], 25000, regime)
+                if (int(shares[0]), float(invested[0])) != calculate_position_size(ticker, price, 25000, regime):
+                    print(f"❌ Position sizing test failed - {sizing['method']} {ticker} differs from scalar sizer")
+                    return False
+        
+        # The pool is shared: earlier candidates are funded first, the total never exceeds it
+        live_config.activate(live_config.validate({'POSITION_SIZING': {'method': 'equal', 'max_positions': 4}}))
+        shares, invested = size_positions(['A', 'B', 'C', 'D', 'E'], [10.0, 0.0, 10.0, 10.0, 10.0], 10000,
+                                          targets=[4000, 4000, 4000, 4000, 4000])
+        if shares.tolist() != [400, 0, 400, 200, 0] or invested.sum() > 10000:
+            print(f"❌ Position sizing test failed - pool not shared: {shares.tolist()}")
+            return False
+        
+        live_config.activate(live_config.validate({}))
+        tickers = [f"T{i:04d}" for i in range(1000)]
+        started = time.perf_counter()
+        shares, invested = size_positions(tickers, prices, 1_000_000, regimes, confidences=rng.uniform(0, 1, 1000))
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        if invested.sum() > 1_000_000 or (invested > 0).sum() == 0 or (shares < 0).any():
+            print("❌ Position sizing test failed - 1,000-name book out of bounds")
+            return False
+        print(f"✅ Position sizing test passed - 1,000 names sized in {elapsed_ms:.2f}ms, "
+              f"${invested.sum():,.0f} of $1,000,000 allocated across {(shares > 0).sum()} names")
+        return True
+    except Exception as e:
+        print(f"❌ Position sizing test error: {e}")
+        return False
+    finally:
+        live_config.activate(live_config.validate({}, source='config.py'))
+
+def test_allocation():
+    """Test allocation solvers: risk budgets met, caps and KKT conditions hold, hundreds of names in milliseconds"""
+    try:
+        import time
+        import numpy as np
+        from allocation import allocate, allocation_budgets, covariance, fractional_kelly, mean_variance, risk_parity
+        from config import ALLOCATION
+        from live_config import ConfigError, validate
+        from strategy import plan_entry_exit
+        
+        # 300 names with a common factor over 80 sessions of cached closes, some history missing
+        rng = np.random.default_rng(11)
+        n = 300
+        returns = 0.01 * rng.standard_normal((80, 1)) + rng.uniform(0.01, 0.03, n) * rng.standard_normal((80, n))
+        closes = 100 * np.cumprod(1 + returns, axis=0)
+        closes[:75, :5] = np.nan
+        cov = covariance(closes)
+        if not np.allclose(cov, cov.T) or np.linalg.eigvalsh(cov).min() <= 0 or cov[0, 1] != 0:
+            print("❌ Allocation test failed - covariance not symmetric positive definite")
+            return False
+        scores = rng.uniform(0.1, 0.9, n)
+        
+        timings = {}
+        started = time.perf_counter()
+        weights = risk_parity(cov, scores)
+        timings['risk_parity'] = (time.perf_counter() - started) * 1000
+        contributions = weights * (cov @ weights)
+        if abs(weights.sum() - 1) > 1e-9 or np.abs(contributions / contributions.sum() - scores / scores.sum()).max() > 1e-6:
+            print("❌ Allocation test failed - risk contributions not proportional to the budgets")
+            return False
+        
+        mu = 0.05 * np.sqrt(np.diag(cov)) * scores
+        started = time.perf_counter()
+        weights = mean_variance(mu, cov, risk_aversion=5.0, max_weight=0.02)
+        timings['mean_variance'] = (time.perf_counter() - started) * 1000
+        free = (weights > 1e-12) & (weights < 0.02 - 1e-12)
+        if (weights < 0).any() or (weights > 0.02 + 1e-12).any() or weights.sum() > 1 + 1e-9:
+            print("❌ Allocation test failed - mean-variance weights out of bounds")
+            return False
+        if weights.sum() < 1 - 1e-9 and not np.allclose((cov @ weights)[free], mu[free] / 5.0):
+            print("❌ Allocation test failed - mean-variance free names not optimal")
+            return False
+        started = time.perf_counter()
+        kelly = fractional_kelly(mu, cov, fraction=0.2, max_weight=0.02)
+        timings['kelly'] = (time.perf_counter() - started) * 1000
+        if not np.allclose(kelly, weights):
+            print("❌ Allocation test failed - fractional Kelly differs from mean-variance at risk aversion 1/f")
+            return False
+        small = mean_variance(mu[:3] * 0.01, cov[:3, :3], 5.0)
+        if not np.allclose(small, np.linalg.solve(cov[:3, :3], mu[:3] * 0.01) / 5.0):
+            print("❌ Allocation test failed - unconstrained mean-variance is not the closed form")
+            return False
+        
+        capped = allocate(scores, cov, 'risk_parity', {'max_weight': 0.004})
+        if capped.max() > 0.004 + 1e-12 or abs(capped.sum() - 1) > 1e-9:
+            print("❌ Allocation test failed - risk parity cap not applied")
+            return False
+        few = allocate(scores[:3], cov[:3, :3], 'risk_parity', {'max_weight': 0.25})
+        if few.max() > 0.25 + 1e-12 or abs(few.sum() - 0.75) > 1e-9:
+            print(f"❌ Allocation test failed - risk parity over 3 names exceeded max_weight: {few}")
+            return False
+        # A halted ticker (constant closes) gets the median variance; the solvers stay finite
+        halted = closes[-61:, :4].copy()
+        halted[:, 1] = 50.0
+        halted_cov = covariance(halted)
+        for method in ('risk_parity', 'mean_variance', 'kelly'):
+            halted_weights = allocate(scores[:4], halted_cov, method, {'max_weight': 1.0})
+            if halted_cov[1, 1] <= 0 or not np.isfinite(halted_weights).all():
+                print(f"❌ Allocation test failed - {method} with a constant-close name: {halted_weights}")
+                return False
+        if ALLOCATION['method'] != 'fixed' or allocation_budgets(scores, 25000, closes, settings={'method': 'fixed'}) is not None:
+            print("❌ Allocation test failed - 'fixed' sizing is not the default or returned budgets")
+            return False
+        try:
+            validate({'ALLOCATION': {'method': 'optimal', 'max_weight': 2}})
+            print("❌ Allocation test failed - invalid ALLOCATION accepted")
+            return False
+        except ConfigError:
+            pass
+        
+        day = {'open': 100.0, 'high': 110.0, 'low': 99.0, 'close': 108.0, 'volume': 2000000}
+        if plan_entry_exit(day, 25000, 5, budget=1234).shares != 12:
+            print("❌ Allocation test failed - plan_entry_exit ignored the budget")
+            return False
+        print("✅ Allocation test passed - 300 names: " + ", ".join(f"{m} {ms:.1f}ms" for m, ms in timings.items()))
+        return True
+    except Exception as e:
+        print(f"❌ Allocation test error: {e}")
+        return False
+
 def main():
     """Run all tests"""
     print("🧪 TradeBot System Test")
@@ -92,7 +1554,32 @@ def main():
         ("Config", test_config),
         ("Data", test_data),
         ("Strategy", test_strategy),
-        ("Main Demo", test_main_demo)
+        ("Main Demo", test_main_demo),
+        ("Startup Import Time", test_startup_import_time),
+        ("Trade Journal", test_trade_journal),
+        ("Order Manager", test_order_manager),
+        ("Mock Broker", test_mock_broker),
+        ("Synthetic Data", test_synthetic_data),
+        ("Risk Engine", test_risk_engine),
+        ("Symbol Index", test_symbol_index),
+        ("Result Cache", test_result_cache),
+        ("Backtest Append", test_backtest_append),
+        ("Results Store", test_results_store),
+        ("Streaming Backtest", test_streaming_backtest),
+        ("Trade Plan", test_trade_plan),
+        ("Trading Calendar", test_trading_calendar),
+        ("Multi Backtest", test_multi_backtest),
+        ("Cost Model", test_cost_model),
+        ("Quote Stream", test_quote_stream),
+        ("Quote Cache", test_quote_cache),
+        ("Token Manager", test_token_manager),
+        ("Rate Limiter", test_rate_limiter),
+        ("Session Pipeline", test_session_pipeline),
+        ("Warm State", test_warm_state),
+        ("Shared Market", test_shared_market),
+        ("Live Config", test_live_config),
+        ("Position Sizing", test_position_sizing),
+        ("Allocation", test_allocation)
     ]
     
     passed = 0
@@ -0,0 +1,203 @@
+# OAuth token lifecycle for FidelityAPI
+#
+# Keeps the access token, refresh token and expiry together, persists them to a
+# file only the current user can read (0600 in a 0700 directory, written
+# atomically), and refreshes in a background thread `refresh_margin` seconds
+# (at most half the token lifetime) before expiry, so neither a restart nor a
+# long session puts an auth round trip on the request path. A request that still gets a 401 calls refresh()
+# with the token it used; concurrent callers share one refresh (refresh tokens
+# are single use). A refresh token the server rejects with invalid_grant
+# (revoked or expired) is dropped: nothing retries it, `revoked` is set and
+# last_error says why, and only a new authorization code gets going again.
+
+import json
+import os
+import threading
+import time
+
+DEFAULT_TOKEN_FILE = os.path.join(os.path.expanduser('~'), '.tradebot', 'fidelity_token.json')
+
+
+def _error_code(response):
+    try:
+        return response.json().get('error')
+    except (ValueError, AttributeError):
+        return None
+
+
+class TokenManager:
+    """
+    Token state for one OAuth token endpoint. `post(url, data)` sends a form
+    POST and returns a requests-style response. With path=None nothing is
+    persisted.
+    """
+
+    def __init__(self, token_url, post, path=None, client_id=None, client_secret=None, refresh_margin=300,
+                 retry_delay=5.0, clock=time.time):
+        self.token_url = token_url
+        self.post = post
+        self.path = path
+        self.client_id = client_id
+        self.client_secret = client_secret
+        self.refresh_margin = refresh_margin
+        self.retry_delay = retry_delay
+        self.clock = clock
+        self.access_token = None
+        self.refresh_token = None
+        self.expires_at = None  # epoch seconds; None when unknown
+        self.lifetime = None    # expires_in of the last grant
+        self.refreshes = 0
+        self.revoked = False  # the server rejected the refresh token (invalid_grant)
+        self.last_error = None
+        self._lock = threading.Lock()
+        self._changed = threading.Event()
+        self._stop = threading.Event()
+        self._thread = None
+
+    # --- State ---
+
+    def _set(self, payload):
+        self.access_token = payload['access_token']
+        self.refresh_token = payload.get('refresh_token', self.refresh_token)
+        expires_in = payload.get('expires_in')
+        self.lifetime = float(expires_in) if expires_in else None
+        self.expires_at = self.clock() + self.lifetime if expires_in else None
+        self.save()
+        self._changed.set()
+
+    def set_access_token(self, token):
+        """Use a bare access token (no refresh token or expiry)"""
+        with self._lock:
+            self.access_token = token
+            self.refresh_token = None
+            self.expires_at = self.lifetime = None
+            self._changed.set()
+
+    def expired(self, margin=0):
+        return self.expires_at is not None and self.clock() >= self.expires_at - margin
+
+    @property
+    def margin(self):
+        """How long before expiry the background refresh runs"""
+        return min(self.refresh_margin, self.lifetime / 2) if self.lifetime else self.refresh_margin
+
+    @property
+    def usable(self):
+        """A valid access token, or a refresh token to get one"""
+        return bool(self.access_token and not self.expired()) or bool(self.refresh_token)
+
+    def save(self):
+        if not self.path:
+            return
+        directory = os.path.dirname(os.path.abspath(self.path))
+        os.makedirs(directory, mode=0o700, exist_ok=True)
+        state = {'token_url': self.token_url, 'access_token': self.access_token,
+                 'refresh_token': self.refresh_token, 'expires_at': self.expires_at, 'lifetime': self.lifetime}
+        tmp = f"{self.path}.{os.getpid()}.tmp"
+        fd = os.open(tmp, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+        with os.fdopen(fd, 'w') as f:
+            json.dump(state, f)
+        os.replace(tmp, self.path)
+
+    def load(self):
+        """Read persisted tokens for this endpoint; returns whether they are usable"""
+        if not self.path:
+            return False
+        try:
+            with open(self.path) as f:
+                state = json.load(f)
+        except (OSError, ValueError):
+            return False
+        if state.get('token_url') != self.token_url:
+            return False
+        with self._lock:
+            self.access_token = state.get('access_token')
+            self.refresh_token = state.get('refresh_token')
+            self.expires_at = state.get('expires_at')
+            self.lifetime = state.get('lifetime')
+            self._changed.set()
+        return self.usable
+
+    def clear(self):
+        with self._lock:
+            self.access_token = self.refresh_token = self.expires_at = self.lifetime = None
+            if self.path and os.path.exists(self.path):
+                os.remove(self.path)
+
+    # --- Grants ---
+
+    def _grant(self, data):
+        data = dict(data, client_id=self.client_id, client_secret=self.client_secret)
+        response = self.post(self.token_url, data)
+        if response.status_code != 200:
+            self.last_error = response.text
+            if data['grant_type'] == 'refresh_token' and _error_code(response) == 'invalid_grant':
+                # Retrying cannot help: drop the token so the background thread stops
+                self.revoked = True
+                self.refresh_token = None
+                self.save()
+                print(f"[TokenManager] Refresh token rejected, re-authorization needed: {response.text}")
+            return False
+        self.revoked = False
+        self._set(response.json())
+        return True
+
+    def exchange_code(self, code, redirect_uri):
+        """authorization_code grant; returns whether tokens were issued"""
+        with self._lock:
+            return self._grant({'grant_type': 'authorization_code', 'code': code, 'redirect_uri': redirect_uri})
+
+    def refresh(self, failed_token=None):
+        """
+        refresh_token grant. When failed_token is given and the current access
+        token is already a different one, another caller has refreshed and
+        nothing is sent. Returns whether a usable access token is held.
+        """
+        with self._lock:
+            if failed_token is not None and self.access_token != failed_token and not self.expired():
+                return self.access_token is not None
+            if not self.refresh_token:
+                return False
+            try:
+                ok = self._grant({'grant_type': 'refresh_token', 'refresh_token': self.refresh_token})
+            except OSError as e:
+                self.last_error = str(e)
+                ok = False
+            self.refreshes += ok
+            return ok
+
+    def token(self):
+        """Current access token, refreshing first only if it has already expired"""
+        if self.expired() and self.refresh_token:
+            self.refresh(self.access_token)
+        return self.access_token
+
+    # --- Background refresh ---
+
+    def _run(self):
+        while not self._stop.is_set():
+            self._changed.clear()
+            if self.expires_at is None or not self.refresh_token:
+                self._changed.wait()
+                continue
+            wait = self.expires_at - self.margin - self.clock()
+            if wait > 0 and self._changed.wait(wait):
+                continue
+            if self._stop.is_set():
+                break
+            if not self.refresh() and self._stop.wait(self.retry_delay):
+                break
+
+    def start(self):
+        """Refresh in the background ahead of expiry (idempotent)"""
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name='TokenRefresh', daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        self._changed.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
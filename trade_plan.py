@@ -0,0 +1,216 @@
+# Compact trade-plan records
+#
+# Technical signals are small integer codes (Signal) instead of strings, with
+# buy/sell direction looked up from a table rather than by substring search,
+# and trade plans are __slots__ records instead of dicts with two nested dicts
+# (the Fibonacci levels are rebuilt from the day's high/low on demand). Both
+# keep to_dict() returning exactly the legacy dict, so CSVs, caches and the
+# dict-based callers see no difference. plans_to_array() packs a batch into a
+# structured NumPy array (~130 bytes per trade) for very large runs.
+
+from enum import IntEnum
+
+
+class Signal(IntEnum):
+    """Technical signal codes; the lower-cased name is the legacy string"""
+    NEUTRAL = 0
+    OVERSOLD_BUY = 1
+    OVERBOUGHT_SELL = 2
+    BELOW_MEAN = 3
+    ABOVE_MEAN = 4
+    BULLISH = 5
+    BEARISH = 6
+    STRONG_BULLISH = 7
+    STRONG_BEARISH = 8
+    STRONG_SUPPORT = 9
+    SUPPORT = 10
+    RESISTANCE = 11
+    BUY = 12
+    SELL = 13
+    STRONG_BUY = 14
+    STRONG_SELL = 15
+
+
+SIGNAL_NAMES = tuple(s.name.lower() for s in Signal)
+SIGNAL_CODES = {name: Signal(code) for code, name in enumerate(SIGNAL_NAMES)}
+# Which codes count towards the buy / sell tally of the overall signal
+IS_BUY = tuple(('buy' in n or 'bullish' in n or 'support' in n) for n in SIGNAL_NAMES)
+IS_SELL = tuple(('sell' in n or 'bearish' in n or 'resistance' in n) for n in SIGNAL_NAMES)
+
+EXIT_TYPES = ('close', 'trailing_stop', 'stop_loss', 'fibonacci_profit', 'technical_exit', 'skip_low_reward')
+REGIMES = ('low_volatility', 'normal', 'high_volatility')
+
+FIB_RATIOS = (('fib_236', 0.236), ('fib_382', 0.382), ('fib_500', 0.500), ('fib_618', 0.618), ('fib_786', 0.786))
+
+
+class TechnicalAnalysis:
+    """Signal codes per indicator plus the combined signal and its confidence"""
+
+    __slots__ = ('price_action', 'bollinger', 'fibonacci', 'rsi', 'macd', 'stochastic', 'overall', 'confidence')
+
+    def __init__(self, price_action=Signal.NEUTRAL, bollinger=Signal.NEUTRAL, fibonacci=Signal.NEUTRAL,
+                 rsi=Signal.NEUTRAL, macd=Signal.NEUTRAL, stochastic=Signal.NEUTRAL,
+                 overall=Signal.NEUTRAL, confidence=0.5):
+        self.price_action = price_action
+        self.bollinger = bollinger
+        self.fibonacci = fibonacci
+        self.rsi = rsi
+        self.macd = macd
+        self.stochastic = stochastic
+        self.overall = overall
+        self.confidence = confidence
+
+    def to_dict(self):
+        return {
+            'price_action': SIGNAL_NAMES[self.price_action],
+            'bollinger_signal': SIGNAL_NAMES[self.bollinger],
+            'fibonacci_signal': SIGNAL_NAMES[self.fibonacci],
+            'rsi_signal': SIGNAL_NAMES[self.rsi],
+            'macd_signal': SIGNAL_NAMES[self.macd],
+            'stochastic_signal': SIGNAL_NAMES[self.stochastic],
+            'overall_signal': SIGNAL_NAMES[self.overall],
+            'confidence': self.confidence,
+        }
+
+    @classmethod
+    def from_dict(cls, d):
+        return cls(SIGNAL_CODES[d['price_action']], SIGNAL_CODES[d['bollinger_signal']],
+                   SIGNAL_CODES[d['fibonacci_signal']], SIGNAL_CODES[d['rsi_signal']],
+                   SIGNAL_CODES[d['macd_signal']], SIGNAL_CODES[d['stochastic_signal']],
+                   SIGNAL_CODES[d['overall_signal']], d['confidence'])
+
+
+def fibonacci_levels(high, low):
+    """Same values (and key order) as strategy.calculate_fibonacci_levels"""
+    diff = high - low
+    levels = {'fib_0': high}
+    for key, ratio in FIB_RATIOS:
+        levels[key] = high - (ratio * diff)
+    levels['fib_100'] = low
+    return levels
+
+
+class TradePlan:
+    """
+    One ticker-day plan from strategy.plan_entry_exit(). A skipped plan
+    (exit_type 'skip_low_reward') only carries entry and technical.
+    date and ticker are filled in by the backtest.
+    """
+
+    __slots__ = ('entry', 'exit', 'exit_type', 'stop_loss', 'shares', 'invested', 'expected_profit',
+                 'market_regime', 'technical', 'high', 'low', 'date', 'ticker', 'costs')
+
+    def __init__(self, entry, exit, exit_type, stop_loss=None, shares=0, invested=0, expected_profit=0,
+                 market_regime=None, technical=None, high=None, low=None, date=None, ticker=None, costs=None):
+        self.entry = entry
+        self.exit = exit
+        self.exit_type = exit_type
+        self.stop_loss = stop_loss
+        self.shares = shares
+        self.invested = invested
+        self.expected_profit = expected_profit
+        self.market_regime = market_regime
+        self.technical = technical
+        self.high = high
+        self.low = low
+        self.date = date
+        self.ticker = ticker
+        self.costs = costs
+
+    @property
+    def skipped(self):
+        return self.exit_type == 'skip_low_reward'
+
+    @property
+    def confidence(self):
+        return self.technical.confidence
+
+    @property
+    def net_profit(self):
+        """expected_profit less transaction costs (cost_model.CostModel), when costed"""
+        if self.costs is None or self.expected_profit is None:
+            return self.expected_profit
+        return round(self.expected_profit - self.costs, 2)
+
+    @property
+    def fibonacci_levels(self):
+        return fibonacci_levels(self.high, self.low)
+
+    def to_dict(self):
+        """The dict decide_entry_exit_adaptive() has always returned (plus costs/net_profit, date/ticker when set)"""
+        if self.skipped:
+            d = {'entry': self.entry, 'exit': None, 'exit_type': self.exit_type,
+                 'technical_analysis': self.technical.to_dict()}
+        else:
+            d = {
+                'entry': self.entry,
+                'exit': self.exit,
+                'exit_type': self.exit_type,
+                'stop_loss': self.stop_loss,
+                'shares': self.shares,
+                'invested': self.invested,
+                'expected_profit': self.expected_profit,
+                'market_regime': self.market_regime,
+                'technical_analysis': self.technical.to_dict(),
+                'fibonacci_levels': fibonacci_levels(self.high, self.low),
+                'confidence': self.technical.confidence,
+            }
+            if self.costs is not None:
+                d['costs'] = self.costs
+                d['net_profit'] = self.net_profit
+        if self.date is not None:
+            d['date'] = self.date
+        if self.ticker is not None:
+            d['ticker'] = self.ticker
+        return d
+
+    @classmethod
+    def from_dict(cls, d):
+        """Inverse of to_dict() (e.g. for result-cache entries)"""
+        technical = TechnicalAnalysis.from_dict(d['technical_analysis'])
+        if d.get('exit_type') == 'skip_low_reward':
+            return cls(d['entry'], None, d['exit_type'], technical=technical, shares=None, invested=None,
+                       expected_profit=None, date=d.get('date'), ticker=d.get('ticker'))
+        fib = d['fibonacci_levels']
+        return cls(d['entry'], d['exit'], d['exit_type'], d['stop_loss'], d['shares'], d['invested'],
+                   d['expected_profit'], d['market_regime'], technical, fib['fib_0'], fib['fib_100'],
+                   d.get('date'), d.get('ticker'), d.get('costs'))
+
+
+def as_dict(trade):
+    """Legacy dict for a TradePlan; dicts pass through unchanged"""
+    return trade.to_dict() if isinstance(trade, TradePlan) else trade
+
+
+def plan_dtype():
+    """Structured dtype used by plans_to_array()"""
+    import numpy as np
+    return np.dtype([
+        ('date', 'datetime64[D]'), ('ticker', 'U12'), ('entry', 'f8'), ('exit', 'f8'), ('exit_type', 'u1'),
+        ('stop_loss', 'f8'), ('shares', 'i8'), ('invested', 'f8'), ('expected_profit', 'f8'),
+        ('market_regime', 'u1'), ('signals', 'u1', (7,)), ('confidence', 'f4'), ('high', 'f8'), ('low', 'f8'),
+        ('costs', 'f8'),
+    ])
+
+
+def plans_to_array(plans, out=None):
+    """
+    Pack TradePlans into a structured array (codes index EXIT_TYPES, REGIMES
+    and SIGNAL_NAMES; missing numbers are NaN / 0). Fills `out` if given.
+    """
+    import numpy as np
+    nan = float('nan')
+    rows = [(
+        p.date or 'NaT', p.ticker or '', nan if p.entry is None else p.entry, nan if p.exit is None else p.exit,
+        EXIT_TYPES.index(p.exit_type), nan if p.stop_loss is None else p.stop_loss, p.shares or 0,
+        p.invested or 0, p.expected_profit or 0,
+        REGIMES.index(p.market_regime) if p.market_regime in REGIMES else 255,
+        (p.technical.price_action, p.technical.bollinger, p.technical.fibonacci, p.technical.rsi,
+         p.technical.macd, p.technical.stochastic, p.technical.overall),
+        p.technical.confidence, nan if p.high is None else p.high, nan if p.low is None else p.low,
+        p.costs or 0,
+    ) for p in plans]
+    if out is None:
+        return np.array(rows, dtype=plan_dtype())
+    out[:len(rows)] = np.array(rows, dtype=out.dtype)
+    return out
@@ -0,0 +1,179 @@
+# Destinations for streamed backtest trades
+#
+# run_backtest(sink=...) hands trades to a sink in chunks as days are replayed
+# instead of keeping every trade plan in memory. A sink has two methods:
+#   write(trades)  receive a chunk (list of trade_plan.TradePlan records)
+#   close()        finish up and return the run's result
+# so peak memory is bounded by the chunk size, not the length of the run.
+# Every sink also takes the legacy trade dicts: sinks that need dicts convert
+# with as_dict() (dicts pass through), ArraySink converts dicts with
+# TradePlan.from_dict() and SummarySink reads either form.
+
+import os
+
+from trade_plan import TradePlan, as_dict
+
+# Column order of backtest results files (trade-plan keys, then date/ticker)
+TRADE_COLUMNS = ('entry', 'exit', 'exit_type', 'stop_loss', 'shares', 'invested', 'expected_profit',
+                 'market_regime', 'technical_analysis', 'fibonacci_levels', 'confidence', 'costs', 'net_profit',
+                 'date', 'ticker')
+
+
+class DataFrameSink:
+    """
+    Collect everything and return one DataFrame (the non-streaming default).
+    Trades are held as compact TradePlans and only expanded at close().
+    """
+
+    def __init__(self):
+        self.trades = []
+
+    def write(self, trades):
+        self.trades.extend(trades)
+
+    def close(self):
+        import pandas as pd
+        return pd.DataFrame([as_dict(t) for t in self.trades])
+
+
+class ArraySink:
+    """
+    Pack trades into one preallocated structured NumPy array
+    (trade_plan.plans_to_array layout), growing it by doubling. close()
+    returns the filled part.
+    """
+
+    def __init__(self, capacity=100000):
+        from trade_plan import plan_dtype
+        import numpy as np
+        self.array = np.zeros(capacity, dtype=plan_dtype())
+        self.size = 0
+
+    def write(self, trades):
+        import numpy as np
+        from trade_plan import plans_to_array
+        needed = self.size + len(trades)
+        if needed > len(self.array):
+            grown = np.zeros(max(needed, 2 * len(self.array)), dtype=self.array.dtype)
+            grown[:self.size] = self.array[:self.size]
+            self.array = grown
+        plans_to_array([t if isinstance(t, TradePlan) else TradePlan.from_dict(t) for t in trades],
+                       self.array[self.size:needed])
+        self.size = needed
+
+    def close(self):
+        return self.array[:self.size]
+
+
+class CsvSink:
+    """
+    Write chunks to a results CSV as they arrive. With append=True rows are
+    added to an existing file using its header; keys outside the header are
+    dropped. close() returns the number of rows written.
+    """
+
+    def __init__(self, path, append=False):
+        self.path = path
+        self.rows = 0
+        self.columns = None
+        self._file = None
+        self._append = append and os.path.exists(path) and os.path.getsize(path) > 0
+
+    def write(self, trades):
+        import pandas as pd
+        if not trades:
+            return
+        trades = [as_dict(t) for t in trades]
+        if self._file is None:
+            header = not self._append
+            if self._append:
+                self.columns = pd.read_csv(self.path, nrows=0).columns.tolist()
+            else:
+                seen = dict.fromkeys(key for trade in trades for key in trade)
+                self.columns = list(TRADE_COLUMNS) + [c for c in seen if c not in TRADE_COLUMNS]
+            self._file = open(self.path, 'a' if self._append else 'w', newline='')
+            if header:
+                pd.DataFrame(columns=self.columns).to_csv(self._file, index=False)
+        pd.DataFrame(trades, columns=self.columns).to_csv(self._file, header=False, index=False)
+        self.rows += len(trades)
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+        elif not self._append:
+            open(self.path, 'w').close()
+        return self.rows
+
+
+class StoreSink:
+    """Stream a run into a results_store.ResultsStore; close() returns the run_id"""
+
+    def __init__(self, store, name):
+        self.store = store
+        self.run_id = store.begin_run(name)
+
+    def write(self, trades):
+        if trades:
+            self.store.append_trades(self.run_id, [as_dict(t) for t in trades])
+
+    def close(self):
+        self.store.finish_run(self.run_id)
+        return self.run_id
+
+
+class SummarySink:
+    """
+    Running aggregates without keeping any trades: counts and expected profit
+    in total, per exit type and per day, plus transaction costs and net profit
+    in total. close() returns them as a dict.
+    """
+
+    def __init__(self):
+        self.trades = 0
+        self.profitable = 0
+        self.total_profit = 0.0
+        self.total_costs = 0.0
+        self.by_exit_type = {}
+        self.daily_profit = {}
+
+    def write(self, trades):
+        for trade in trades:
+            if isinstance(trade, TradePlan):
+                profit, costs, exit_type, date = trade.expected_profit, trade.costs, trade.exit_type, trade.date
+            else:
+                profit, costs, exit_type, date = (trade.get('expected_profit'), trade.get('costs'),
+                                                  trade.get('exit_type'), trade.get('date'))
+            profit = profit or 0.0
+            self.trades += 1
+            self.profitable += profit > 0
+            self.total_profit += profit
+            self.total_costs += costs or 0.0
+            count, total = self.by_exit_type.get(exit_type, (0, 0.0))
+            self.by_exit_type[exit_type] = (count + 1, total + profit)
+            self.daily_profit[date] = self.daily_profit.get(date, 0.0) + profit
+
+    def close(self):
+        return {
+            'trades': self.trades,
+            'profitable': self.profitable,
+            'total_profit': round(self.total_profit, 2),
+            'total_costs': round(self.total_costs, 2),
+            'net_profit': round(self.total_profit - self.total_costs, 2),
+            'by_exit_type': self.by_exit_type,
+            'daily_profit': self.daily_profit,
+        }
+
+
+class TeeSink:
+    """Send every chunk to several sinks; close() returns their results as a list"""
+
+    def __init__(self, *sinks):
+        self.sinks = sinks
+
+    def write(self, trades):
+        for sink in self.sinks:
+            sink.write(trades)
+
+    def close(self):
+        return [sink.close() for sink in self.sinks]
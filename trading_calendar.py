@@ -0,0 +1,143 @@
+# NYSE trading calendar, computed locally
+#
+# Regular holidays follow the exchange rules (weekend holidays are observed on
+# the Friday before / Monday after, except that a Saturday New Year's Day is
+# not observed), plus the one-off closures since 2001. Early closes (1 pm ET)
+# are the day before Independence Day, the day after Thanksgiving and
+# Christmas Eve. sessions() gives the ordered session index the backtest
+# aligns its data to, so "previous session" is simply index - 1.
+
+from datetime import date, timedelta
+from functools import lru_cache
+
+from config import MARKET_CLOSE, MARKET_OPEN
+
+EARLY_CLOSE = '13:00'
+
+# Unscheduled full-day closures (national mourning, weather, 9/11)
+SPECIAL_CLOSURES = {
+    date(2001, 9, 11), date(2001, 9, 12), date(2001, 9, 13), date(2001, 9, 14),
+    date(2004, 6, 11), date(2007, 1, 2), date(2012, 10, 29), date(2012, 10, 30),
+    date(2018, 12, 5), date(2025, 1, 9),
+}
+
+MON, TUE, THU, FRI, SAT, SUN = 0, 1, 3, 4, 5, 6
+
+
+def _nth_weekday(year, month, weekday, n):
+    """n-th (1-based) given weekday of a month; n=-1 for the last one"""
+    if n > 0:
+        first = date(year, month, 1)
+        return first + timedelta(days=(weekday - first.weekday()) % 7 + 7 * (n - 1))
+    last = date(year, month + 1, 1) - timedelta(days=1) if month < 12 else date(year, 12, 31)
+    return last - timedelta(days=(last.weekday() - weekday) % 7)
+
+
+def _easter(year):
+    """Gregorian Easter Sunday (anonymous Gregorian algorithm)"""
+    a, b, c = year % 19, year // 100, year % 100
+    d, e = divmod(b, 4)
+    g = (8 * b + 13) // 25
+    h = (19 * a + b - d - g + 15) % 30
+    i, k = divmod(c, 4)
+    l = (32 + 2 * e + 2 * i - h - k) % 7
+    m = (a + 11 * h + 19 * l) // 433
+    month = (h + l - 7 * m + 90) // 25
+    return date(year, month, (h + l - 7 * m + 33 * month + 19) % 32)
+
+
+def _observed(day):
+    if day.weekday() == SAT:
+        return day - timedelta(days=1)
+    if day.weekday() == SUN:
+        return day + timedelta(days=1)
+    return day
+
+
+@lru_cache(maxsize=None)
+def holidays(year):
+    """Full-day market closures (weekdays) in a year"""
+    days = set()
+    new_year = date(year, 1, 1)
+    if new_year.weekday() != SAT:  # a Saturday New Year's is not moved to Friday
+        days.add(_observed(new_year))
+    if year >= 1998:
+        days.add(_nth_weekday(year, 1, MON, 3))  # Martin Luther King Jr. Day
+    days.add(_nth_weekday(year, 2, MON, 3))  # Washington's Birthday
+    days.add(_easter(year) - timedelta(days=2))  # Good Friday
+    days.add(_nth_weekday(year, 5, MON, -1))  # Memorial Day
+    if year >= 2022:
+        days.add(_observed(date(year, 6, 19)))  # Juneteenth
+    days.add(_observed(date(year, 7, 4)))
+    days.add(_nth_weekday(year, 9, MON, 1))  # Labor Day
+    days.add(_nth_weekday(year, 11, THU, 4))  # Thanksgiving
+    days.add(_observed(date(year, 12, 25)))
+    days.update(d for d in SPECIAL_CLOSURES if d.year == year)
+    return frozenset(d for d in days if d.weekday() < SAT)
+
+
+@lru_cache(maxsize=None)
+def early_closes(year):
+    """Sessions that close at EARLY_CLOSE instead of MARKET_CLOSE"""
+    closed = holidays(year)
+    days = set()
+    if TUE <= date(year, 7, 4).weekday() <= FRI:
+        days.add(date(year, 7, 3))
+    days.add(_nth_weekday(year, 11, THU, 4) + timedelta(days=1))
+    christmas_eve = date(year, 12, 24)
+    if christmas_eve.weekday() < SAT:
+        days.add(christmas_eve)
+    return frozenset(d for d in days if d not in closed)
+
+
+def _as_date(day):
+    if isinstance(day, str):
+        return date.fromisoformat(day[:10])
+    return day.date() if hasattr(day, 'date') and callable(day.date) else day
+
+
+def is_session(day):
+    day = _as_date(day)
+    return day.weekday() < SAT and day not in holidays(day.year)
+
+
+def session_hours(day):
+    """(open, close) 'HH:MM' times for a session, or None on a closed day"""
+    day = _as_date(day)
+    if not is_session(day):
+        return None
+    return MARKET_OPEN, EARLY_CLOSE if day in early_closes(day.year) else MARKET_CLOSE
+
+
+def next_session(day):
+    """First session strictly after `day`"""
+    day = _as_date(day) + timedelta(days=1)
+    while not is_session(day):
+        day += timedelta(days=1)
+    return day
+
+
+def previous_session(day):
+    """Last session strictly before `day`"""
+    day = _as_date(day) - timedelta(days=1)
+    while not is_session(day):
+        day -= timedelta(days=1)
+    return day
+
+
+def sessions(start, end):
+    """Trading sessions from start to end (inclusive) as a pandas DatetimeIndex"""
+    import pandas as pd
+    days = pd.bdate_range(start, end)
+    closed = [d for year in range(days[0].year, days[-1].year + 1) for d in holidays(year)] if len(days) else []
+    return days[~days.isin(pd.DatetimeIndex(closed))] if closed else days
+
+
+def sessions_from(start, count):
+    """The first `count` sessions on or after start, as a pandas DatetimeIndex"""
+    import pandas as pd
+    days = pd.bdate_range(start, periods=count + count // 20 + 15)
+    result = sessions(days[0], days[-1])
+    while len(result) < count:
+        result = result.append(sessions(result[-1] + pd.Timedelta(days=1), result[-1] + pd.Timedelta(days=60)))
+    return result[:count]
@@ -1,26 +1,19 @@
 import pandas as pd
 import matplotlib.pyplot as plt
 import os
+from journal import read_journal
 
 def load_trades(log_file):
-    # Parse log file into DataFrame
+    # Replay the trade journal into a DataFrame
     rows = []
-    with open(log_file) as f:
-        for line in f:
-            parts = line.strip().split('|')
-            if len(parts) < 5:
-                continue
-            ts, ticker, entry, exit_, exit_type = [p.strip() for p in parts]
-            entry_val = float(entry.split(':')[1].strip())
-            exit_val = exit_.split(':')[1].strip()
-            exit_val = float(exit_val) if exit_val != 'None' else None
-            rows.append({
-                'timestamp': ts,
-                'ticker': ticker,
-                'entry': entry_val,
-                'exit': exit_val,
-                'exit_type': exit_type.split(':')[1].strip()
-            })
+    for record in read_journal(log_file):
+        rows.append({
+            'timestamp': record['ts'],
+            'ticker': record['ticker'],
+            'entry': record.get('entry'),
+            'exit': record.get('exit'),
+            'exit_type': record.get('exit_type', 'n/a')
+        })
     return pd.DataFrame(rows)
 
 def plot_trades(df):
@@ -43,6 +36,6 @@ def plot_trades(df):
     plt.show()
 
 if __name__ == "__main__":
-    log_file = os.path.join("logs", "trades_20250703.log")
+    log_file = os.path.join("logs", "trades_20250703.jsonl")
     df = load_trades(log_file)
     plot_trades(df)
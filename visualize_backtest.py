@@ -1,5 +1,4 @@
 import pandas as pd
-import matplotlib.pyplot as plt
 import os
 import sys
 
@@ -14,6 +13,7 @@ def preprocess_data(df):
 
 def plot_equity_curve(df, title_prefix="Trading Strategy"):
     """Plot cumulative profit over time."""
+    import matplotlib.pyplot as plt
     plt.figure(figsize=(12, 6))
     plt.plot(df['date'], df['cum_profit'], linewidth=2, color='blue', label='Cumulative Profit')
     plt.xlabel('Date', fontsize=12)
@@ -26,6 +26,7 @@ def plot_equity_curve(df, title_prefix="Trading Strategy"):
 
 def plot_win_loss(df, title_prefix="Trading Strategy"):
     """Plot win/loss distribution."""
+    import matplotlib.pyplot as plt
     profits = df['expected_profit']
     wins = (profits > 0).sum()
     losses = (profits <= 0).sum()
@@ -47,6 +48,7 @@ def plot_win_loss(df, title_prefix="Trading Strategy"):
 
 def plot_monthly_returns(df, title_prefix="Trading Strategy"):
     """Plot monthly profit distribution."""
+    import matplotlib.pyplot as plt
     df['month'] = df['date'].dt.to_period('M')
     monthly = df.groupby('month')['expected_profit'].sum()
     
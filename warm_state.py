@@ -0,0 +1,84 @@
+# Warm-state snapshot files for fast restarts
+#
+# A snapshot is one binary file:
+#   header  magic b'TBSNAP', format version, crc32 of everything after the
+#           header, JSON length (struct '<6sHIQ')
+#   meta    UTF-8 JSON: scalars and records (orders, risk positions, order
+#           templates) plus dtype / shape / offset of every array
+#   arrays  raw C-order arrays, each starting on a 64-byte boundary
+# load_snapshot() memory-maps the file and returns the arrays as read-only
+# views of the mapping, so restoring costs one JSON parse however much price
+# history is stored. Files are written atomically (temp file + rename), so a
+# crash mid-save leaves the previous snapshot in place.
+
+import json
+import mmap
+import os
+import struct
+import zlib
+
+SNAPSHOT_MAGIC = b'TBSNAP'
+SNAPSHOT_VERSION = 1
+_HEADER = struct.Struct('<6sHIQ')
+_ALIGN = 64
+
+
+def _pad(n):
+    return -n % _ALIGN
+
+
+def save_snapshot(path, meta, arrays=None):
+    """Write meta (JSON-serializable dict) and named numpy arrays to path"""
+    import numpy as np
+    arrays = {name: np.ascontiguousarray(a) for name, a in (arrays or {}).items()}
+    layout = {}
+    offset = 0
+    for name, a in arrays.items():
+        layout[name] = {'dtype': a.dtype.str, 'shape': list(a.shape), 'offset': offset}
+        offset += a.nbytes + _pad(a.nbytes)
+    payload = json.dumps({'meta': meta, 'arrays': layout}, separators=(',', ':')).encode('utf-8')
+    body = [payload, b'\0' * _pad(_HEADER.size + len(payload))]
+    for a in arrays.values():
+        body += [a.tobytes(), b'\0' * _pad(a.nbytes)]
+    body = b''.join(body)
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    tmp = f"{path}.{os.getpid()}.tmp"
+    with open(tmp, 'wb') as f:
+        f.write(_HEADER.pack(SNAPSHOT_MAGIC, SNAPSHOT_VERSION, zlib.crc32(body), len(payload)))
+        f.write(body)
+    os.replace(tmp, path)
+
+
+def load_snapshot(path, verify=True):
+    """
+    (meta, {name: array}) from a save_snapshot() file, or None when it is
+    missing, from another format version or (with verify) corrupt. The arrays
+    are read-only views of a memory map of the file.
+    """
+    import numpy as np
+    try:
+        with open(path, 'rb') as f:
+            data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    except (OSError, ValueError):
+        return None
+    if len(data) < _HEADER.size:
+        return None
+    magic, version, crc, meta_len = _HEADER.unpack_from(data)
+    if magic != SNAPSHOT_MAGIC or version != SNAPSHOT_VERSION:
+        return None
+    if verify and zlib.crc32(memoryview(data)[_HEADER.size:]) != crc:
+        return None
+    try:
+        doc = json.loads(data[_HEADER.size:_HEADER.size + meta_len])
+    except ValueError:
+        return None
+    start = _HEADER.size + meta_len
+    start += _pad(start)
+    arrays = {}
+    for name, spec in doc['arrays'].items():
+        dtype = np.dtype(spec['dtype'])
+        count = int(np.prod(spec['shape'], dtype=np.int64))
+        arrays[name] = np.frombuffer(data, dtype, count, start + spec['offset']).reshape(spec['shape'])
+    return doc['meta'], arrays